@@ -0,0 +1,74 @@
+# benchmarks/bench_computo.py
+"""
+Compara la simulación Monte Carlo en el proceso actual ("inline") contra el
+pool de procesos con memoria compartida (`services.computo`) con distinta
+cantidad de procesos, y verifica que todos den el mismo resultado.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_computo --trayectorias 100000 --plazo 360
+    python -m benchmarks.bench_computo --procesos 1 2 4 8
+
+La primera corrida de cada pool incluye el arranque de los procesos
+("spawn"); se reporta la mejor de varias repeticiones con el pool ya
+caliente.
+"""
+
+import argparse
+import os
+import time
+
+from services.computo import EjecutorComputo
+from services import montecarlo
+
+
+def _medir(args, ejecucion: str, repeticiones: int) -> tuple:
+    mejor, resultado = float("inf"), None
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        resultado = montecarlo.simular_credito(
+            monto=args.monto,
+            plazo=args.plazo,
+            tasa=args.tasa,
+            margen=args.margen,
+            trayectorias=args.trayectorias,
+            semilla=42,
+            ejecucion=ejecucion,
+        )
+        mejor = min(mejor, time.perf_counter() - t0)
+    return mejor, resultado
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--trayectorias", type=int, default=100_000)
+    parser.add_argument("--plazo", type=int, default=360)
+    parser.add_argument("--monto", type=float, default=200_000_000)
+    parser.add_argument("--tasa", type=float, default=1.0)
+    parser.add_argument("--margen", type=float, default=2_500_000)
+    parser.add_argument("--procesos", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"Trayectorias: {args.trayectorias}  meses: {args.plazo}")
+    print(f"Núcleos disponibles: {len(os.sched_getaffinity(0))}")
+    print("ejecución | procesos | segundos | aceleración | igual a inline")
+
+    base, referencia = _medir(args, "inline", args.repeticiones)
+    print(f"{'inline':>9} | {'-':>8} | {base:>8.3f} | {1.0:>10.2f}x | {'-':>14}")
+
+    for procesos in args.procesos:
+        ejecutor = EjecutorComputo(procesos=procesos)
+        montecarlo.ejecutor_computo = ejecutor
+        try:
+            _medir(args, "pool", 1)  # arranque del pool
+            segundos, resultado = _medir(args, "pool", args.repeticiones)
+        finally:
+            ejecutor.cerrar()
+        print(
+            f"{'pool':>9} | {procesos:>8} | {segundos:>8.3f} | "
+            f"{base / segundos:>10.2f}x | {str(resultado == referencia):>14}"
+        )
+
+
+if __name__ == "__main__":
+    main()
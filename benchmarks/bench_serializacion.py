@@ -0,0 +1,90 @@
+# benchmarks/bench_serializacion.py
+"""
+Compara el camino actual de los listados (instancias SQLModel validadas con
+`response_model` + encoder JSON estándar) contra el modo ligero
+(tuplas de columnas + orjson).
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_serializacion --filas 10000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from models.historial import Historial
+from services.serializacion import respuesta_ligera
+
+
+def _poblar(engine, filas: int) -> None:
+    inicio = datetime(2024, 1, 1)
+    with Session(engine) as session:
+        session.add_all(
+            Historial(
+                entidad="Crédito",
+                accion="ACTUALIZAR",
+                descripcion=f"Crédito id {i} actualizado. Monto {i * 1000.0}, plazo 12",
+                fecha=inicio + timedelta(seconds=i),
+            )
+            for i in range(filas)
+        )
+        session.commit()
+
+
+def _camino_actual(session: Session) -> bytes:
+    """
+    Reproduce lo que hace FastAPI con `response_model=List[Historial]`.
+    """
+    adaptador = TypeAdapter(List[Historial])
+    registros = session.exec(select(Historial).order_by(Historial.fecha.desc())).all()
+    validados = adaptador.validate_python(registros, from_attributes=True)
+    contenido = jsonable_encoder(adaptador.dump_python(validados, mode="json"))
+    return json.dumps(contenido, ensure_ascii=False).encode("utf-8")
+
+
+def _camino_ligero(session: Session) -> bytes:
+    query = select(Historial).order_by(Historial.fecha.desc())
+    return respuesta_ligera(session, query, Historial).body
+
+
+def _medir(funcion, engine, repeticiones: int) -> float:
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        with Session(engine) as session:
+            t0 = time.perf_counter()
+            funcion(session)
+            mejor = min(mejor, time.perf_counter() - t0)
+    return mejor
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--filas", type=int, default=10_000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        engine = create_engine(f"sqlite:///{os.path.join(carpeta, 'bench.db')}")
+        SQLModel.metadata.create_all(engine)
+        _poblar(engine, args.filas)
+
+        actual = _medir(_camino_actual, engine, args.repeticiones)
+        ligero = _medir(_camino_ligero, engine, args.repeticiones)
+        engine.dispose()
+
+    print(f"Filas: {args.filas}")
+    print(f"Camino actual : {actual * 1000:8.1f} ms")
+    print(f"Modo ligero   : {ligero * 1000:8.1f} ms")
+    print(f"Aceleración   : {actual / ligero:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
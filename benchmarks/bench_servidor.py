@@ -0,0 +1,141 @@
+# benchmarks/bench_servidor.py
+"""
+Mide el rendimiento de `servidor.py` con distinta cantidad de workers:
+arranca el servidor sobre una copia temporal de la base de datos, lo carga
+con un generador asíncrono (httpx, N conexiones keep-alive concurrentes)
+y reporta peticiones/segundo y latencias p50 / p99.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_servidor --workers 1 2 4 --duracion 10
+    python -m benchmarks.bench_servidor --ruta "/creditos/?ligero=true"
+
+El generador de carga corre en la misma máquina y consume CPU: para medir
+el escalado real conviene lanzarlo desde otra máquina o con más núcleos
+que workers.
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Tuple
+
+import httpx
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _preparar_copia(destino: str) -> None:
+    # El servidor corre en una copia del proyecto para no tocar banco.db
+    shutil.copytree(
+        RAIZ,
+        destino,
+        ignore=shutil.ignore_patterns(
+            "__pycache__", ".git", "banco_replica_*.db", "trabajos", "documentos"
+        ),
+    )
+
+
+def _esperar_arranque(url: str, limite_segundos: float = 60) -> None:
+    fin = time.monotonic() + limite_segundos
+    while time.monotonic() < fin:
+        try:
+            if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("El servidor no arrancó a tiempo")
+
+
+async def _cargar(url: str, concurrencia: int, duracion: float) -> Tuple[int, int, List[float]]:
+    latencias: List[float] = []
+    errores = 0
+    fin = time.perf_counter() + duracion
+    limites = httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia)
+
+    async with httpx.AsyncClient(limits=limites, timeout=30) as cliente:
+
+        async def usuario() -> None:
+            nonlocal errores
+            while time.perf_counter() < fin:
+                t0 = time.perf_counter()
+                try:
+                    respuesta = await cliente.get(url)
+                    if respuesta.status_code >= 400:
+                        errores += 1
+                except httpx.HTTPError:
+                    errores += 1
+                    continue
+                latencias.append(time.perf_counter() - t0)
+
+        await asyncio.gather(*(usuario() for _ in range(concurrencia)))
+    return len(latencias), errores, latencias
+
+
+def _percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(int(len(ordenados) * p), len(ordenados) - 1)]
+
+
+def medir(workers: int, args: argparse.Namespace, carpeta: str) -> None:
+    proceso = subprocess.Popen(
+        [
+            sys.executable, "servidor.py",
+            "--workers", str(workers),
+            "--host", "127.0.0.1",
+            "--port", str(args.puerto),
+            *(["--sin-gunicorn"] if args.sin_gunicorn else []),
+        ],
+        cwd=carpeta,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{args.puerto}"
+    try:
+        _esperar_arranque(base)
+        # Calentamiento: importaciones perezosas, cachés y conexiones
+        asyncio.run(_cargar(base + args.ruta, args.concurrencia, 1.0))
+        total, errores, latencias = asyncio.run(
+            _cargar(base + args.ruta, args.concurrencia, args.duracion)
+        )
+    finally:
+        proceso.send_signal(signal.SIGTERM)
+        proceso.wait(timeout=60)
+
+    print(
+        f"{workers:>7} | {total / args.duracion:>9.0f} | "
+        f"{_percentil(latencias, 0.50) * 1000:>8.1f} | "
+        f"{_percentil(latencias, 0.99) * 1000:>8.1f} | {errores:>7}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--ruta", default="/creditos/?ligero=true")
+    parser.add_argument("--concurrencia", type=int, default=64)
+    parser.add_argument("--duracion", type=float, default=10.0)
+    parser.add_argument("--puerto", type=int, default=8799)
+    parser.add_argument("--sin-gunicorn", action="store_true")
+    args = parser.parse_args()
+
+    print(f"Ruta: {args.ruta}  concurrencia: {args.concurrencia}  duración: {args.duracion}s")
+    print(f"Núcleos disponibles: {len(os.sched_getaffinity(0))}")
+    print("workers |     req/s |  p50 ms  |  p99 ms  | errores")
+    with tempfile.TemporaryDirectory() as temporal:
+        carpeta = os.path.join(temporal, "banco")
+        _preparar_copia(carpeta)
+        for workers in args.workers:
+            medir(workers, args, carpeta)
+
+
+if __name__ == "__main__":
+    main()
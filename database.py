@@ -1,15 +1,30 @@
 # database.py
+import os
+import sqlite3
+import threading
+import time
 from datetime import datetime
-from typing import Iterator
+from typing import Iterator, Optional
 
+from fastapi import Request
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
 from sqlmodel import SQLModel, Session, create_engine, select
 
 from models.usuario import Usuario
 from models.credito import Credito
-from models.historial import Historial
+from models.historial import ActividadHistorial, Historial, HistorialAfectado, Instantanea
 from models.interes import Interes
 from models.simulacion import Simulacion
 from models.reporte import Reporte
+from models.categoria import Categoria
+from models.credito_categoria import CreditoCategoria
+from models.trabajo import Trabajo
+from models.cambios_tabla import CambiosTabla
+from models.idempotencia import ClaveIdempotencia
+from models.recalculo_pendiente import RecalculoPendiente
+from services.actividad import reconstruir_actividad
+from services.metricas import metricas
 
 # -------------------------
 # Configuración del engine
@@ -30,9 +45,69 @@ def create_db_and_tables() -> None:
     y carga datos iniciales si la BD está vacía.
     """
     SQLModel.metadata.create_all(engine)
+    migrar_esquema()
     create_initial_data()
 
 
+# -------------------------
+# Migraciones ligeras
+# -------------------------
+def migrar_esquema() -> None:
+    """
+    Ajusta bases de datos creadas con versiones anteriores de los modelos
+    (create_all no modifica tablas que ya existen).
+    Cada paso es idempotente.
+    """
+    inspector = inspect(engine)
+
+    # Índice único crédito-categoría: antes de crearlo se eliminan
+    # relaciones duplicadas, conservando la más antigua de cada par.
+    indices = {i["name"] for i in inspector.get_indexes("creditocategoria")}
+    if "uq_credito_categoria" not in indices:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "DELETE FROM creditocategoria WHERE id NOT IN ("
+                "SELECT MIN(id) FROM creditocategoria GROUP BY credito_id, categoria_id)"
+            ))
+            conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_credito_categoria "
+                "ON creditocategoria (credito_id, categoria_id)"
+            ))
+    if "ix_creditocategoria_categoria_id" not in indices:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_creditocategoria_categoria_id "
+                "ON creditocategoria (categoria_id)"
+            ))
+
+    # Columna version (ETag / If-Match) en las entidades principales
+    for tabla in ("usuario", "credito", "interes", "simulacion", "reporte", "categoria"):
+        columnas = {c["name"] for c in inspector.get_columns(tabla)}
+        if "version" not in columnas:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    f"ALTER TABLE {tabla} ADD COLUMN version INTEGER NOT NULL DEFAULT 1"
+                ))
+
+    # Historial estructurado: registro afectado (indexado) y cambios en JSON
+    columnas = {c["name"] for c in inspector.get_columns("historial")}
+    with engine.begin() as conn:
+        if "entidad_id" not in columnas:
+            conn.execute(text("ALTER TABLE historial ADD COLUMN entidad_id INTEGER"))
+        if "cambios" not in columnas:
+            conn.execute(text("ALTER TABLE historial ADD COLUMN cambios JSON"))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_historial_entidad_registro "
+            "ON historial (entidad, entidad_id)"
+        ))
+
+    # Conteos de actividad: las bases que ya tenían historial se llenan una vez
+    with engine.begin() as conn:
+        vacia = conn.execute(select(ActividadHistorial.granularidad).limit(1)).first() is None
+        if vacia and conn.execute(select(Historial.idHistorial).limit(1)).first() is not None:
+            reconstruir_actividad(conn)
+
+
 # -------------------------
 # Datos iniciales de ejemplo
 # -------------------------
@@ -159,4 +234,151 @@ def get_session() -> Iterator[Session]:
             ...
     """
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+# -------------------------
+# Réplica de lectura
+# -------------------------
+# BANCO_REPLICA:
+#   - vacío: todo va a la BD principal
+#   - "sqlite": copia local de banco.db refrescada con la API de backup de SQLite
+#   - cualquier otra cosa: URL de SQLAlchemy de una réplica externa
+REPLICA = os.getenv("BANCO_REPLICA", "")
+REPLICA_INTERVALO_SEGUNDOS = float(os.getenv("BANCO_REPLICA_INTERVALO", "5"))
+
+# Cookie con el momento de la última escritura del cliente (lectura de lo propio)
+COOKIE_ESCRITURA = "banco_escritura"
+
+
+class ReplicaLectura:
+    """
+    Engine de solo lectura para los endpoints que no escriben.
+
+    Con SQLite, la réplica es una copia de banco.db que un hilo refresca cada
+    `intervalo_segundos` con la API de backup (copia consistente aunque haya
+    escrituras en curso). Se sabe exactamente desde qué momento está al día:
+    un cliente que escribió después de la última copia lee de la principal.
+
+    Con una réplica externa no se conoce su retraso, así que durante
+    `lag_maximo_segundos` después de escribir el cliente lee de la principal.
+    Si la copia local se atrasa más que eso (error al copiar), todas las
+    lecturas vuelven a la principal.
+    """
+
+    def __init__(
+        self,
+        destino: str = "",
+        intervalo_segundos: float = 5.0,
+        lag_maximo_segundos: Optional[float] = None,
+    ) -> None:
+        self.destino = destino
+        self.intervalo_segundos = intervalo_segundos
+        self.lag_maximo_segundos = lag_maximo_segundos or max(3 * intervalo_segundos, 5.0)
+        self.engine: Optional[Engine] = None
+        self.copiada_en: Optional[float] = None
+        self.ultimo_error: Optional[str] = None
+        self._hilo: Optional[threading.Thread] = None
+        self.archivo = ""
+
+        metricas.registrar_calculado("replica_lag_segundos", self.lag_segundos)
+
+    @property
+    def activa(self) -> bool:
+        return bool(self.destino)
+
+    @property
+    def local(self) -> bool:
+        return self.destino == "sqlite"
+
+    def iniciar(self) -> None:
+        if not self.activa or self.engine is not None:
+            return
+        if not self.local:
+            self.engine = create_engine(self.destino, echo=False)
+            return
+
+        # Un archivo por proceso: con varios workers cada uno mantiene su copia
+        # (el pid se toma al iniciar, no al importar, por el preload de gunicorn)
+        self.archivo = f"banco_replica_{os.getpid()}.db"
+        self.refrescar()
+        self.engine = create_engine(
+            f"sqlite:///file:{self.archivo}?mode=ro&uri=true", echo=False
+        )
+        self._hilo = threading.Thread(target=self._bucle, name="replica-sqlite", daemon=True)
+        self._hilo.start()
+
+    def refrescar(self) -> None:
+        """
+        Copia la BD principal sobre la réplica con la API de backup de SQLite.
+        """
+        inicio = time.time()
+        origen = sqlite3.connect(sqlite_file_name)
+        destino = sqlite3.connect(self.archivo)
+        try:
+            origen.backup(destino)
+        finally:
+            destino.close()
+            origen.close()
+        # Todo lo confirmado antes de `inicio` está en la copia
+        self.copiada_en = inicio
+
+    def _bucle(self) -> None:
+        while True:
+            time.sleep(self.intervalo_segundos)
+            try:
+                self.refrescar()
+                self.ultimo_error = None
+            except Exception as exc:  # el hilo no debe morir por un error puntual
+                self.ultimo_error = f"{type(exc).__name__}: {exc}"
+
+    def lag_segundos(self) -> float:
+        if self.copiada_en is None:
+            return 0.0
+        return round(time.time() - self.copiada_en, 3)
+
+    def engine_para(self, ultima_escritura: Optional[float]) -> Engine:
+        """
+        Elige el engine para una lectura según la última escritura del cliente.
+        """
+        if not self.activa or self.engine is None:
+            return engine
+        if self.local:
+            if self.copiada_en is None or self.lag_segundos() > self.lag_maximo_segundos:
+                return engine
+            if ultima_escritura is not None and ultima_escritura >= self.copiada_en:
+                return engine
+            return self.engine
+        if ultima_escritura is not None and time.time() - ultima_escritura < self.lag_maximo_segundos:
+            return engine
+        return self.engine
+
+    def cerrar(self) -> None:
+        if self.engine is not None:
+            self.engine.dispose()
+            self.engine = None
+        if self.local and self.archivo and os.path.exists(self.archivo):
+            os.remove(self.archivo)
+
+
+replica = ReplicaLectura(REPLICA, REPLICA_INTERVALO_SEGUNDOS)
+
+
+def get_session_lectura(request: Request) -> Iterator[Session]:
+    """
+    Dependencia para endpoints de solo lectura: usa la réplica si está
+    configurada y el cliente no escribió después de la última copia.
+    El encabezado `X-Consistencia: fuerte` obliga a leer de la principal.
+    """
+    if request.headers.get("x-consistencia") == "fuerte":
+        destino = engine
+    else:
+        try:
+            ultima = float(request.cookies.get(COOKIE_ESCRITURA, ""))
+        except ValueError:
+            ultima = None
+        destino = replica.engine_para(ultima)
+
+    metricas.incrementar("lecturas", destino="principal" if destino is engine else "replica")
+    with Session(destino) as session:
+        yield session
@@ -16,7 +16,27 @@ from fastapi.responses import HTMLResponse, RedirectResponse
 
 from sqlmodel import Session, select
 
-from database import create_db_and_tables, get_session
+from database import create_db_and_tables, get_session, get_session_lectura, replica
+from services.admision import MiddlewareAdmision
+from services.categorias import (
+    afectados_de,
+    asignar_relaciones,
+    mapa_categoria_credito,
+    quitar_relaciones,
+)
+from services.auditoria import auditar, cambios_creacion, diferencias, instantanea
+from services.compresion import MiddlewareCompresion
+from services.eventos import hub_historial
+from services.computo import ejecutor_computo
+from services.consistencia import MiddlewareEscrituraPropia
+from services.idempotencia import MiddlewareIdempotencia
+from services.instantaneas import instantaneas
+from services.memo_amortizacion import memo_amortizacion
+from services.recalculo import recalculo
+from services.reportes import generador_documentos
+from services.trabajos import gestor_trabajos
+from services.versiones import ConflictoVersion
+from services.serializacion import RespuestaJSONRapida
 
 # Routers (API JSON)
 from routers import (
@@ -27,6 +47,8 @@ from routers import (
     simulacion_router,
     reporte_router,
     historial_router,
+    metricas_router,
+    trabajo_router,
 )
 
 # Modelos
@@ -47,6 +69,7 @@ app = FastAPI(
     title="API Integrador Banco",
     description="Proyecto integrador de banco con FastAPI y SQLModel",
     version="1.0.0",
+    default_response_class=RespuestaJSONRapida,
 )
 
 
@@ -64,6 +87,39 @@ os.makedirs(os.path.join(UPLOADS_DIR, "cedulas"), exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 app.mount("/upload", StaticFiles(directory="upload"), name="upload")
 templates = Jinja2Templates(directory="templates")
+# Clave de idempotencia nueva en cada render de un formulario (campo oculto)
+templates.env.globals["clave_idempotencia"] = lambda: uuid.uuid4().hex
+
+
+# -----------------------------
+# Middlewares
+# (el último agregado es el más externo)
+# -----------------------------
+# Cookie de última escritura para leer lo propio cuando hay réplica de lectura
+app.add_middleware(MiddlewareEscrituraPropia)
+
+# Idempotency-Key en los POST de creación: los reintentos reciben la respuesta guardada
+app.add_middleware(MiddlewareIdempotencia, ttl_segundos=24 * 3600)
+
+# Compresión de respuestas (gzip / brotli)
+app.add_middleware(
+    MiddlewareCompresion,
+    minimo_bytes=1024,
+    estaticos={"/static": os.path.join(BASE_DIR, "static")},
+)
+
+# Control de admisión por clase de ruta (UI, lecturas, escrituras, exportaciones):
+# va por fuera de todo para rechazar rápido con 503 cuando una clase se satura
+app.add_middleware(MiddlewareAdmision)
+
+
+# -----------------------------
+# Errores de dominio
+# -----------------------------
+@app.exception_handler(ConflictoVersion)
+def conflicto_version(request: Request, exc: ConflictoVersion):
+    # Concurrencia optimista: otra escritura ganó entre If-Match y el commit
+    return RespuestaJSONRapida({"detail": str(exc)}, status_code=412)
 
 
 # -----------------------------
@@ -74,8 +130,30 @@ def on_startup():
     """
     Evento de arranque de la aplicación.
     Crea la base de datos y las tablas, y carga datos iniciales si es necesario.
+    Arranca los procesos en segundo plano.
     """
     create_db_and_tables()
+    replica.iniciar()
+    recalculo.iniciar()
+    gestor_trabajos.iniciar()
+    instantaneas.iniciar()
+    hub_historial.iniciar()
+    generador_documentos.barrer()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    """
+    Libera los pools de procesos (documentos y cómputo), la réplica de
+    lectura y el archivo de la memoización de amortizaciones, y detiene las
+    instantáneas periódicas y la lectura del feed del historial.
+    """
+    generador_documentos.cerrar()
+    ejecutor_computo.cerrar()
+    replica.cerrar()
+    memo_amortizacion.cerrar()
+    instantaneas.cerrar()
+    hub_historial.cerrar()
 
 
 # -----------------------------
@@ -102,7 +180,7 @@ def health_check():
 @app.get("/ui/usuarios", response_class=HTMLResponse)
 def ui_usuarios(
     request: Request,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session_lectura),
 ):
     usuarios = session.exec(select(Usuario)).all()
     return templates.TemplateResponse(
@@ -121,7 +199,7 @@ def ui_usuarios(
 def ui_usuarios_editar(
     usuario_id: int,
     request: Request,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session_lectura),
 ):
     usuarios = session.exec(select(Usuario)).all()
     usuario = session.get(Usuario, usuario_id)
@@ -183,6 +261,11 @@ def ui_usuarios_crear(
         cedula=ruta_para_bd, # Guardamos la ruta web
     )
     session.add(usuario)
+    session.flush()
+    auditar(
+        session, "Usuario", "CREAR", f"Usuario '{usuario.nombre}' creado con id {usuario.idUsuario}",
+        entidad_id=usuario.idUsuario, cambios=cambios_creacion(usuario),
+    )
     session.commit()
 
     return RedirectResponse(url="/ui/usuarios", status_code=status.HTTP_303_SEE_OTHER)
@@ -203,6 +286,7 @@ def ui_usuarios_actualizar(
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
+    antes = instantanea(usuario)
     usuario.nombre = nombre
     usuario.ingresos = ingresos
     usuario.gastos = gastos
@@ -224,6 +308,10 @@ def ui_usuarios_actualizar(
         # Actualizamos el campo en la BD
         usuario.cedula = f"upload/cedulas/{nombre_archivo}"
 
+    auditar(
+        session, "Usuario", "ACTUALIZAR", f"Usuario id {usuario_id} actualizado",
+        entidad_id=usuario_id, cambios=diferencias(antes, instantanea(usuario)),
+    )
     session.commit()
 
     return RedirectResponse(url="/ui/usuarios", status_code=status.HTTP_303_SEE_OTHER)
@@ -236,7 +324,7 @@ def ui_usuarios_actualizar(
 @app.get("/ui/creditos", response_class=HTMLResponse)
 def ui_creditos(
     request: Request,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session_lectura),
 ):
     creditos = session.exec(select(Credito)).all()
     usuarios = session.exec(select(Usuario)).all()
@@ -257,7 +345,7 @@ def ui_creditos(
 def ui_creditos_editar(
     credito_id: int,
     request: Request,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session_lectura),
 ):
     creditos = session.exec(select(Credito)).all()
     usuarios = session.exec(select(Usuario)).all()
@@ -299,6 +387,11 @@ def ui_creditos_crear(
         descripcion=descripcion,
     )
     session.add(credito)
+    session.flush()
+    auditar(
+        session, "Crédito", "CREAR", f"Crédito creado con id {credito.idCredito} para el usuario id {usuario_id}",
+        entidad_id=credito.idCredito, cambios=cambios_creacion(credito),
+    )
     session.commit()
 
     return RedirectResponse(url="/ui/creditos", status_code=status.HTTP_303_SEE_OTHER)
@@ -322,12 +415,17 @@ def ui_creditos_actualizar(
     if not usuario:
         raise HTTPException(status_code=400, detail="Usuario no existe")
 
+    antes = instantanea(credito)
     credito.usuario_id = usuario_id
     credito.monto = monto
     credito.plazo = plazo
     credito.tipo = tipo
     credito.descripcion = descripcion
 
+    auditar(
+        session, "Crédito", "ACTUALIZAR", f"Crédito id {credito_id} actualizado",
+        entidad_id=credito_id, cambios=diferencias(antes, instantanea(credito)),
+    )
     session.commit()
 
     return RedirectResponse(url="/ui/creditos", status_code=status.HTTP_303_SEE_OTHER)
@@ -340,17 +438,13 @@ def ui_creditos_actualizar(
 @app.get("/ui/categorias", response_class=HTMLResponse)
 def ui_categorias(
     request: Request,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session_lectura),
 ):
     categorias = session.exec(select(Categoria)).all()
     creditos = session.exec(select(Credito)).all()
-    relaciones = session.exec(select(CreditoCategoria)).all()
 
-    # Mapeo categoria_id -> primer credito_id asociado
-    cat_creditos = {}
-    for rel in relaciones:
-        if rel.categoria_id not in cat_creditos:
-            cat_creditos[rel.categoria_id] = rel.credito_id
+    # Mapeo categoria_id -> credito_id asociado (GROUP BY en SQL)
+    cat_creditos = mapa_categoria_credito(session)
 
     return templates.TemplateResponse(
         "categorias.html",
@@ -370,16 +464,11 @@ def ui_categorias(
 def ui_categorias_editar(
     categoria_id: int,
     request: Request,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session_lectura),
 ):
     categorias = session.exec(select(Categoria)).all()
     creditos = session.exec(select(Credito)).all()
-    relaciones = session.exec(select(CreditoCategoria)).all()
-
-    cat_creditos = {}
-    for rel in relaciones:
-        if rel.categoria_id not in cat_creditos:
-            cat_creditos[rel.categoria_id] = rel.credito_id
+    cat_creditos = mapa_categoria_credito(session)
 
     categoria = session.get(Categoria, categoria_id)
     if not categoria:
@@ -408,8 +497,11 @@ def ui_categorias_crear(
 ):
     categoria = Categoria(nombre=nombre, descripcion=descripcion)
     session.add(categoria)
-    session.commit()
-    session.refresh(categoria)
+    session.flush()
+    auditar(
+        session, "Categoría", "CREAR", f"Categoría '{categoria.nombre}' creada con id {categoria.idCategoria}",
+        entidad_id=categoria.idCategoria, cambios=cambios_creacion(categoria),
+    )
 
     # Asociar categoría a crédito
     credito = session.get(Credito, credito_id)
@@ -419,7 +511,12 @@ def ui_categorias_crear(
             credito_id=credito_id,
         )
         session.add(relacion)
-        session.commit()
+        auditar(
+            session, "Categoría-Crédito", "ASIGNAR",
+            f"Categoría id {categoria.idCategoria} asignada al crédito id {credito_id}",
+            afectados={"Categoría": [categoria.idCategoria], "Crédito": [credito_id]},
+        )
+    session.commit()
 
     return RedirectResponse(url="/ui/categorias", status_code=status.HTTP_303_SEE_OTHER)
 
@@ -436,27 +533,22 @@ def ui_categorias_actualizar(
     if not categoria:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
 
+    antes = instantanea(categoria)
     categoria.nombre = nombre
     categoria.descripcion = descripcion
-    session.commit()
-    session.refresh(categoria)
 
     # Actualizar relación con crédito (dejamos una sola por simplicidad)
-    relaciones = session.exec(
-        select(CreditoCategoria).where(CreditoCategoria.categoria_id == categoria_id)
-    ).all()
-    for rel in relaciones:
-        session.delete(rel)
-    session.commit()
+    cambiadas = set(quitar_relaciones(session, categoria_ids=[categoria_id]))
 
     credito = session.get(Credito, credito_id)
     if credito:
-        nueva_relacion = CreditoCategoria(
-            categoria_id=categoria_id,
-            credito_id=credito_id,
-        )
-        session.add(nueva_relacion)
-        session.commit()
+        cambiadas ^= set(asignar_relaciones(session, [(credito_id, categoria_id)]))
+    auditar(
+        session, "Categoría", "ACTUALIZAR", f"Categoría id {categoria_id} actualizada",
+        entidad_id=categoria_id, cambios=diferencias(antes, instantanea(categoria)),
+        afectados={"Crédito": afectados_de(list(cambiadas))["Crédito"]},
+    )
+    session.commit()
 
     return RedirectResponse(url="/ui/categorias", status_code=status.HTTP_303_SEE_OTHER)
 
@@ -468,7 +560,7 @@ def ui_categorias_actualizar(
 @app.get("/ui/intereses", response_class=HTMLResponse)
 def ui_intereses(
     request: Request,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session_lectura),
 ):
     intereses = session.exec(select(Interes)).all()
     creditos = session.exec(select(Credito)).all()
@@ -489,7 +581,7 @@ def ui_intereses(
 def ui_intereses_editar(
     interes_id: int,
     request: Request,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session_lectura),
 ):
     intereses = session.exec(select(Interes)).all()
     creditos = session.exec(select(Credito)).all()
@@ -527,6 +619,11 @@ def ui_intereses_crear(
         credito_id=credito_id,
     )
     session.add(interes)
+    session.flush()
+    auditar(
+        session, "Interés", "CREAR", f"Interés creado para crédito {credito_id} (tasa={tasa}, tipo='{tipo}')",
+        entidad_id=interes.idInteres, cambios=cambios_creacion(interes),
+    )
     session.commit()
 
     return RedirectResponse(url="/ui/intereses", status_code=status.HTTP_303_SEE_OTHER)
@@ -548,10 +645,18 @@ def ui_intereses_actualizar(
     if not credito:
         raise HTTPException(status_code=400, detail="Crédito no existe")
 
+    antes = instantanea(interes)
+    tasa_cambio = interes.tasa != tasa
     interes.tasa = tasa
     interes.tipo = tipo
     interes.credito_id = credito_id
 
+    auditar(
+        session, "Interés", "ACTUALIZAR", f"Interés {interes_id} actualizado",
+        entidad_id=interes_id, cambios=diferencias(antes, instantanea(interes)),
+    )
+    if tasa_cambio:
+        recalculo.encolar(session, [interes_id])
     session.commit()
 
     return RedirectResponse(url="/ui/intereses", status_code=status.HTTP_303_SEE_OTHER)
@@ -564,7 +669,7 @@ def ui_intereses_actualizar(
 @app.get("/ui/simulaciones", response_class=HTMLResponse)
 def ui_simulaciones(
     request: Request,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session_lectura),
 ):
     simulaciones = session.exec(select(Simulacion)).all()
     intereses = session.exec(select(Interes)).all()
@@ -585,7 +690,7 @@ def ui_simulaciones(
 def ui_simulaciones_editar(
     simulacion_id: int,
     request: Request,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session_lectura),
 ):
     simulaciones = session.exec(select(Simulacion)).all()
     intereses = session.exec(select(Interes)).all()
@@ -625,6 +730,11 @@ def ui_simulaciones_crear(
         saldoFinal=saldoFinal,
     )
     session.add(simulacion)
+    session.flush()
+    auditar(
+        session, "Simulación", "CREAR", f"Simulación {simulacion.idSimulacion} creada",
+        entidad_id=simulacion.idSimulacion, cambios=cambios_creacion(simulacion),
+    )
     session.commit()
 
     return RedirectResponse(url="/ui/simulaciones", status_code=status.HTTP_303_SEE_OTHER)
@@ -647,11 +757,16 @@ def ui_simulaciones_actualizar(
     if not interes:
         raise HTTPException(status_code=400, detail="Interés no existe")
 
+    antes = instantanea(simulacion)
     simulacion.interes_id = interes_id
     simulacion.cuotaMensual = cuotaMensual
     simulacion.interesTotal = interesTotal
     simulacion.saldoFinal = saldoFinal
 
+    auditar(
+        session, "Simulación", "ACTUALIZAR", f"Simulación {simulacion_id} actualizada",
+        entidad_id=simulacion_id, cambios=diferencias(antes, instantanea(simulacion)),
+    )
     session.commit()
 
     return RedirectResponse(url="/ui/simulaciones", status_code=status.HTTP_303_SEE_OTHER)
@@ -664,7 +779,7 @@ def ui_simulaciones_actualizar(
 @app.get("/ui/reportes", response_class=HTMLResponse)
 def ui_reportes(
     request: Request,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session_lectura),
 ):
     reportes = session.exec(select(Reporte)).all()
     usuarios = session.exec(select(Usuario)).all()
@@ -690,7 +805,7 @@ def ui_reportes(
 def ui_reportes_editar(
     reporte_id: int,
     request: Request,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session_lectura),
 ):
     reportes = session.exec(select(Reporte)).all()
     usuarios = session.exec(select(Usuario)).all()
@@ -732,6 +847,11 @@ def ui_reportes_crear(
         simulacion_id=simulacion_id,
     )
     session.add(reporte)
+    session.flush()
+    auditar(
+        session, "Reporte", "CREAR", f"Reporte '{reporte.titulo}' creado con id {reporte.idReporte}",
+        entidad_id=reporte.idReporte, cambios=cambios_creacion(reporte),
+    )
     session.commit()
 
     return RedirectResponse(url="/ui/reportes", status_code=status.HTTP_303_SEE_OTHER)
@@ -751,12 +871,17 @@ def ui_reportes_actualizar(
     if not reporte:
         raise HTTPException(status_code=404, detail="Reporte no encontrado")
 
+    antes = instantanea(reporte)
     reporte.titulo = titulo
     reporte.descripcion = descripcion
     reporte.usuario_id = usuario_id
     reporte.credito_id = credito_id
     reporte.simulacion_id = simulacion_id
 
+    auditar(
+        session, "Reporte", "ACTUALIZAR", f"Reporte id {reporte_id} actualizado",
+        entidad_id=reporte_id, cambios=diferencias(antes, instantanea(reporte)),
+    )
     session.commit()
 
     return RedirectResponse(url="/ui/reportes", status_code=status.HTTP_303_SEE_OTHER)
@@ -769,7 +894,7 @@ def ui_reportes_actualizar(
 @app.get("/ui/historial", response_class=HTMLResponse)
 def ui_historial(
     request: Request,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session_lectura),
 ):
     historial = session.exec(select(Historial).order_by(Historial.fecha.desc())).all()
     return templates.TemplateResponse(
@@ -791,6 +916,8 @@ app.include_router(categoria_router.router)
 app.include_router(simulacion_router.router)
 app.include_router(reporte_router.router)
 app.include_router(historial_router.router)
+app.include_router(metricas_router.router)
+app.include_router(trabajo_router.router)
 
 
 # -----------------------------
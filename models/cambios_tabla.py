@@ -0,0 +1,9 @@
+from sqlmodel import SQLModel, Field
+
+
+class CambiosTabla(SQLModel, table=True):
+    # Contador de escrituras por tabla versionada: forma parte del ETag de
+    # los listados, así cualquier alta, baja o cambio lo invalida (incluso
+    # si SQLite reutiliza el id de una fila borrada)
+    tabla: str = Field(primary_key=True)
+    cambios: int = 0
@@ -1,8 +1,22 @@
-from typing import Optional
-from sqlmodel import SQLModel, Field
+from typing import TYPE_CHECKING, List, Optional
+from sqlmodel import SQLModel, Field, Relationship
+
+from models.credito_categoria import CreditoCategoria
+
+if TYPE_CHECKING:
+    from models.credito import Credito
 
 
 class Categoria(SQLModel, table=True):
     idCategoria: Optional[int] = Field(default=None, primary_key=True)
     nombre: str
-    descripcion: Optional[str] = None
\ No newline at end of file
+    descripcion: Optional[str] = None
+
+    # Se incrementa en cada escritura (ETag / If-Match)
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
+
+    # Solo lectura: la tabla intermedia se mantiene con SQL por lotes
+    creditos: List["Credito"] = Relationship(
+        link_model=CreditoCategoria,
+        sa_relationship_kwargs={"viewonly": True},
+    )
\ No newline at end of file
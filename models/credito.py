@@ -1,5 +1,13 @@
-from typing import Optional
-from sqlmodel import SQLModel, Field
+from typing import TYPE_CHECKING, List, Optional
+from sqlmodel import SQLModel, Field, Relationship
+
+from models.credito_categoria import CreditoCategoria
+
+if TYPE_CHECKING:
+    from models.categoria import Categoria
+    from models.interes import Interes
+    from models.reporte import Reporte
+    from models.usuario import Usuario
 
 
 class Credito(SQLModel, table=True):
@@ -9,4 +17,23 @@ class Credito(SQLModel, table=True):
     tipo: str
     descripcion: Optional[str] = None
 
-    usuario_id: int = Field(foreign_key="usuario.idUsuario")
\ No newline at end of file
+    usuario_id: int = Field(foreign_key="usuario.idUsuario")
+
+    # Se incrementa en cada escritura (ETag / If-Match)
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
+
+    # Relaciones (passive_deletes="all": el ORM no toca los hijos al borrar)
+    usuario: Optional["Usuario"] = Relationship(back_populates="creditos")
+    intereses: List["Interes"] = Relationship(
+        back_populates="credito",
+        sa_relationship_kwargs={"passive_deletes": "all"},
+    )
+    reportes: List["Reporte"] = Relationship(
+        back_populates="credito",
+        sa_relationship_kwargs={"passive_deletes": "all"},
+    )
+    # Solo lectura: la tabla intermedia se mantiene con SQL por lotes
+    categorias: List["Categoria"] = Relationship(
+        link_model=CreditoCategoria,
+        sa_relationship_kwargs={"viewonly": True},
+    )
\ No newline at end of file
@@ -1,8 +1,15 @@
 from typing import Optional
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 
 
 class CreditoCategoria(SQLModel, table=True):
+    # Un mismo par crédito-categoría solo puede existir una vez; el índice único
+    # permite asignar en lote con INSERT ... ON CONFLICT DO NOTHING
+    __table_args__ = (
+        Index("uq_credito_categoria", "credito_id", "categoria_id", unique=True),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     credito_id: int = Field(foreign_key="credito.idCredito")
-    categoria_id: int = Field(foreign_key="categoria.idCategoria")
\ No newline at end of file
+    categoria_id: int = Field(foreign_key="categoria.idCategoria", index=True)
\ No newline at end of file
@@ -0,0 +1,33 @@
+from typing import List, Optional
+from sqlmodel import SQLModel
+
+from models.categoria import Categoria
+from models.reporte import Reporte
+from models.simulacion import Simulacion
+from models.usuario import Usuario
+
+
+# -----------------------------
+# Modelos de respuesta (sin tabla) para GET /creditos/{id}/completo
+# -----------------------------
+class InteresConSimulaciones(SQLModel):
+    idInteres: int
+    tasa: float
+    tipo: str
+    credito_id: int
+
+    simulaciones: List[Simulacion] = []
+
+
+class CreditoCompleto(SQLModel):
+    idCredito: int
+    monto: float
+    plazo: int
+    tipo: str
+    descripcion: Optional[str] = None
+    usuario_id: int
+
+    usuario: Optional[Usuario] = None
+    intereses: List[InteresConSimulaciones] = []
+    categorias: List[Categoria] = []
+    reportes: List[Reporte] = []
\ No newline at end of file
@@ -0,0 +1,45 @@
+from typing import Any, Dict, List, Optional
+from sqlmodel import SQLModel, Field
+
+
+# -----------------------------
+# Modelos (sin tabla) de escenarios sobre una simulación
+# -----------------------------
+class EventoEscenario(SQLModel):
+    # abono | gracia | refinanciacion; ocurre al inicio del mes indicado
+    tipo: str
+    mes: int = Field(ge=1)
+
+    # abono: monto extra (sin monto = pago total) y qué reducir (plazo | cuota)
+    monto: Optional[float] = Field(default=None, gt=0)
+    reducir: Optional[str] = None
+
+    # gracia: duración y modalidad (total | intereses)
+    meses: Optional[int] = Field(default=None, ge=1, le=120)
+    modalidad: Optional[str] = None
+
+    # refinanciacion: nueva tasa mensual, nuevo plazo restante y costo
+    tasa: Optional[float] = Field(default=None, ge=0)
+    plazo: Optional[int] = Field(default=None, ge=1, le=600)
+    costo: Optional[float] = Field(default=None, ge=0)
+
+
+class Escenario(SQLModel):
+    nombre: Optional[str] = None
+    eventos: List[EventoEscenario] = Field(min_length=1)
+
+
+class EscenariosSolicitud(SQLModel):
+    escenarios: List[Escenario] = Field(min_length=1, max_length=200)
+    incluir_tabla: bool = False
+
+
+class EscenariosResultado(SQLModel):
+    simulacion_id: int
+    monto: float
+    plazo: int
+    tasa: float
+    # Valores guardados en la simulación, para referencia
+    simulacion: Dict[str, float]
+    base: Dict[str, Any]
+    escenarios: List[Dict[str, Any]]
@@ -1,11 +1,60 @@
-from typing import Optional
+from typing import Any, Dict, Optional
 from datetime import datetime
+from sqlalchemy import JSON, Column, Index
 from sqlmodel import SQLModel, Field
 
 
 class Historial(SQLModel, table=True):
+    # El historial de un registro se lee con un rango sobre este índice
+    # (el rowid, idHistorial, va implícito al final: sale ya ordenado)
+    __table_args__ = (Index("ix_historial_entidad_registro", "entidad", "entidad_id"),)
+
     idHistorial: Optional[int] = Field(default=None, primary_key=True)
     entidad: str
     accion: str
     descripcion: str
-    fecha: datetime
\ No newline at end of file
+    fecha: datetime
+
+    # Registro afectado y cambios por campo: {"campo": [anterior, nuevo]}
+    entidad_id: Optional[int] = None
+    cambios: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSON))
+
+
+class HistorialAfectado(SQLModel, table=True):
+    # Registros tocados por una operación en lote o por una relación:
+    # un solo Historial de resumen, una fila pequeña por registro
+    __table_args__ = (
+        Index("ix_historialafectado_registro", "entidad", "entidad_id", "historial_id"),
+    )
+
+    historial_id: int = Field(foreign_key="historial.idHistorial", primary_key=True)
+    entidad: str = Field(primary_key=True)
+    entidad_id: int = Field(primary_key=True)
+
+
+class Instantanea(SQLModel, table=True):
+    # Estado completo de un registro tras el Historial `historial_id`
+    # (datos = None: el registro ya no existía). Punto de partida para
+    # reconstruir el registro a una fecha sin recorrer todo el historial.
+    __table_args__ = (
+        Index("ix_instantanea_registro", "entidad", "entidad_id", "historial_id"),
+    )
+
+    idInstantanea: Optional[int] = Field(default=None, primary_key=True)
+    entidad: str
+    entidad_id: int
+    historial_id: int
+    fecha: datetime
+    datos: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSON))
+
+
+class ActividadHistorial(SQLModel, table=True):
+    # Conteo de registros de historial por intervalo (minuto, hora, día),
+    # entidad y acción; se mantiene al escribir el historial. La clave
+    # primaria empieza por (granularidad, inicio): los rangos de fechas
+    # se leen directo del índice.
+    granularidad: str = Field(primary_key=True)
+    inicio: datetime = Field(primary_key=True)
+    entidad: str = Field(primary_key=True)
+    accion: str = Field(primary_key=True)
+    cantidad: int = 0
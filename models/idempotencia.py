@@ -0,0 +1,23 @@
+from typing import List, Optional
+from datetime import datetime
+from sqlalchemy import JSON, Column, LargeBinary
+from sqlmodel import SQLModel, Field
+
+
+class ClaveIdempotencia(SQLModel, table=True):
+    # Una fila por (ruta, Idempotency-Key), compartida por todos los workers.
+    # EN_CURSO: la petición original se está ejecutando; `expira` es su
+    # arriendo y `token` identifica al worker que la reclamó.
+    # COMPLETA: respuesta guardada; `expira` es el fin de su TTL.
+    ruta: str = Field(primary_key=True)
+    clave: str = Field(primary_key=True)
+    estado: str = Field(default="EN_CURSO")
+    token: str
+    expira: datetime = Field(index=True)
+
+    huella: Optional[str] = None
+    status: Optional[int] = None
+    # Pares [nombre, valor] en latin-1, como los entrega ASGI
+    headers: Optional[List[List[str]]] = Field(default=None, sa_column=Column(JSON))
+    # Cuerpo comprimido con zlib
+    cuerpo: Optional[bytes] = Field(default=None, sa_column=Column(LargeBinary))
@@ -1,5 +1,9 @@
-from typing import Optional
-from sqlmodel import SQLModel, Field
+from typing import TYPE_CHECKING, List, Optional
+from sqlmodel import SQLModel, Field, Relationship
+
+if TYPE_CHECKING:
+    from models.credito import Credito
+    from models.simulacion import Simulacion
 
 
 class Interes(SQLModel, table=True):
@@ -7,4 +11,14 @@ class Interes(SQLModel, table=True):
     tasa: float
     tipo: str
 
-    credito_id: int = Field(foreign_key="credito.idCredito")
\ No newline at end of file
+    credito_id: int = Field(foreign_key="credito.idCredito")
+
+    # Se incrementa en cada escritura (ETag / If-Match)
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
+
+    # Relaciones (passive_deletes="all": el ORM no toca los hijos al borrar)
+    credito: Optional["Credito"] = Relationship(back_populates="intereses")
+    simulaciones: List["Simulacion"] = Relationship(
+        back_populates="interes",
+        sa_relationship_kwargs={"passive_deletes": "all"},
+    )
\ No newline at end of file
@@ -0,0 +1,71 @@
+from typing import List, Optional
+from sqlmodel import SQLModel, Field
+
+
+# -----------------------------
+# Modelos (sin tabla) de operaciones por lote
+# -----------------------------
+class LoteIds(SQLModel):
+    ids: List[int]
+
+
+# Filtros: se combinan con AND; `ids` limita a esos registros. Hace falta
+# al menos un criterio (un filtro vacío no afecta a toda la tabla).
+class FiltroCreditos(SQLModel):
+    ids: Optional[List[int]] = None
+    usuario_id: Optional[int] = None
+    tipo: Optional[str] = None
+    monto_min: Optional[float] = None
+    monto_max: Optional[float] = None
+
+
+class FiltroIntereses(SQLModel):
+    ids: Optional[List[int]] = None
+    credito_id: Optional[int] = None
+    tipo: Optional[str] = None
+    tasa_min: Optional[float] = None
+    tasa_max: Optional[float] = None
+
+
+class FiltroSimulaciones(SQLModel):
+    ids: Optional[List[int]] = None
+    interes_id: Optional[int] = None
+    cuota_min: Optional[float] = None
+    cuota_max: Optional[float] = None
+
+
+# Cambios: solo se aplican los campos enviados
+class CambiosCredito(SQLModel):
+    monto: Optional[float] = Field(default=None, gt=0)
+    plazo: Optional[int] = Field(default=None, ge=1)
+    tipo: Optional[str] = None
+    descripcion: Optional[str] = None
+    usuario_id: Optional[int] = None
+
+
+class CambiosInteres(SQLModel):
+    tasa: Optional[float] = Field(default=None, ge=0)
+    tipo: Optional[str] = None
+    credito_id: Optional[int] = None
+
+
+class CambiosSimulacion(SQLModel):
+    cuotaMensual: Optional[float] = None
+    interesTotal: Optional[float] = None
+    saldoFinal: Optional[float] = None
+    interes_id: Optional[int] = None
+
+
+class ActualizarCreditosLote(SQLModel):
+    filtro: FiltroCreditos
+    cambios: CambiosCredito
+
+
+class ActualizarInteresesLote(SQLModel):
+    filtro: FiltroIntereses
+    cambios: CambiosInteres
+
+
+class ActualizarSimulacionesLote(SQLModel):
+    filtro: FiltroSimulaciones
+    cambios: CambiosSimulacion
@@ -0,0 +1,47 @@
+from typing import Dict, List, Optional
+from sqlmodel import SQLModel, Field
+
+
+# -----------------------------
+# Modelos (sin tabla) de la simulación Monte Carlo de tasa variable
+# -----------------------------
+class MonteCarloSolicitud(SQLModel):
+    # Con interes_id se toman monto/plazo del crédito, la tasa del interés y
+    # el margen (ingresos - gastos) del usuario; cada valor explícito manda
+    interes_id: Optional[int] = None
+    monto: Optional[float] = Field(default=None, gt=0)
+    plazo: Optional[int] = Field(default=None, ge=1, le=600)
+    tasa: Optional[float] = Field(default=None, ge=0, description="Porcentaje mensual")
+    margen: Optional[float] = Field(default=None, description="Pago máximo mensual del cliente")
+
+    trayectorias: int = Field(default=10_000, ge=100, le=100_000)
+    reversion: float = Field(default=0.05, ge=0, le=5, description="Velocidad mensual (κ)")
+    tasa_largo_plazo: Optional[float] = Field(default=None, ge=0, description="θ; por defecto la tasa actual")
+    volatilidad: float = Field(default=0.1, ge=0, le=10, description="Desviación mensual en puntos (σ)")
+    tasa_minima: float = Field(default=0.0, ge=0)
+    percentiles: List[float] = [5.0, 25.0, 50.0, 75.0, 95.0]
+    semilla: Optional[int] = None
+    # inline: en el worker que atiende la petición; pool: repartido en varios núcleos
+    ejecucion: str = "inline"
+
+
+class MonteCarloResultado(SQLModel):
+    interes_id: Optional[int] = None
+    tipo_tasa: Optional[str] = None
+    trayectorias: int
+    meses: int
+    monto: float
+    tasa_inicial: float
+    cuota_tasa_fija: float
+    interes_total_tasa_fija: float
+
+    tasa_final: Dict[str, float]
+    cuota_promedio: Dict[str, float]
+    cuota_maxima: Dict[str, float]
+    interes_total: Dict[str, float]
+
+    margen: Optional[float] = None
+    probabilidad_impago: Optional[float] = None
+    mes_impago: Dict[str, float]
+    ejecucion: str
+    duracion_ms: float
@@ -0,0 +1,19 @@
+from typing import Optional
+from sqlmodel import SQLModel
+
+
+# -----------------------------
+# Modelo de respuesta (sin tabla) para el portafolio de un usuario
+# -----------------------------
+class PortafolioUsuario(SQLModel):
+    usuario_id: int
+    nombre: str
+    ingresos: float
+    gastos: float
+
+    creditos: int
+    monto_total: float
+    tasa_promedio_ponderada: Optional[float] = None
+    interes_proyectado_total: float
+    cuotas_mensuales_total: float
+    flujo_libre: float
\ No newline at end of file
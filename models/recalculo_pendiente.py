@@ -0,0 +1,10 @@
+from datetime import datetime
+from sqlmodel import SQLModel, Field
+
+
+class RecalculoPendiente(SQLModel, table=True):
+    # Intereses cuya tasa cambió y cuyas simulaciones aún no se recalculan.
+    # Se inserta en la misma transacción que el cambio de tasa y se borra en
+    # la misma que el recálculo: sobrevive a reinicios y la ve cualquier worker.
+    interes_id: int = Field(primary_key=True)
+    encolado: datetime = Field(default_factory=datetime.now)
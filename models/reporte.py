@@ -1,6 +1,9 @@
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 from datetime import datetime
-from sqlmodel import SQLModel, Field
+from sqlmodel import SQLModel, Field, Relationship
+
+if TYPE_CHECKING:
+    from models.credito import Credito
 
 
 class Reporte(SQLModel, table=True):
@@ -11,4 +14,10 @@ class Reporte(SQLModel, table=True):
 
     usuario_id: Optional[int] = Field(default=None, foreign_key="usuario.idUsuario")
     credito_id: Optional[int] = Field(default=None, foreign_key="credito.idCredito")
-    simulacion_id: Optional[int] = Field(default=None, foreign_key="simulacion.idSimulacion")
\ No newline at end of file
+    simulacion_id: Optional[int] = Field(default=None, foreign_key="simulacion.idSimulacion")
+
+    # Se incrementa en cada escritura (ETag / If-Match)
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
+
+    # Relaciones
+    credito: Optional["Credito"] = Relationship(back_populates="reportes")
\ No newline at end of file
@@ -1,5 +1,8 @@
-from typing import Optional
-from sqlmodel import SQLModel, Field
+from typing import TYPE_CHECKING, Optional
+from sqlmodel import SQLModel, Field, Relationship
+
+if TYPE_CHECKING:
+    from models.interes import Interes
 
 
 class Simulacion(SQLModel, table=True):
@@ -8,4 +11,10 @@ class Simulacion(SQLModel, table=True):
     interesTotal: float
     saldoFinal: float
 
-    interes_id: int = Field(foreign_key="interes.idInteres")
\ No newline at end of file
+    interes_id: int = Field(foreign_key="interes.idInteres")
+
+    # Se incrementa en cada escritura (ETag / If-Match)
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
+
+    # Relaciones
+    interes: Optional["Interes"] = Relationship(back_populates="simulaciones")
\ No newline at end of file
@@ -0,0 +1,43 @@
+from typing import Any, Dict, Optional
+from datetime import datetime
+from sqlalchemy import JSON, Column, Index
+from sqlmodel import SQLModel, Field
+
+
+class Trabajo(SQLModel, table=True):
+    # Índice para que los workers encuentren rápido el siguiente trabajo disponible
+    __table_args__ = (
+        Index("ix_trabajo_cola", "estado", "prioridad", "disponible_en"),
+    )
+
+    idTrabajo: Optional[int] = Field(default=None, primary_key=True)
+    tipo: str
+    # PENDIENTE, EN_PROCESO, COMPLETADO, FALLIDO
+    estado: str = Field(default="PENDIENTE")
+    # Mayor prioridad = se atiende antes
+    prioridad: int = Field(default=0)
+    parametros: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSON))
+
+    progreso: float = Field(default=0.0, description="Avance entre 0 y 1")
+    mensaje: Optional[str] = None
+
+    intentos: int = Field(default=0)
+    max_intentos: int = Field(default=3)
+    # Momento desde el cual se puede tomar (se usa para el backoff entre reintentos)
+    disponible_en: datetime = Field(default_factory=datetime.now)
+    # Mientras un worker lo procesa, su "arriendo" vence en este momento;
+    # si vence (el worker murió), otro worker puede retomarlo
+    bloqueado_hasta: Optional[datetime] = None
+
+    resultado: Optional[str] = Field(default=None, description="Ruta del archivo de resultado")
+    resultado_media_type: Optional[str] = None
+
+    creado: datetime = Field(default_factory=datetime.now)
+    actualizado: datetime = Field(default_factory=datetime.now)
+
+
+class TrabajoCrear(SQLModel):
+    tipo: str
+    parametros: Dict[str, Any] = {}
+    prioridad: int = 0
+    max_intentos: int = Field(default=3, ge=1, le=10)
\ No newline at end of file
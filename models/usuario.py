@@ -1,6 +1,9 @@
 # models/usuario.py
-from typing import Optional
-from sqlmodel import SQLModel, Field
+from typing import TYPE_CHECKING, List, Optional
+from sqlmodel import SQLModel, Field, Relationship
+
+if TYPE_CHECKING:
+    from models.credito import Credito
 
 class Usuario(SQLModel, table=True):
     idUsuario: Optional[int] = Field(default=None, primary_key=True)
@@ -14,4 +17,13 @@ class Usuario(SQLModel, table=True):
     cedula: Optional[str] = Field(
         default=None,
         description="Ruta del archivo de cédula (PDF o JPG) almacenado en el servidor",
+    )
+
+    # Se incrementa en cada escritura (ETag / If-Match)
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
+
+    # Relaciones (passive_deletes="all": el ORM no toca los hijos al borrar)
+    creditos: List["Credito"] = Relationship(
+        back_populates="usuario",
+        sa_relationship_kwargs={"passive_deletes": "all"},
     )
\ No newline at end of file
@@ -1,17 +1,32 @@
 # routers/categoria_router.py
 
-from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Form, status
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Form, status, Request, Response
 from fastapi.responses import RedirectResponse
 from sqlmodel import Session, select
 
-from database import get_session
+from database import get_session, get_session_lectura
 from models.categoria import Categoria
+from models.lote import LoteIds
 from models.credito import Credito
 from models.credito_categoria import CreditoCategoria
-from models.historial import Historial
+from services.auditoria import auditar, cambios_creacion, cambios_eliminacion, diferencias, instantanea
+from services.categorias import (
+    afectados_de,
+    asignar_relaciones,
+    quitar_relaciones,
+    validar_categorias,
+    validar_creditos,
+)
+from services.serializacion import campos_de, respuesta_ligera, respuesta_lote, respuesta_registro
+from services.versiones import (
+    etag_coleccion,
+    etag_de,
+    etag_registro,
+    respuesta_no_modificado,
+    verificar_if_match,
+)
 
 router = APIRouter(prefix="/categorias", tags=["Categorías"])
 
@@ -38,17 +53,19 @@ def crear_categoria(
         )
 
     session.add(categoria)
-    session.commit()
-    session.refresh(categoria)
-
-    h = Historial(
-        entidad="Categoría",
-        accion="CREAR",
-        descripcion=f"Categoría '{categoria.nombre}' creada con id {categoria.idCategoria}",
-        fecha=datetime.now(),
+    session.flush()
+
+    # El historial va en la misma transacción que el alta
+    auditar(
+        session,
+        "Categoría",
+        "CREAR",
+        f"Categoría '{categoria.nombre}' creada con id {categoria.idCategoria}",
+        entidad_id=categoria.idCategoria,
+        cambios=cambios_creacion(categoria),
     )
-    session.add(h)
     session.commit()
+    session.refresh(categoria)
 
     return categoria
 
@@ -58,10 +75,17 @@ def crear_categoria(
 # -----------------------------
 @router.get("/", response_model=List[Categoria])
 def listar_categorias(
-    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_session_lectura),
     nombre: Optional[str] = Query(
         None, description="Filtrar por nombre (contiene)"
     ),
+    ligero: bool = Query(
+        False,
+        description="Modo rápido: selecciona solo columnas y serializa sin validar cada fila",
+    ),
+    campos: Optional[list] = Depends(campos_de(Categoria)),
 ) -> List[Categoria]:
     """
     Lista todas las categorías, con filtro opcional por nombre.
@@ -71,21 +95,60 @@ def listar_categorias(
     if nombre:
         query = query.where(Categoria.nombre.contains(nombre))
 
+    etag = etag_coleccion(session, request, query, Categoria)
+    no_modificado = respuesta_no_modificado(request, etag)
+    if no_modificado is not None:
+        return no_modificado
+    response.headers["ETag"] = etag
+
+    if ligero or campos:
+        return respuesta_ligera(session, query, Categoria, campos, headers={"ETag": etag})
+
     categorias = session.exec(query).all()
     return categorias
 
 
+# -----------------------------
+# READ - OBTENER VARIOS POR ID (API JSON)
+# -----------------------------
+@router.post("/batch-get")
+def obtener_categorias_por_ids(
+    lote: LoteIds,
+    session: Session = Depends(get_session_lectura),
+    campos: Optional[list] = Depends(campos_de(Categoria)),
+):
+    """
+    Obtiene varios categorías en una sola consulta (`{"ids": [1, 2, 3]}`).
+    Responde `{"encontrados": {id: categoria}, "faltantes": [ids]}`.
+    """
+    return respuesta_lote(session, Categoria, lote.ids, campos)
+
+
 # -----------------------------
 # READ - OBTENER POR ID (API JSON)
 # -----------------------------
 @router.get("/{categoria_id}", response_model=Categoria)
 def obtener_categoria(
     categoria_id: int,
-    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_session_lectura),
+    campos: Optional[list] = Depends(campos_de(Categoria)),
 ) -> Categoria:
     """
     Obtiene una categoría por su id.
     """
+    etag = etag_registro(session, request, Categoria, categoria_id, "Categoría no encontrada")
+    no_modificado = respuesta_no_modificado(request, etag)
+    if no_modificado is not None:
+        return no_modificado
+    response.headers["ETag"] = etag
+
+    if campos:
+        return respuesta_registro(
+            session, Categoria, categoria_id, campos, "Categoría no encontrada", headers={"ETag": etag}
+        )
+
     categoria = session.get(Categoria, categoria_id)
     if not categoria:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
@@ -99,6 +162,8 @@ def obtener_categoria(
 def actualizar_categoria(
     categoria_id: int,
     datos: Categoria,
+    request: Request,
+    response: Response,
     session: Session = Depends(get_session),
 ) -> Categoria:
     """
@@ -107,6 +172,8 @@ def actualizar_categoria(
     categoria = session.get(Categoria, categoria_id)
     if not categoria:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
+    verificar_if_match(session, request, categoria)
+    antes = instantanea(categoria)
 
     # Validar nombre duplicado si cambia
     if datos.nombre != categoria.nombre:
@@ -122,21 +189,21 @@ def actualizar_categoria(
     categoria.nombre = datos.nombre
     categoria.descripcion = datos.descripcion
 
-    session.commit()
-    session.refresh(categoria)
-
-    h = Historial(
-        entidad="Categoría",
-        accion="ACTUALIZAR",
-        descripcion=(
+    auditar(
+        session,
+        "Categoría",
+        "ACTUALIZAR",
+        (
             f"Categoría id {categoria.idCategoria} actualizada "
             f"('{categoria.nombre}')"
         ),
-        fecha=datetime.now(),
+        entidad_id=categoria.idCategoria,
+        cambios=diferencias(antes, instantanea(categoria)),
     )
-    session.add(h)
     session.commit()
+    session.refresh(categoria)
 
+    response.headers["ETag"] = etag_de(categoria)
     return categoria
 
 
@@ -146,6 +213,8 @@ def actualizar_categoria(
 @router.patch("/{categoria_id}", response_model=Categoria)
 def actualizar_categoria_parcial(
     categoria_id: int,
+    request: Request,
+    response: Response,
     nombre: Optional[str] = None,
     descripcion: Optional[str] = None,
     session: Session = Depends(get_session),
@@ -156,7 +225,9 @@ def actualizar_categoria_parcial(
     categoria = session.get(Categoria, categoria_id)
     if not categoria:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
+    verificar_if_match(session, request, categoria)
 
+    antes = instantanea(categoria)
     cambios = []
 
     if nombre is not None and nombre != categoria.nombre:
@@ -176,22 +247,22 @@ def actualizar_categoria_parcial(
         cambios.append("descripcion")
 
     if cambios:
-        session.commit()
-        session.refresh(categoria)
-
         detalle_cambios = ", ".join(cambios)
-        h = Historial(
-            entidad="Categoría",
-            accion="ACTUALIZAR_PARCIAL",
-            descripcion=(
+        auditar(
+            session,
+            "Categoría",
+            "ACTUALIZAR_PARCIAL",
+            (
                 f"Categoría id {categoria.idCategoria} actualizada parcialmente. "
                 f"Campos modificados: {detalle_cambios}"
             ),
-            fecha=datetime.now(),
+            entidad_id=categoria.idCategoria,
+            cambios=diferencias(antes, instantanea(categoria)),
         )
-        session.add(h)
         session.commit()
+        session.refresh(categoria)
 
+    response.headers["ETag"] = etag_de(categoria)
     return categoria
 
 
@@ -211,20 +282,18 @@ def eliminar_categoria(
     if not categoria:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
 
-    # Eliminar relaciones en la tabla intermedia
-    relaciones = session.exec(
-        select(CreditoCategoria).where(CreditoCategoria.categoria_id == categoria_id)
-    ).all()
-    for rel in relaciones:
-        session.delete(rel)
-
-    h = Historial(
-        entidad="Categoría",
-        accion="ELIMINAR",
-        descripcion=f"Categoría '{categoria.nombre}' (id {categoria.idCategoria}) eliminada",
-        fecha=datetime.now(),
+    # Eliminar relaciones en la tabla intermedia (un solo DELETE)
+    quitadas = quitar_relaciones(session, categoria_ids=[categoria_id])
+
+    auditar(
+        session,
+        "Categoría",
+        "ELIMINAR",
+        f"Categoría '{categoria.nombre}' (id {categoria.idCategoria}) eliminada",
+        entidad_id=categoria.idCategoria,
+        cambios=cambios_eliminacion(categoria),
+        afectados={"Crédito": afectados_de(quitadas)["Crédito"]},
     )
-    session.add(h)
 
     session.delete(categoria)
     session.commit()
@@ -272,17 +341,16 @@ def asignar_categoria_a_credito(
     )
     session.add(relacion)
 
-    h = Historial(
-        entidad="Categoría-Crédito",
-        accion="ASIGNAR",
-        descripcion=(
+    auditar(
+        session,
+        "Categoría-Crédito",
+        "ASIGNAR",
+        (
             f"Categoría '{categoria.nombre}' (id {categoria.idCategoria}) "
             f"asignada al crédito id {credito.idCredito}"
         ),
-        fecha=datetime.now(),
+        afectados={"Categoría": [categoria_id], "Crédito": [credito_id]},
     )
-    session.add(h)
-
     session.commit()
 
     return {"mensaje": "Categoría asignada al crédito correctamente"}
@@ -316,16 +384,16 @@ def quitar_categoria_de_credito(
     categoria = session.get(Categoria, categoria_id)
     credito = session.get(Credito, credito_id)
 
-    h = Historial(
-        entidad="Categoría-Crédito",
-        accion="DESASIGNAR",
-        descripcion=(
+    auditar(
+        session,
+        "Categoría-Crédito",
+        "DESASIGNAR",
+        (
             f"Categoría '{categoria.nombre}' (id {categoria.idCategoria}) "
             f"desasignada del crédito id {credito.idCredito}"
         ),
-        fecha=datetime.now(),
+        afectados={"Categoría": [categoria_id], "Crédito": [credito_id]},
     )
-    session.add(h)
 
     session.delete(relacion)
     session.commit()
@@ -333,6 +401,131 @@ def quitar_categoria_de_credito(
     return {"mensaje": "Categoría desasignada del crédito correctamente"}
 
 
+# -----------------------------
+# ASIGNAR / QUITAR EN LOTE (API JSON)
+# -----------------------------
+@router.post("/{categoria_id}/creditos")
+def asignar_categoria_a_creditos(
+    categoria_id: int,
+    creditos: List[int] = Body(..., embed=True, description="Ids de créditos"),
+    session: Session = Depends(get_session),
+):
+    """
+    Asocia una categoría a muchos créditos con un solo
+    INSERT ... ON CONFLICT DO NOTHING. Las relaciones que ya existían se ignoran.
+    """
+    categoria = session.get(Categoria, categoria_id)
+    if not categoria:
+        raise HTTPException(status_code=404, detail="Categoría no encontrada")
+    validar_creditos(session, creditos)
+
+    asignadas = asignar_relaciones(session, [(c, categoria_id) for c in creditos])
+
+    auditar(
+        session,
+        "Categoría-Crédito",
+        "ASIGNAR_LOTE",
+        (
+            f"Categoría '{categoria.nombre}' (id {categoria.idCategoria}) "
+            f"asignada a {len(asignadas)} créditos"
+        ),
+        afectados=afectados_de(asignadas),
+    )
+    session.commit()
+
+    return {"asignadas": len(asignadas), "ya_existian": len(set(creditos)) - len(asignadas)}
+
+
+@router.delete("/{categoria_id}/creditos")
+def quitar_categoria_de_creditos(
+    categoria_id: int,
+    creditos: List[int] = Body(..., embed=True, description="Ids de créditos"),
+    session: Session = Depends(get_session),
+):
+    """
+    Quita una categoría de muchos créditos con un solo DELETE ... WHERE IN.
+    """
+    categoria = session.get(Categoria, categoria_id)
+    if not categoria:
+        raise HTTPException(status_code=404, detail="Categoría no encontrada")
+
+    eliminadas = quitar_relaciones(
+        session, categoria_ids=[categoria_id], credito_ids=creditos
+    )
+
+    auditar(
+        session,
+        "Categoría-Crédito",
+        "DESASIGNAR_LOTE",
+        (
+            f"Categoría '{categoria.nombre}' (id {categoria.idCategoria}) "
+            f"desasignada de {len(eliminadas)} créditos"
+        ),
+        afectados=afectados_de(eliminadas),
+    )
+    session.commit()
+
+    return {"eliminadas": len(eliminadas)}
+
+
+@router.post("/credito/{credito_id}")
+def asignar_categorias_a_credito(
+    credito_id: int,
+    categorias: List[int] = Body(..., embed=True, description="Ids de categorías"),
+    session: Session = Depends(get_session),
+):
+    """
+    Asocia muchas categorías a un crédito con un solo
+    INSERT ... ON CONFLICT DO NOTHING.
+    """
+    credito = session.get(Credito, credito_id)
+    if not credito:
+        raise HTTPException(status_code=404, detail="Crédito no encontrado")
+    validar_categorias(session, categorias)
+
+    asignadas = asignar_relaciones(session, [(credito_id, c) for c in categorias])
+
+    auditar(
+        session,
+        "Categoría-Crédito",
+        "ASIGNAR_LOTE",
+        f"{len(asignadas)} categorías asignadas al crédito id {credito.idCredito}",
+        afectados=afectados_de(asignadas),
+    )
+    session.commit()
+
+    return {"asignadas": len(asignadas), "ya_existian": len(set(categorias)) - len(asignadas)}
+
+
+@router.delete("/credito/{credito_id}")
+def quitar_categorias_de_credito(
+    credito_id: int,
+    categorias: List[int] = Body(..., embed=True, description="Ids de categorías"),
+    session: Session = Depends(get_session),
+):
+    """
+    Quita muchas categorías de un crédito con un solo DELETE ... WHERE IN.
+    """
+    credito = session.get(Credito, credito_id)
+    if not credito:
+        raise HTTPException(status_code=404, detail="Crédito no encontrado")
+
+    eliminadas = quitar_relaciones(
+        session, categoria_ids=categorias, credito_ids=[credito_id]
+    )
+
+    auditar(
+        session,
+        "Categoría-Crédito",
+        "DESASIGNAR_LOTE",
+        f"{len(eliminadas)} categorías desasignadas del crédito id {credito.idCredito}",
+        afectados=afectados_de(eliminadas),
+    )
+    session.commit()
+
+    return {"eliminadas": len(eliminadas)}
+
+
 # -----------------------------------------
 # Endpoints para formularios HTML (UI)
 # -----------------------------------------
@@ -378,8 +571,7 @@ def crear_categoria_form(
         descripcion=descripcion.strip(),
     )
     session.add(categoria)
-    session.commit()
-    session.refresh(categoria)
+    session.flush()
 
     # Crear relación con el crédito
     relacion = CreditoCategoria(
@@ -388,24 +580,24 @@ def crear_categoria_form(
     )
     session.add(relacion)
 
-    h_cat = Historial(
-        entidad="Categoría",
-        accion="CREAR",
-        descripcion=f"Categoría '{categoria.nombre}' creada con id {categoria.idCategoria}",
-        fecha=datetime.now(),
+    auditar(
+        session,
+        "Categoría",
+        "CREAR",
+        f"Categoría '{categoria.nombre}' creada con id {categoria.idCategoria}",
+        entidad_id=categoria.idCategoria,
+        cambios=cambios_creacion(categoria),
     )
-    session.add(h_cat)
-
-    h_rel = Historial(
-        entidad="Categoría-Crédito",
-        accion="ASIGNAR",
-        descripcion=(
+    auditar(
+        session,
+        "Categoría-Crédito",
+        "ASIGNAR",
+        (
             f"Categoría '{categoria.nombre}' (id {categoria.idCategoria}) "
             f"asignada al crédito id {credito.idCredito}"
         ),
-        fecha=datetime.now(),
+        afectados={"Categoría": [categoria.idCategoria], "Crédito": [credito_id]},
     )
-    session.add(h_rel)
 
     session.commit()
 
@@ -455,33 +647,29 @@ def actualizar_categoria_form(
                 detail=f"Ya existe una categoría con el nombre '{nombre.strip()}'",
             )
 
+    antes = instantanea(categoria)
     categoria.nombre = nombre.strip()
     categoria.descripcion = descripcion.strip()
     session.add(categoria)
 
     # Ajustar relaciones: dejamos solo el crédito seleccionado
-    relaciones = session.exec(
-        select(CreditoCategoria).where(CreditoCategoria.categoria_id == idCategoria)
-    ).all()
-    for rel in relaciones:
-        session.delete(rel)
-
-    nueva_relacion = CreditoCategoria(
-        categoria_id=idCategoria,
-        credito_id=credito_id,
+    # Solo cuentan como afectados los créditos cuya relación cambió
+    cambiadas = set(quitar_relaciones(session, categoria_ids=[idCategoria])) ^ set(
+        asignar_relaciones(session, [(credito_id, idCategoria)])
     )
-    session.add(nueva_relacion)
 
-    h = Historial(
-        entidad="Categoría",
-        accion="ACTUALIZAR",
-        descripcion=(
+    auditar(
+        session,
+        "Categoría",
+        "ACTUALIZAR",
+        (
             f"Categoría id {categoria.idCategoria} actualizada "
             f"('{categoria.nombre}') y asociada al crédito id {credito.idCredito}"
         ),
-        fecha=datetime.now(),
+        entidad_id=categoria.idCategoria,
+        cambios=diferencias(antes, instantanea(categoria)),
+        afectados={"Crédito": afectados_de(list(cambiadas))["Crédito"]},
     )
-    session.add(h)
 
     session.commit()
 
@@ -1,14 +1,27 @@
-from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Form, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Form, status, Request, Response
 from fastapi.responses import RedirectResponse
+from sqlalchemy.orm import joinedload, selectinload
 from sqlmodel import Session, select
 
-from database import get_session
+from database import get_session, get_session_lectura
 from models.credito import Credito
+from models.lote import ActualizarCreditosLote, FiltroCreditos, LoteIds
+from models.credito_completo import CreditoCompleto
+from models.interes import Interes
 from models.usuario import Usuario
-from models.historial import Historial
+from services.auditoria import auditar, cambios_creacion, cambios_eliminacion, diferencias, instantanea
+from services.categorias import quitar_relaciones
+from services.lotes import actualizar_lote, auditar_lote, condiciones_lote, eliminar_lote
+from services.serializacion import campos_de, respuesta_ligera, respuesta_lote, respuesta_registro
+from services.versiones import (
+    etag_coleccion,
+    etag_de,
+    etag_registro,
+    respuesta_no_modificado,
+    verificar_if_match,
+)
 
 router = APIRouter(prefix="/creditos", tags=["Créditos"])
 
@@ -34,21 +47,23 @@ def crear_credito(
         )
 
     session.add(credito)
-    session.commit()
-    session.refresh(credito)
-
-    historial = Historial(
-        entidad="Crédito",
-        accion="CREAR",
-        descripcion=(
+    session.flush()
+
+    # El historial va en la misma transacción que el alta
+    auditar(
+        session,
+        "Crédito",
+        "CREAR",
+        (
             f"Crédito creado con id {credito.idCredito}, "
             f"monto {credito.monto}, plazo {credito.plazo} meses, "
             f"tipo '{credito.tipo}', para el usuario '{usuario.nombre}' (id {usuario.idUsuario})"
         ),
-        fecha=datetime.now(),
+        entidad_id=credito.idCredito,
+        cambios=cambios_creacion(credito),
     )
-    session.add(historial)
     session.commit()
+    session.refresh(credito)
 
     return credito
 
@@ -58,7 +73,9 @@ def crear_credito(
 # -----------------------------
 @router.get("/", response_model=List[Credito])
 def listar_creditos(
-    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_session_lectura),
     usuario_id: Optional[int] = Query(
         None, description="Filtrar por id de usuario"
     ),
@@ -71,6 +88,11 @@ def listar_creditos(
     monto_max: Optional[float] = Query(
         None, description="Monto máximo"
     ),
+    ligero: bool = Query(
+        False,
+        description="Modo rápido: selecciona solo columnas y serializa sin validar cada fila",
+    ),
+    campos: Optional[list] = Depends(campos_de(Credito)),
 ) -> List[Credito]:
     """
     Lista todos los créditos, con filtros opcionales:
@@ -92,27 +114,156 @@ def listar_creditos(
     if monto_max is not None:
         query = query.where(Credito.monto <= monto_max)
 
+    etag = etag_coleccion(session, request, query, Credito)
+    no_modificado = respuesta_no_modificado(request, etag)
+    if no_modificado is not None:
+        return no_modificado
+    response.headers["ETag"] = etag
+
+    if ligero or campos:
+        return respuesta_ligera(session, query, Credito, campos, headers={"ETag": etag})
+
     creditos = session.exec(query).all()
     return creditos
 
 
+# -----------------------------
+# READ - OBTENER VARIOS POR ID (API JSON)
+# -----------------------------
+@router.post("/batch-get")
+def obtener_creditos_por_ids(
+    lote: LoteIds,
+    session: Session = Depends(get_session_lectura),
+    campos: Optional[list] = Depends(campos_de(Credito)),
+):
+    """
+    Obtiene varios créditos en una sola consulta (`{"ids": [1, 2, 3]}`).
+    Responde `{"encontrados": {id: credito}, "faltantes": [ids]}`.
+    """
+    return respuesta_lote(session, Credito, lote.ids, campos)
+
+
 # -----------------------------
 # READ - OBTENER POR ID (API JSON)
 # -----------------------------
 @router.get("/{credito_id}", response_model=Credito)
 def obtener_credito(
     credito_id: int,
-    session: Session = Depends(get_session)
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_session_lectura),
+    campos: Optional[list] = Depends(campos_de(Credito)),
 ) -> Credito:
     """
     Obtiene un crédito por su id.
     """
+    etag = etag_registro(session, request, Credito, credito_id, "Crédito no encontrado")
+    no_modificado = respuesta_no_modificado(request, etag)
+    if no_modificado is not None:
+        return no_modificado
+    response.headers["ETag"] = etag
+
+    if campos:
+        return respuesta_registro(
+            session, Credito, credito_id, campos, "Crédito no encontrado", headers={"ETag": etag}
+        )
+
     credito = session.get(Credito, credito_id)
     if not credito:
         raise HTTPException(status_code=404, detail="Crédito no encontrado")
     return credito
 
 
+# -----------------------------
+# READ - DETALLE COMPLETO CON RELACIONES (API JSON)
+# -----------------------------
+@router.get("/{credito_id}/completo", response_model=CreditoCompleto)
+def obtener_credito_completo(
+    credito_id: int,
+    session: Session = Depends(get_session_lectura),
+) -> Credito:
+    """
+    Obtiene un crédito con su usuario, intereses (y sus simulaciones),
+    categorías y reportes.
+
+    Todo se carga con carga ansiosa (joinedload / selectinload), así que
+    siempre son 5 consultas sin importar cuántos intereses o simulaciones tenga.
+    """
+    query = (
+        select(Credito)
+        .where(Credito.idCredito == credito_id)
+        .options(
+            joinedload(Credito.usuario),
+            selectinload(Credito.intereses).selectinload(Interes.simulaciones),
+            selectinload(Credito.categorias),
+            selectinload(Credito.reportes),
+        )
+    )
+    credito = session.exec(query).first()
+    if not credito:
+        raise HTTPException(status_code=404, detail="Crédito no encontrado")
+    return credito
+
+
+# -----------------------------
+# UPDATE / DELETE EN LOTE (API JSON)
+# -----------------------------
+def _condiciones_creditos(filtro: FiltroCreditos) -> list:
+    condiciones = []
+    if filtro.usuario_id is not None:
+        condiciones.append(Credito.usuario_id == filtro.usuario_id)
+    if filtro.tipo:
+        condiciones.append(Credito.tipo == filtro.tipo)
+    if filtro.monto_min is not None:
+        condiciones.append(Credito.monto >= filtro.monto_min)
+    if filtro.monto_max is not None:
+        condiciones.append(Credito.monto <= filtro.monto_max)
+    return condiciones_lote(Credito, filtro.ids, condiciones)
+
+
+@router.patch("/lote")
+def actualizar_creditos_lote(
+    lote: ActualizarCreditosLote,
+    session: Session = Depends(get_session),
+):
+    """
+    Aplica los mismos cambios a todos los créditos del filtro con un solo
+    UPDATE y deja un resumen en el historial (una sola transacción).
+    """
+    valores = lote.cambios.model_dump(exclude_none=True)
+    if "usuario_id" in valores and not session.get(Usuario, valores["usuario_id"]):
+        raise HTTPException(
+            status_code=400,
+            detail=f"El usuario con id {valores['usuario_id']} no existe",
+        )
+
+    ids = actualizar_lote(session, Credito, _condiciones_creditos(lote.filtro), valores)
+    if ids:
+        auditar_lote(session, "Crédito", "ACTUALIZAR_LOTE", "créditos", ids, valores)
+    session.commit()
+
+    return {"actualizados": len(ids)}
+
+
+@router.delete("/lote")
+def eliminar_creditos_lote(
+    filtro: FiltroCreditos,
+    session: Session = Depends(get_session),
+):
+    """
+    Elimina todos los créditos del filtro (y sus relaciones con categorías)
+    con sentencias DELETE masivas y deja un resumen en el historial.
+    """
+    condiciones = _condiciones_creditos(filtro)
+    quitar_relaciones(session, credito_ids=select(Credito.idCredito).where(*condiciones))
+    ids = eliminar_lote(session, Credito, condiciones)
+    if ids:
+        auditar_lote(session, "Crédito", "ELIMINAR_LOTE", "créditos", ids)
+    session.commit()
+
+    return {"eliminados": len(ids)}
+
+
 # -----------------------------
 # UPDATE COMPLETO (PUT, API JSON)
 # -----------------------------
@@ -120,6 +271,8 @@ def obtener_credito(
 def actualizar_credito(
     credito_id: int,
     datos: Credito,
+    request: Request,
+    response: Response,
     session: Session = Depends(get_session),
 ) -> Credito:
     """
@@ -128,6 +281,7 @@ def actualizar_credito(
     credito = session.get(Credito, credito_id)
     if not credito:
         raise HTTPException(status_code=404, detail="Crédito no encontrado")
+    verificar_if_match(session, request, credito)
 
     # Validar que el nuevo usuario exista
     usuario = session.get(Usuario, datos.usuario_id)
@@ -137,28 +291,29 @@ def actualizar_credito(
             detail=f"El usuario con id {datos.usuario_id} no existe",
         )
 
+    antes = instantanea(credito)
     credito.monto = datos.monto
     credito.plazo = datos.plazo
     credito.tipo = datos.tipo
     credito.descripcion = datos.descripcion
     credito.usuario_id = datos.usuario_id
 
-    session.commit()
-    session.refresh(credito)
-
-    historial = Historial(
-        entidad="Crédito",
-        accion="ACTUALIZAR",
-        descripcion=(
+    auditar(
+        session,
+        "Crédito",
+        "ACTUALIZAR",
+        (
             f"Crédito id {credito.idCredito} actualizado. "
             f"Monto {credito.monto}, plazo {credito.plazo}, tipo '{credito.tipo}', "
             f"usuario id {credito.usuario_id}"
         ),
-        fecha=datetime.now(),
+        entidad_id=credito.idCredito,
+        cambios=diferencias(antes, instantanea(credito)),
     )
-    session.add(historial)
     session.commit()
+    session.refresh(credito)
 
+    response.headers["ETag"] = etag_de(credito)
     return credito
 
 
@@ -168,6 +323,8 @@ def actualizar_credito(
 @router.patch("/{credito_id}", response_model=Credito)
 def actualizar_credito_parcial(
     credito_id: int,
+    request: Request,
+    response: Response,
     monto: Optional[float] = None,
     plazo: Optional[int] = None,
     tipo: Optional[str] = None,
@@ -181,7 +338,9 @@ def actualizar_credito_parcial(
     credito = session.get(Credito, credito_id)
     if not credito:
         raise HTTPException(status_code=404, detail="Crédito no encontrado")
+    verificar_if_match(session, request, credito)
 
+    antes = instantanea(credito)
     cambios = []
 
     if monto is not None:
@@ -207,22 +366,22 @@ def actualizar_credito_parcial(
         cambios.append("usuario_id")
 
     if cambios:
-        session.commit()
-        session.refresh(credito)
-
         detalle_cambios = ", ".join(cambios)
-        historial = Historial(
-            entidad="Crédito",
-            accion="ACTUALIZAR_PARCIAL",
-            descripcion=(
+        auditar(
+            session,
+            "Crédito",
+            "ACTUALIZAR_PARCIAL",
+            (
                 f"Crédito id {credito.idCredito} actualizado parcialmente. "
                 f"Campos modificados: {detalle_cambios}"
             ),
-            fecha=datetime.now(),
+            entidad_id=credito.idCredito,
+            cambios=diferencias(antes, instantanea(credito)),
         )
-        session.add(historial)
         session.commit()
+        session.refresh(credito)
 
+    response.headers["ETag"] = etag_de(credito)
     return credito
 
 
@@ -241,13 +400,14 @@ def eliminar_credito(
     if not credito:
         raise HTTPException(status_code=404, detail="Crédito no encontrado")
 
-    historial = Historial(
-        entidad="Crédito",
-        accion="ELIMINAR",
-        descripcion=f"Crédito id {credito.idCredito} eliminado",
-        fecha=datetime.now(),
+    auditar(
+        session,
+        "Crédito",
+        "ELIMINAR",
+        f"Crédito id {credito.idCredito} eliminado",
+        entidad_id=credito.idCredito,
+        cambios=cambios_eliminacion(credito),
     )
-    session.add(historial)
 
     session.delete(credito)
     session.commit()
@@ -287,21 +447,21 @@ def crear_credito_form(
         descripcion=descripcion,
     )
     session.add(credito)
-    session.commit()
-    session.refresh(credito)
+    session.flush()
 
     # Registrar en historial
-    historial = Historial(
-        entidad="Crédito",
-        accion="CREAR",
-        descripcion=(
+    auditar(
+        session,
+        "Crédito",
+        "CREAR",
+        (
             f"Crédito creado con id {credito.idCredito}, "
             f"monto {credito.monto}, plazo {credito.plazo} meses, "
             f"tipo '{credito.tipo}', para el usuario id {usuario_id}"
         ),
-        fecha=datetime.now(),
+        entidad_id=credito.idCredito,
+        cambios=cambios_creacion(credito),
     )
-    session.add(historial)
     session.commit()
 
     return RedirectResponse(url="/ui/creditos", status_code=status.HTTP_303_SEE_OTHER)
@@ -332,28 +492,26 @@ def actualizar_credito_form(
             detail=f"El usuario con id {usuario_id} no existe",
         )
 
+    antes = instantanea(credito)
     credito.usuario_id = usuario_id
     credito.monto = monto
     credito.plazo = plazo
     credito.tipo = tipo
     credito.descripcion = descripcion
 
-    session.add(credito)
-    session.commit()
-    session.refresh(credito)
-
     # Registrar en historial
-    historial = Historial(
-        entidad="Crédito",
-        accion="ACTUALIZAR",
-        descripcion=(
+    auditar(
+        session,
+        "Crédito",
+        "ACTUALIZAR",
+        (
             f"Crédito id {credito.idCredito} actualizado. "
             f"Monto {credito.monto}, plazo {credito.plazo}, tipo '{credito.tipo}', "
             f"usuario id {credito.usuario_id}"
         ),
-        fecha=datetime.now(),
+        entidad_id=credito.idCredito,
+        cambios=diferencias(antes, instantanea(credito)),
     )
-    session.add(historial)
     session.commit()
 
     return RedirectResponse(url="/ui/creditos", status_code=status.HTTP_303_SEE_OTHER)
\ No newline at end of file
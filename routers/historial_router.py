@@ -3,11 +3,25 @@
 from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
 
-from database import get_session
+from database import get_session, get_session_lectura
 from models.historial import Historial
+from services.actividad import consultar_actividad
+from services.auditoria import ENTIDADES, historial_de
+from services.instantaneas import instantaneas, reconstruir
+from services.eventos import POLITICAS, flujo_historial, hub_historial
+from services.serializacion import a_json, campos_de, respuesta_ligera, respuesta_registro
 
 router = APIRouter(prefix="/historial", tags=["Historial"])
 
@@ -17,13 +31,16 @@ router = APIRouter(prefix="/historial", tags=["Historial"])
 # -----------------------------
 @router.get("/", response_model=List[Historial])
 def listar_historial(
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session_lectura),
     entidad: Optional[str] = Query(
         None, description="Filtrar por entidad (ej: Usuario, Crédito, Interés, etc.)"
     ),
     accion: Optional[str] = Query(
         None, description="Filtrar por acción (CREAR, ACTUALIZAR, ELIMINAR, etc.)"
     ),
+    entidad_id: Optional[int] = Query(
+        None, description="Filtrar por id del registro afectado"
+    ),
     descripcion_contiene: Optional[str] = Query(
         None, description="Texto contenido en la descripción"
     ),
@@ -35,6 +52,11 @@ def listar_historial(
     ),
     limit: int = Query(100, ge=1, le=1000, description="Cantidad máxima de registros"),
     offset: int = Query(0, ge=0, description="Desplazamiento para paginación"),
+    ligero: bool = Query(
+        False,
+        description="Modo rápido: selecciona solo columnas y serializa sin validar cada fila",
+    ),
+    campos: Optional[list] = Depends(campos_de(Historial)),
 ) -> List[Historial]:
     """
     Lista los registros de historial con filtros opcionales:
@@ -52,6 +74,9 @@ def listar_historial(
     if accion:
         query = query.where(Historial.accion == accion)
 
+    if entidad_id is not None:
+        query = query.where(Historial.entidad_id == entidad_id)
+
     if descripcion_contiene:
         query = query.where(Historial.descripcion.contains(descripcion_contiene))
 
@@ -64,21 +89,201 @@ def listar_historial(
     query = query.order_by(Historial.fecha.desc())
     query = query.offset(offset).limit(limit)
 
+    if ligero or campos:
+        return respuesta_ligera(session, query, Historial, campos)
+
     historial = session.exec(query).all()
     return historial
 
 
+# -----------------------------
+# FEED EN VIVO (SSE / WebSocket)
+# -----------------------------
+def _validar_politica(politica: str) -> None:
+    if politica not in POLITICAS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Política desconocida. Use: {', '.join(POLITICAS)}",
+        )
+
+
+@router.get("/stream")
+async def stream_historial(
+    entidad: Optional[str] = Query(None, description="Solo eventos de esta entidad"),
+    accion: Optional[str] = Query(None, description="Solo eventos con esta acción"),
+    desde_id: Optional[int] = Query(
+        None, description="Reanudar después de este idHistorial (alternativa a Last-Event-ID)"
+    ),
+    buffer: int = Query(256, ge=1, le=10_000, description="Eventos en espera por cliente"),
+    politica: str = Query(
+        "antiguos",
+        description="Si el buffer se llena: antiguos (descarta los más viejos), "
+        "recientes (descarta los nuevos) o desconectar",
+    ),
+    last_event_id: Optional[int] = Header(None),
+):
+    """
+    Feed de Server-Sent Events con cada registro de historial nuevo.
+    Al reconectar, el navegador envía Last-Event-ID y el feed continúa
+    desde ahí (del buffer en memoria o, si es muy antiguo, de la BD).
+    """
+    _validar_politica(politica)
+    ultimo_id = last_event_id if last_event_id is not None else desde_id
+    suscriptor = hub_historial.suscribir(entidad, accion, buffer, politica)
+
+    async def eventos():
+        try:
+            yield b"retry: 3000\n\n"
+            async for tipo, dato in flujo_historial(suscriptor, ultimo_id):
+                if tipo == "historial":
+                    yield b"id: %d\nevent: historial\ndata: %s\n\n" % (dato["idHistorial"], a_json(dato))
+                elif tipo == "ping":
+                    yield b": ping\n\n"
+                else:
+                    yield b"event: %s\ndata: %s\n\n" % (tipo.encode(), a_json(dato))
+        finally:
+            hub_historial.desuscribir(suscriptor)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/ws")
+async def ws_historial(
+    websocket: WebSocket,
+    entidad: Optional[str] = None,
+    accion: Optional[str] = None,
+    desde_id: Optional[int] = None,
+    buffer: int = 256,
+    politica: str = "antiguos",
+):
+    """
+    Mismo feed por WebSocket: cada mensaje es un JSON con "tipo"
+    (historial, descartados, ping, cerrado) y "dato".
+    """
+    if politica not in POLITICAS or not 1 <= buffer <= 10_000:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    suscriptor = hub_historial.suscribir(entidad, accion, buffer, politica)
+    try:
+        async for tipo, dato in flujo_historial(suscriptor, desde_id):
+            await websocket.send_text(a_json({"tipo": tipo, "dato": dato}).decode())
+            if tipo == "cerrado":
+                await websocket.close(code=1013)
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hub_historial.desuscribir(suscriptor)
+
+
+# -----------------------------
+# ACTIVIDAD POR INTERVALO (SERIE DE TIEMPO)
+# -----------------------------
+@router.get("/actividad")
+def actividad_historial(
+    session: Session = Depends(get_session_lectura),
+    desde: Optional[datetime] = Query(None, description="Inicio del rango (por defecto, hace 24 horas)"),
+    hasta: Optional[datetime] = Query(None, description="Fin del rango (por defecto, ahora)"),
+    granularidad: str = Query(
+        "auto", description="auto, minuto, hora o dia (auto: la más fina con hasta 500 intervalos)"
+    ),
+    entidad: Optional[str] = Query(None, description="Filtrar por entidad"),
+    accion: Optional[str] = Query(None, description="Filtrar por acción"),
+):
+    """
+    Cantidad de acciones del historial por intervalo, entidad y acción.
+    Se lee de conteos precalculados, no se agrupa la tabla historial.
+    """
+    return consultar_actividad(session, desde, hasta, granularidad, entidad, accion)
+
+
+# -----------------------------
+# INSTANTÁNEAS (RECONSTRUCCIÓN A UNA FECHA)
+# -----------------------------
+@router.get("/instantaneas/estado")
+def estado_instantaneas():
+    """
+    Estado de las instantáneas periódicas: intervalo, última ejecución y
+    cuántas instantáneas guardó por entidad.
+    """
+    return instantaneas.estado()
+
+
+@router.post("/instantaneas")
+def tomar_instantaneas_ahora():
+    """
+    Guarda ya las instantáneas de los registros que cambiaron desde la
+    última corrida (sin esperar al intervalo).
+    """
+    return {"guardadas": instantaneas.ejecutar()}
+
+
+# -----------------------------
+# READ - HISTORIAL DE UN REGISTRO
+# -----------------------------
+@router.get("/{entidad}/{entidad_id}", response_model=List[Historial])
+def historial_de_registro(
+    entidad: str,
+    entidad_id: int,
+    session: Session = Depends(get_session_lectura),
+    limit: int = Query(100, ge=1, le=1000, description="Cantidad máxima de registros"),
+    antes_id: Optional[int] = Query(
+        None, description="Paginación: solo registros con idHistorial menor a este"
+    ),
+) -> List[Historial]:
+    """
+    Historial de un registro (ej: /historial/credito/42), del más reciente
+    al más antiguo, con los cambios por campo. Incluye las operaciones en
+    lote y de relaciones que lo afectaron. Se resuelve con rangos de
+    índice, sin buscar el id en el texto de la descripción.
+    """
+    if entidad not in ENTIDADES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Entidad desconocida. Use: {', '.join(ENTIDADES)}",
+        )
+    return historial_de(session, ENTIDADES[entidad], entidad_id, limit, antes_id)
+
+
+@router.get("/{entidad}/{entidad_id}/en")
+def registro_en_fecha(
+    entidad: str,
+    entidad_id: int,
+    fecha: datetime = Query(..., description="Momento a reconstruir (ISO 8601)"),
+    session: Session = Depends(get_session_lectura),
+):
+    """
+    Cómo estaba un crédito, interés o usuario en `fecha`
+    (ej: /historial/credito/42/en?fecha=2025-03-01T00:00:00). Parte de la
+    última instantánea anterior a la fecha y aplica los cambios del
+    historial registrados después de ella.
+    """
+    return reconstruir(session, entidad, entidad_id, fecha)
+
+
 # -----------------------------
 # READ - OBTENER POR ID
 # -----------------------------
 @router.get("/{historial_id}", response_model=Historial)
 def obtener_historial(
     historial_id: int,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_session_lectura),
+    campos: Optional[list] = Depends(campos_de(Historial)),
 ) -> Historial:
     """
     Obtiene un registro de historial por su id.
     """
+    if campos:
+        return respuesta_registro(
+            session, Historial, historial_id, campos, "Registro de historial no encontrado"
+        )
+
     registro = session.get(Historial, historial_id)
     if not registro:
         raise HTTPException(status_code=404, detail="Registro de historial no encontrado")
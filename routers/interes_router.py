@@ -1,16 +1,26 @@
 # routers/interes_router.py
 
-from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException, Depends, Query, Form, status
+from fastapi import APIRouter, HTTPException, Depends, Query, Form, status, Request, Response
 from fastapi.responses import RedirectResponse
 from sqlmodel import Session, select
 
-from database import get_session
+from database import get_session, get_session_lectura
 from models.interes import Interes
+from models.lote import ActualizarInteresesLote, FiltroIntereses, LoteIds
 from models.credito import Credito
-from models.historial import Historial
+from services.auditoria import auditar, cambios_creacion, cambios_eliminacion, diferencias, instantanea
+from services.lotes import actualizar_lote, auditar_lote, condiciones_lote, eliminar_lote
+from services.recalculo import recalculo
+from services.serializacion import campos_de, respuesta_ligera, respuesta_lote, respuesta_registro
+from services.versiones import (
+    etag_coleccion,
+    etag_de,
+    etag_registro,
+    respuesta_no_modificado,
+    verificar_if_match,
+)
 
 router = APIRouter(prefix="/intereses", tags=["Intereses"])
 
@@ -35,20 +45,22 @@ def crear_interes(
 
     interes = Interes(tasa=tasa, tipo=tipo, credito_id=credito_id)
     session.add(interes)
-    session.commit()
-    session.refresh(interes)
-
-    h = Historial(
-        entidad="Interés",
-        accion="CREAR",
-        descripcion=(
+    session.flush()
+
+    # El historial va en la misma transacción que el alta
+    auditar(
+        session,
+        "Interés",
+        "CREAR",
+        (
             f"Interés creado para crédito {credito_id} "
             f"(tasa={tasa}, tipo='{tipo}')"
         ),
-        fecha=datetime.now(),
+        entidad_id=interes.idInteres,
+        cambios=cambios_creacion(interes),
     )
-    session.add(h)
     session.commit()
+    session.refresh(interes)
 
     return interes
 
@@ -58,7 +70,9 @@ def crear_interes(
 # -----------------------------
 @router.get("/", response_model=List[Interes])
 def listar_intereses(
-    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_session_lectura),
     credito_id: Optional[int] = Query(
         None, description="Filtrar por id de crédito"
     ),
@@ -71,6 +85,11 @@ def listar_intereses(
     tasa_max: Optional[float] = Query(
         None, description="Filtrar por tasa máxima"
     ),
+    ligero: bool = Query(
+        False,
+        description="Modo rápido: selecciona solo columnas y serializa sin validar cada fila",
+    ),
+    campos: Optional[list] = Depends(campos_de(Interes)),
 ) -> List[Interes]:
     """
     Lista todos los intereses, con filtros opcionales:
@@ -92,27 +111,127 @@ def listar_intereses(
     if tasa_max is not None:
         query = query.where(Interes.tasa <= tasa_max)
 
+    etag = etag_coleccion(session, request, query, Interes)
+    no_modificado = respuesta_no_modificado(request, etag)
+    if no_modificado is not None:
+        return no_modificado
+    response.headers["ETag"] = etag
+
+    if ligero or campos:
+        return respuesta_ligera(session, query, Interes, campos, headers={"ETag": etag})
+
     intereses = session.exec(query).all()
     return intereses
 
 
+# -----------------------------
+# READ - OBTENER VARIOS POR ID (API JSON)
+# -----------------------------
+@router.post("/batch-get")
+def obtener_intereses_por_ids(
+    lote: LoteIds,
+    session: Session = Depends(get_session_lectura),
+    campos: Optional[list] = Depends(campos_de(Interes)),
+):
+    """
+    Obtiene varios intereses en una sola consulta (`{"ids": [1, 2, 3]}`).
+    Responde `{"encontrados": {id: interes}, "faltantes": [ids]}`.
+    """
+    return respuesta_lote(session, Interes, lote.ids, campos)
+
+
 # -----------------------------
 # READ - OBTENER POR ID (API JSON)
 # -----------------------------
 @router.get("/{interes_id}", response_model=Interes)
 def obtener_interes(
     interes_id: int,
-    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_session_lectura),
+    campos: Optional[list] = Depends(campos_de(Interes)),
 ) -> Interes:
     """
     Obtiene un interés por su id.
     """
+    etag = etag_registro(session, request, Interes, interes_id, "Interés no encontrado")
+    no_modificado = respuesta_no_modificado(request, etag)
+    if no_modificado is not None:
+        return no_modificado
+    response.headers["ETag"] = etag
+
+    if campos:
+        return respuesta_registro(
+            session, Interes, interes_id, campos, "Interés no encontrado", headers={"ETag": etag}
+        )
+
     interes = session.get(Interes, interes_id)
     if not interes:
         raise HTTPException(status_code=404, detail="Interés no encontrado")
     return interes
 
 
+# -----------------------------
+# UPDATE / DELETE EN LOTE (API JSON)
+# -----------------------------
+def _condiciones_intereses(filtro: FiltroIntereses) -> list:
+    condiciones = []
+    if filtro.credito_id is not None:
+        condiciones.append(Interes.credito_id == filtro.credito_id)
+    if filtro.tipo:
+        condiciones.append(Interes.tipo == filtro.tipo)
+    if filtro.tasa_min is not None:
+        condiciones.append(Interes.tasa >= filtro.tasa_min)
+    if filtro.tasa_max is not None:
+        condiciones.append(Interes.tasa <= filtro.tasa_max)
+    return condiciones_lote(Interes, filtro.ids, condiciones)
+
+
+@router.patch("/lote")
+def actualizar_intereses_lote(
+    lote: ActualizarInteresesLote,
+    session: Session = Depends(get_session),
+):
+    """
+    Aplica los mismos cambios a todos los intereses del filtro con un solo
+    UPDATE y deja un resumen en el historial (una sola transacción).
+    Si cambia la tasa, las simulaciones afectadas se recalculan en
+    segundo plano.
+    """
+    valores = lote.cambios.model_dump(exclude_none=True)
+    if "credito_id" in valores and not session.get(Credito, valores["credito_id"]):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Crédito con id {valores['credito_id']} no encontrado",
+        )
+
+    ids = actualizar_lote(session, Interes, _condiciones_intereses(lote.filtro), valores)
+    if ids:
+        auditar_lote(session, "Interés", "ACTUALIZAR_LOTE", "intereses", ids, valores)
+    if "tasa" in valores:
+        recalculo.encolar(session, ids)
+    session.commit()
+
+    return {"actualizados": len(ids)}
+
+
+@router.delete("/lote")
+def eliminar_intereses_lote(
+    filtro: FiltroIntereses,
+    session: Session = Depends(get_session),
+):
+    """
+    Elimina todos los intereses del filtro con un solo DELETE y deja un
+    resumen en el historial.
+    """
+    ids = eliminar_lote(session, Interes, _condiciones_intereses(filtro))
+    if ids:
+        auditar_lote(session, "Interés", "ELIMINAR_LOTE", "intereses", ids)
+    session.commit()
+
+    return {"eliminados": len(ids)}
+
+
 # -----------------------------
 # UPDATE COMPLETO (PUT, API JSON)
 # -----------------------------
@@ -121,6 +240,8 @@ def actualizar_interes(
     interes_id: int,
     tasa: float,
     tipo: str,
+    request: Request,
+    response: Response,
     credito_id: Optional[int] = None,
     session: Session = Depends(get_session),
 ) -> Interes:
@@ -131,6 +252,8 @@ def actualizar_interes(
     interes = session.get(Interes, interes_id)
     if not interes:
         raise HTTPException(status_code=404, detail="Interés no encontrado")
+    verificar_if_match(session, request, interes)
+    antes = instantanea(interes)
 
     if credito_id is not None:
         credito = session.get(Credito, credito_id)
@@ -141,24 +264,28 @@ def actualizar_interes(
             )
         interes.credito_id = credito_id
 
+    tasa_cambio = interes.tasa != tasa
     interes.tasa = tasa
     interes.tipo = tipo
 
-    session.commit()
-    session.refresh(interes)
-
-    h = Historial(
-        entidad="Interés",
-        accion="ACTUALIZAR",
-        descripcion=(
+    auditar(
+        session,
+        "Interés",
+        "ACTUALIZAR",
+        (
             f"Interés {interes_id} actualizado "
             f"(tasa={tasa}, tipo='{tipo}', credito_id={interes.credito_id})"
         ),
-        fecha=datetime.now(),
+        entidad_id=interes_id,
+        cambios=diferencias(antes, instantanea(interes)),
     )
-    session.add(h)
+    # Las simulaciones de este interés se recalculan en segundo plano
+    if tasa_cambio:
+        recalculo.encolar(session, [interes_id])
     session.commit()
+    session.refresh(interes)
 
+    response.headers["ETag"] = etag_de(interes)
     return interes
 
 
@@ -168,6 +295,8 @@ def actualizar_interes(
 @router.patch("/{interes_id}", response_model=Interes)
 def actualizar_interes_parcial(
     interes_id: int,
+    request: Request,
+    response: Response,
     tasa: Optional[float] = None,
     tipo: Optional[str] = None,
     credito_id: Optional[int] = None,
@@ -179,10 +308,12 @@ def actualizar_interes_parcial(
     interes = session.get(Interes, interes_id)
     if not interes:
         raise HTTPException(status_code=404, detail="Interés no encontrado")
+    verificar_if_match(session, request, interes)
 
+    antes = instantanea(interes)
     cambios = []
 
-    if tasa is not None:
+    if tasa is not None and tasa != interes.tasa:
         interes.tasa = tasa
         cambios.append("tasa")
 
@@ -201,22 +332,24 @@ def actualizar_interes_parcial(
         cambios.append("credito_id")
 
     if cambios:
-        session.commit()
-        session.refresh(interes)
-
         detalle_cambios = ", ".join(cambios)
-        h = Historial(
-            entidad="Interés",
-            accion="ACTUALIZAR_PARCIAL",
-            descripcion=(
+        auditar(
+            session,
+            "Interés",
+            "ACTUALIZAR_PARCIAL",
+            (
                 f"Interés {interes_id} actualizado parcialmente. "
                 f"Campos modificados: {detalle_cambios}"
             ),
-            fecha=datetime.now(),
+            entidad_id=interes_id,
+            cambios=diferencias(antes, instantanea(interes)),
         )
-        session.add(h)
+        if "tasa" in cambios:
+            recalculo.encolar(session, [interes_id])
         session.commit()
+        session.refresh(interes)
 
+    response.headers["ETag"] = etag_de(interes)
     return interes
 
 
@@ -235,13 +368,14 @@ def eliminar_interes(
     if not interes:
         raise HTTPException(status_code=404, detail="Interés no encontrado")
 
-    h = Historial(
-        entidad="Interés",
-        accion="ELIMINAR",
-        descripcion=f"Interés {interes_id} eliminado",
-        fecha=datetime.now(),
+    auditar(
+        session,
+        "Interés",
+        "ELIMINAR",
+        f"Interés {interes_id} eliminado",
+        entidad_id=interes_id,
+        cambios=cambios_eliminacion(interes),
     )
-    session.add(h)
     session.delete(interes)
     session.commit()
 
@@ -299,19 +433,19 @@ def crear_interes_form(
         credito_id=credito_id,
     )
     session.add(interes)
-    session.commit()
-    session.refresh(interes)
+    session.flush()
 
-    h = Historial(
-        entidad="Interés",
-        accion="CREAR",
-        descripcion=(
+    auditar(
+        session,
+        "Interés",
+        "CREAR",
+        (
             f"Interés creado para crédito {credito_id} "
             f"(tasa={tasa_val}, tipo='{tipo.strip()}')"
         ),
-        fecha=datetime.now(),
+        entidad_id=interes.idInteres,
+        cambios=cambios_creacion(interes),
     )
-    session.add(h)
     session.commit()
 
     return RedirectResponse(url="/ui/intereses", status_code=status.HTTP_303_SEE_OTHER)
@@ -360,24 +494,25 @@ def actualizar_interes_form(
             detail="El tipo de interés es obligatorio",
         )
 
+    antes = instantanea(interes)
+    tasa_cambio = interes.tasa != tasa_val
     interes.tasa = tasa_val
     interes.tipo = tipo.strip()
     interes.credito_id = credito_id
 
-    session.add(interes)
-    session.commit()
-    session.refresh(interes)
-
-    h = Historial(
-        entidad="Interés",
-        accion="ACTUALIZAR",
-        descripcion=(
+    auditar(
+        session,
+        "Interés",
+        "ACTUALIZAR",
+        (
             f"Interés {idInteres} actualizado "
             f"(tasa={tasa_val}, tipo='{interes.tipo}', credito_id={interes.credito_id})"
         ),
-        fecha=datetime.now(),
+        entidad_id=idInteres,
+        cambios=diferencias(antes, instantanea(interes)),
     )
-    session.add(h)
+    if tasa_cambio:
+        recalculo.encolar(session, [idInteres])
     session.commit()
 
     return RedirectResponse(url="/ui/intereses", status_code=status.HTTP_303_SEE_OTHER)
\ No newline at end of file
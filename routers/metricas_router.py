@@ -0,0 +1,19 @@
+# routers/metricas_router.py
+
+from fastapi import APIRouter
+
+from services.metricas import metricas
+
+router = APIRouter(prefix="/metricas", tags=["Métricas"])
+
+
+# -----------------------------
+# READ - MÉTRICAS DEL PROCESO
+# -----------------------------
+@router.get("/")
+def obtener_metricas():
+    """
+    Devuelve las métricas internas del proceso (compresión, colas, cachés...)
+    con el formato {nombre: {etiquetas: valor}}.
+    """
+    return metricas.instantanea()
@@ -3,15 +3,28 @@
 from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
 from sqlmodel import Session, select
 
-from database import get_session
+from database import engine, get_session, get_session_lectura
 from models.reporte import Reporte
+from models.lote import LoteIds
 from models.usuario import Usuario
 from models.credito import Credito
 from models.simulacion import Simulacion
-from models.historial import Historial
+from services.auditoria import auditar, cambios_creacion, cambios_eliminacion, diferencias, instantanea
+from services.documentos import FORMATOS
+from services.reportes import datos_reporte, generador_documentos
+from services.serializacion import campos_de, respuesta_ligera, respuesta_lote, respuesta_registro
+from services.versiones import (
+    etag_coleccion,
+    etag_de,
+    etag_registro,
+    respuesta_no_modificado,
+    verificar_if_match,
+)
 
 router = APIRouter(prefix="/reportes", tags=["Reportes"])
 
@@ -79,21 +92,23 @@ def crear_reporte(
         reporte.fecha = datetime.now()
 
     session.add(reporte)
-    session.commit()
-    session.refresh(reporte)
+    session.flush()
 
-    historial = Historial(
-        entidad="Reporte",
-        accion="CREAR",
-        descripcion=(
+    # El historial va en la misma transacción que el alta
+    auditar(
+        session,
+        "Reporte",
+        "CREAR",
+        (
             f"Reporte '{reporte.titulo}' creado con id {reporte.idReporte}. "
             f"Usuario_id={reporte.usuario_id}, Credito_id={reporte.credito_id}, "
             f"Simulacion_id={reporte.simulacion_id}"
         ),
-        fecha=datetime.now(),
+        entidad_id=reporte.idReporte,
+        cambios=cambios_creacion(reporte),
     )
-    session.add(historial)
     session.commit()
+    session.refresh(reporte)
 
     return reporte
 
@@ -103,7 +118,9 @@ def crear_reporte(
 # -----------------------------
 @router.get("/", response_model=List[Reporte])
 def listar_reportes(
-    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_session_lectura),
     usuario_id: Optional[int] = Query(
         None, description="Filtrar por id de usuario asociado"
     ),
@@ -122,6 +139,11 @@ def listar_reportes(
     titulo_contiene: Optional[str] = Query(
         None, description="Filtrar por texto contenido en el título"
     ),
+    ligero: bool = Query(
+        False,
+        description="Modo rápido: selecciona solo columnas y serializa sin validar cada fila",
+    ),
+    campos: Optional[list] = Depends(campos_de(Reporte)),
 ) -> List[Reporte]:
     """
     Lista reportes con múltiples filtros opcionales:
@@ -149,27 +171,109 @@ def listar_reportes(
     if titulo_contiene:
         query = query.where(Reporte.titulo.contains(titulo_contiene))
 
+    etag = etag_coleccion(session, request, query, Reporte)
+    no_modificado = respuesta_no_modificado(request, etag)
+    if no_modificado is not None:
+        return no_modificado
+    response.headers["ETag"] = etag
+
+    if ligero or campos:
+        return respuesta_ligera(session, query, Reporte, campos, headers={"ETag": etag})
+
     reportes = session.exec(query).all()
     return reportes
 
 
+# -----------------------------
+# READ - OBTENER VARIOS POR ID (API JSON)
+# -----------------------------
+@router.post("/batch-get")
+def obtener_reportes_por_ids(
+    lote: LoteIds,
+    session: Session = Depends(get_session_lectura),
+    campos: Optional[list] = Depends(campos_de(Reporte)),
+):
+    """
+    Obtiene varios reportes en una sola consulta (`{"ids": [1, 2, 3]}`).
+    Responde `{"encontrados": {id: reporte}, "faltantes": [ids]}`.
+    """
+    return respuesta_lote(session, Reporte, lote.ids, campos)
+
+
 # -----------------------------
 # READ - OBTENER POR ID
 # -----------------------------
 @router.get("/{reporte_id}", response_model=Reporte)
 def obtener_reporte(
     reporte_id: int,
-    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_session_lectura),
+    campos: Optional[list] = Depends(campos_de(Reporte)),
 ) -> Reporte:
     """
     Obtiene un reporte por su id.
     """
+    etag = etag_registro(session, request, Reporte, reporte_id, "Reporte no encontrado")
+    no_modificado = respuesta_no_modificado(request, etag)
+    if no_modificado is not None:
+        return no_modificado
+    response.headers["ETag"] = etag
+
+    if campos:
+        return respuesta_registro(
+            session, Reporte, reporte_id, campos, "Reporte no encontrado", headers={"ETag": etag}
+        )
+
     reporte = session.get(Reporte, reporte_id)
     if not reporte:
         raise HTTPException(status_code=404, detail="Reporte no encontrado")
     return reporte
 
 
+# -----------------------------
+# READ - DOCUMENTO (PDF / XLSX)
+# -----------------------------
+def _leer_datos_reporte(reporte_id: int) -> dict:
+    with Session(engine) as session:
+        return datos_reporte(session, reporte_id)
+
+
+@router.get("/{reporte_id}/documento")
+async def descargar_documento_reporte(
+    reporte_id: int,
+    request: Request,
+    formato: str = Query("pdf", description="pdf o xlsx"),
+):
+    """
+    Documento del reporte con datos del usuario, condiciones del crédito,
+    interés, simulación y tabla de amortización.
+
+    El render corre en un pool de procesos, fuera del event loop, y se
+    guarda por hash de los datos: solo se regenera cuando cambian el
+    crédito, el interés o la simulación (o los datos del reporte).
+    """
+    if formato not in FORMATOS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Formato no soportado. Use: {', '.join(FORMATOS)}",
+        )
+
+    datos = await run_in_threadpool(_leer_datos_reporte, reporte_id)
+    ruta, huella = await generador_documentos.obtener(datos, formato)
+
+    etag = f'"{huella}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    return FileResponse(
+        ruta,
+        media_type=FORMATOS[formato],
+        filename=f"reporte_{reporte_id}.{formato}",
+        headers={"ETag": etag, "Cache-Control": "private, no-cache"},
+    )
+
+
 # -----------------------------
 # UPDATE COMPLETO (PUT)
 # -----------------------------
@@ -177,6 +281,8 @@ def obtener_reporte(
 def actualizar_reporte(
     reporte_id: int,
     datos: Reporte,
+    request: Request,
+    response: Response,
     session: Session = Depends(get_session),
 ) -> Reporte:
     """
@@ -185,6 +291,7 @@ def actualizar_reporte(
     reporte = session.get(Reporte, reporte_id)
     if not reporte:
         raise HTTPException(status_code=404, detail="Reporte no encontrado")
+    verificar_if_match(session, request, reporte)
 
     _validar_relaciones_reporte(
         session,
@@ -193,6 +300,7 @@ def actualizar_reporte(
         simulacion_id=datos.simulacion_id,
     )
 
+    antes = instantanea(reporte)
     reporte.titulo = datos.titulo
     reporte.descripcion = datos.descripcion
     reporte.fecha = datos.fecha or reporte.fecha
@@ -200,24 +308,24 @@ def actualizar_reporte(
     reporte.credito_id = datos.credito_id
     reporte.simulacion_id = datos.simulacion_id
 
-    session.commit()
-    session.refresh(reporte)
-
-    historial = Historial(
-        entidad="Reporte",
-        accion="ACTUALIZAR",
-        descripcion=(
+    auditar(
+        session,
+        "Reporte",
+        "ACTUALIZAR",
+        (
             f"Reporte id {reporte.idReporte} actualizado. "
             f"Titulo='{reporte.titulo}', fecha={reporte.fecha}, "
             f"Usuario_id={reporte.usuario_id}, "
             f"Credito_id={reporte.credito_id}, "
             f"Simulacion_id={reporte.simulacion_id}"
         ),
-        fecha=datetime.now(),
+        entidad_id=reporte.idReporte,
+        cambios=diferencias(antes, instantanea(reporte)),
     )
-    session.add(historial)
     session.commit()
+    session.refresh(reporte)
 
+    response.headers["ETag"] = etag_de(reporte)
     return reporte
 
 
@@ -227,6 +335,8 @@ def actualizar_reporte(
 @router.patch("/{reporte_id}", response_model=Reporte)
 def actualizar_reporte_parcial(
     reporte_id: int,
+    request: Request,
+    response: Response,
     titulo: Optional[str] = None,
     descripcion: Optional[str] = None,
     fecha: Optional[datetime] = None,
@@ -241,6 +351,7 @@ def actualizar_reporte_parcial(
     reporte = session.get(Reporte, reporte_id)
     if not reporte:
         raise HTTPException(status_code=404, detail="Reporte no encontrado")
+    verificar_if_match(session, request, reporte)
 
     # Validar relaciones solo si vienen nuevas
     _validar_relaciones_reporte(
@@ -252,6 +363,7 @@ def actualizar_reporte_parcial(
         ),
     )
 
+    antes = instantanea(reporte)
     cambios = []
 
     if titulo is not None:
@@ -279,22 +391,22 @@ def actualizar_reporte_parcial(
         cambios.append("simulacion_id")
 
     if cambios:
-        session.commit()
-        session.refresh(reporte)
-
         detalle_cambios = ", ".join(cambios)
-        historial = Historial(
-            entidad="Reporte",
-            accion="ACTUALIZAR_PARCIAL",
-            descripcion=(
+        auditar(
+            session,
+            "Reporte",
+            "ACTUALIZAR_PARCIAL",
+            (
                 f"Reporte id {reporte.idReporte} actualizado parcialmente. "
                 f"Campos modificados: {detalle_cambios}"
             ),
-            fecha=datetime.now(),
+            entidad_id=reporte.idReporte,
+            cambios=diferencias(antes, instantanea(reporte)),
         )
-        session.add(historial)
         session.commit()
+        session.refresh(reporte)
 
+    response.headers["ETag"] = etag_de(reporte)
     return reporte
 
 
@@ -313,13 +425,14 @@ def eliminar_reporte(
     if not reporte:
         raise HTTPException(status_code=404, detail="Reporte no encontrado")
 
-    historial = Historial(
-        entidad="Reporte",
-        accion="ELIMINAR",
-        descripcion=f"Reporte '{reporte.titulo}' (id {reporte.idReporte}) eliminado",
-        fecha=datetime.now(),
+    auditar(
+        session,
+        "Reporte",
+        "ELIMINAR",
+        f"Reporte '{reporte.titulo}' (id {reporte.idReporte}) eliminado",
+        entidad_id=reporte.idReporte,
+        cambios=cambios_eliminacion(reporte),
     )
-    session.add(historial)
     session.delete(reporte)
     session.commit()
 
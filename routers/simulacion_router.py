@@ -1,15 +1,34 @@
 # routers/simulacion_router.py
 
-from datetime import datetime
+import time
 from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
 
-from database import get_session
+from database import get_session, get_session_lectura
 from models.simulacion import Simulacion
+from models.lote import ActualizarSimulacionesLote, FiltroSimulaciones, LoteIds
 from models.interes import Interes
-from models.historial import Historial
+from models.escenario import EscenariosResultado, EscenariosSolicitud
+from models.montecarlo import MonteCarloResultado, MonteCarloSolicitud
+from services.auditoria import auditar, cambios_creacion, cambios_eliminacion, diferencias, instantanea
+from services.computo import EJECUCIONES
+from services.escenarios import evaluar_escenarios
+from services.estres import CHOQUES_POR_DEFECTO, estres_portafolio
+from services.montecarlo import percentiles_validos, simular_credito
+from services.memo_amortizacion import memo_amortizacion
+from services.recalculo import recalculo
+from services.lotes import actualizar_lote, auditar_lote, condiciones_lote, eliminar_lote
+from services.serializacion import campos_de, respuesta_ligera, respuesta_lote, respuesta_registro
+from services.versiones import (
+    etag_coleccion,
+    etag_de,
+    etag_registro,
+    respuesta_no_modificado,
+    verificar_if_match,
+)
 
 router = APIRouter(prefix="/simulaciones", tags=["Simulaciones"])
 
@@ -34,23 +53,25 @@ def crear_simulacion(
         )
 
     session.add(simulacion)
-    session.commit()
-    session.refresh(simulacion)
-
-    historial = Historial(
-        entidad="Simulación",
-        accion="CREAR",
-        descripcion=(
+    session.flush()
+
+    # El historial va en la misma transacción que el alta
+    auditar(
+        session,
+        "Simulación",
+        "CREAR",
+        (
             f"Simulación {simulacion.idSimulacion} creada "
             f"(cuotaMensual={simulacion.cuotaMensual}, "
             f"interesTotal={simulacion.interesTotal}, "
             f"saldoFinal={simulacion.saldoFinal}, "
             f"interes_id={simulacion.interes_id})"
         ),
-        fecha=datetime.now(),
+        entidad_id=simulacion.idSimulacion,
+        cambios=cambios_creacion(simulacion),
     )
-    session.add(historial)
     session.commit()
+    session.refresh(simulacion)
 
     return simulacion
 
@@ -60,7 +81,9 @@ def crear_simulacion(
 # -----------------------------
 @router.get("/", response_model=List[Simulacion])
 def listar_simulaciones(
-    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_session_lectura),
     interes_id: Optional[int] = Query(
         None, description="Filtrar por id de interés"
     ),
@@ -70,6 +93,11 @@ def listar_simulaciones(
     cuota_max: Optional[float] = Query(
         None, description="Filtrar por cuota mensual máxima"
     ),
+    ligero: bool = Query(
+        False,
+        description="Modo rápido: selecciona solo columnas y serializa sin validar cada fila",
+    ),
+    campos: Optional[list] = Depends(campos_de(Simulacion)),
 ) -> List[Simulacion]:
     """
     Lista todas las simulaciones, con filtros opcionales por:
@@ -87,27 +115,319 @@ def listar_simulaciones(
     if cuota_max is not None:
         query = query.where(Simulacion.cuotaMensual <= cuota_max)
 
+    etag = etag_coleccion(session, request, query, Simulacion)
+    no_modificado = respuesta_no_modificado(request, etag)
+    if no_modificado is not None:
+        return no_modificado
+    response.headers["ETag"] = etag
+
+    if ligero or campos:
+        return respuesta_ligera(session, query, Simulacion, campos, headers={"ETag": etag})
+
     simulaciones = session.exec(query).all()
     return simulaciones
 
 
+# -----------------------------
+# ESTADO DEL RECÁLCULO
+# -----------------------------
+@router.get("/recalculo/estado")
+def estado_recalculo():
+    """
+    Estado del recálculo en segundo plano de simulaciones por cambios de tasa:
+    intereses pendientes, atraso (lag) del cambio más antiguo sin aplicar
+    y resultado de la última ejecución.
+    """
+    return recalculo.estado()
+
+
+@router.get("/memo/estado")
+def estado_memo_amortizacion():
+    """
+    Estado de la memoización de amortizaciones: entradas, bytes usados del
+    presupuesto, aciertos (memoria / disco), cálculos y tasa de aciertos.
+    """
+    return memo_amortizacion.estado()
+
+
+# -----------------------------
+# MONTE CARLO (TASA VARIABLE)
+# -----------------------------
+@router.post("/montecarlo", response_model=MonteCarloResultado)
+def simular_montecarlo(
+    solicitud: MonteCarloSolicitud,
+    session: Session = Depends(get_session_lectura),
+) -> MonteCarloResultado:
+    """
+    Distribución de pagos de un crédito a tasa variable: genera miles de
+    trayectorias de tasa con reversión a la media y recalcula la cuota mes
+    a mes en cada una. Devuelve percentiles de cuota e interés total y la
+    frecuencia con que la cuota supera el margen (ingresos - gastos).
+
+    Con `interes_id` toma el crédito, la tasa y el usuario asociados; los
+    valores enviados en el cuerpo reemplazan a los de la BD. Las tasas de
+    tipo "Fijo" no varían (volatilidad 0). Con `"ejecucion": "pool"` las
+    trayectorias se reparten en el pool de procesos (mismo resultado).
+    """
+    monto, plazo, tasa, margen = solicitud.monto, solicitud.plazo, solicitud.tasa, solicitud.margen
+    volatilidad = solicitud.volatilidad
+    tipo_tasa = None
+
+    if solicitud.interes_id is not None:
+        interes = session.get(Interes, solicitud.interes_id)
+        if not interes:
+            raise HTTPException(
+                status_code=404,
+                detail=f"El interés con id {solicitud.interes_id} no existe",
+            )
+        credito = interes.credito
+        tipo_tasa = interes.tipo
+        tasa = interes.tasa if tasa is None else tasa
+        if credito is not None:
+            monto = credito.monto if monto is None else monto
+            plazo = credito.plazo if plazo is None else plazo
+            if margen is None and credito.usuario is not None:
+                margen = credito.usuario.ingresos - credito.usuario.gastos
+        if tipo_tasa.strip().lower() == "fijo":
+            volatilidad = 0.0
+
+    if monto is None or plazo is None or tasa is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Se requiere interes_id o los valores monto, plazo y tasa",
+        )
+    try:
+        percentiles = percentiles_validos(solicitud.percentiles)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if solicitud.ejecucion not in EJECUCIONES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Ejecución desconocida. Use: {', '.join(EJECUCIONES)}",
+        )
+
+    inicio = time.perf_counter()
+    resultado = simular_credito(
+        monto=monto,
+        plazo=plazo,
+        tasa=tasa,
+        margen=margen,
+        trayectorias=solicitud.trayectorias,
+        reversion=solicitud.reversion,
+        tasa_largo_plazo=solicitud.tasa_largo_plazo,
+        volatilidad=volatilidad,
+        tasa_minima=solicitud.tasa_minima,
+        percentiles=percentiles,
+        semilla=solicitud.semilla,
+        ejecucion=solicitud.ejecucion,
+    )
+    return MonteCarloResultado(
+        interes_id=solicitud.interes_id,
+        tipo_tasa=tipo_tasa,
+        ejecucion=solicitud.ejecucion,
+        duracion_ms=round((time.perf_counter() - inicio) * 1000, 1),
+        **resultado,
+    )
+
+
+# -----------------------------
+# PRUEBA DE ESTRÉS DE TASA (PORTAFOLIO)
+# -----------------------------
+@router.get("/estres")
+def estres_tasas(
+    session: Session = Depends(get_session_lectura),
+    choques: Optional[str] = Query(
+        None,
+        description="Choques en puntos básicos sobre la tasa anual, separados por coma "
+        "(por defecto -300,-200,-100,100,200,300)",
+    ),
+    lote: int = Query(5000, ge=100, le=50_000, description="Créditos por lote del cursor"),
+):
+    """
+    Aplica choques de tasa a todos los créditos (con su interés vigente) y
+    transmite NDJSON: una línea por usuario con cuota, interés total y
+    carga (cuotas / ingresos) en cada escenario, y al final los agregados
+    por tipo de crédito, categoría y segmento de ingresos, con la cantidad
+    de usuarios cuya cuota supera ingresos - gastos.
+    """
+    if choques:
+        try:
+            choques_pb = [int(c) for c in choques.split(",") if c.strip()]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="choques debe ser una lista de enteros")
+        if any(abs(c) > 10_000 for c in choques_pb):
+            raise HTTPException(status_code=400, detail="Cada choque debe estar entre -10000 y 10000 pb")
+    else:
+        choques_pb = list(CHOQUES_POR_DEFECTO)
+
+    # El recorrido abre su propia sesión (la del request se cierra antes
+    # de transmitir), sobre el mismo destino: réplica o principal
+    return StreamingResponse(
+        estres_portafolio(session.get_bind(), choques_pb, lote),
+        media_type="application/x-ndjson",
+    )
+
+
+# -----------------------------
+# READ - OBTENER VARIOS POR ID (API JSON)
+# -----------------------------
+@router.post("/batch-get")
+def obtener_simulaciones_por_ids(
+    lote: LoteIds,
+    session: Session = Depends(get_session_lectura),
+    campos: Optional[list] = Depends(campos_de(Simulacion)),
+):
+    """
+    Obtiene varios simulaciones en una sola consulta (`{"ids": [1, 2, 3]}`).
+    Responde `{"encontrados": {id: simulacion}, "faltantes": [ids]}`.
+    """
+    return respuesta_lote(session, Simulacion, lote.ids, campos)
+
+
 # -----------------------------
 # READ - OBTENER POR ID
 # -----------------------------
 @router.get("/{simulacion_id}", response_model=Simulacion)
 def obtener_simulacion(
     simulacion_id: int,
-    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_session_lectura),
+    campos: Optional[list] = Depends(campos_de(Simulacion)),
 ) -> Simulacion:
     """
     Obtiene una simulación por su id.
     """
+    etag = etag_registro(session, request, Simulacion, simulacion_id, "Simulación no encontrada")
+    no_modificado = respuesta_no_modificado(request, etag)
+    if no_modificado is not None:
+        return no_modificado
+    response.headers["ETag"] = etag
+
+    if campos:
+        return respuesta_registro(
+            session, Simulacion, simulacion_id, campos, "Simulación no encontrada", headers={"ETag": etag}
+        )
+
     simulacion = session.get(Simulacion, simulacion_id)
     if not simulacion:
         raise HTTPException(status_code=404, detail="Simulación no encontrada")
     return simulacion
 
 
+# -----------------------------
+# ESCENARIOS (ABONOS, GRACIA, REFINANCIACIÓN)
+# -----------------------------
+@router.post("/{simulacion_id}/escenarios", response_model=EscenariosResultado)
+def simular_escenarios(
+    simulacion_id: int,
+    solicitud: EscenariosSolicitud,
+    session: Session = Depends(get_session_lectura),
+) -> EscenariosResultado:
+    """
+    Compara escenarios contra el cronograma base de la simulación (monto y
+    plazo del crédito, tasa del interés). Cada escenario es una lista de
+    eventos:
+    - abono: pago extra en un mes (sin monto = pago total), reduciendo
+      plazo o cuota;
+    - gracia: meses sin pagar (total, el interés se capitaliza) o pagando
+      solo intereses;
+    - refinanciacion: nueva tasa y, opcionalmente, nuevo plazo y costo.
+
+    El cronograma base se calcula una vez; por escenario se devuelve su
+    resumen y la diferencia contra la base.
+    """
+    simulacion = session.get(Simulacion, simulacion_id)
+    if not simulacion:
+        raise HTTPException(status_code=404, detail="Simulación no encontrada")
+    interes = simulacion.interes
+    credito = interes.credito if interes else None
+    if credito is None:
+        raise HTTPException(
+            status_code=409,
+            detail="La simulación no tiene un crédito asociado para armar el cronograma",
+        )
+
+    try:
+        resultado = evaluar_escenarios(
+            credito.monto,
+            credito.plazo,
+            interes.tasa,
+            [escenario.model_dump() for escenario in solicitud.escenarios],
+            incluir_tabla=solicitud.incluir_tabla,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return EscenariosResultado(
+        simulacion_id=simulacion_id,
+        monto=credito.monto,
+        plazo=credito.plazo,
+        tasa=interes.tasa,
+        simulacion={
+            "cuotaMensual": simulacion.cuotaMensual,
+            "interesTotal": simulacion.interesTotal,
+            "saldoFinal": simulacion.saldoFinal,
+        },
+        **resultado,
+    )
+
+
+# -----------------------------
+# UPDATE / DELETE EN LOTE
+# -----------------------------
+def _condiciones_simulaciones(filtro: FiltroSimulaciones) -> list:
+    condiciones = []
+    if filtro.interes_id is not None:
+        condiciones.append(Simulacion.interes_id == filtro.interes_id)
+    if filtro.cuota_min is not None:
+        condiciones.append(Simulacion.cuotaMensual >= filtro.cuota_min)
+    if filtro.cuota_max is not None:
+        condiciones.append(Simulacion.cuotaMensual <= filtro.cuota_max)
+    return condiciones_lote(Simulacion, filtro.ids, condiciones)
+
+
+@router.patch("/lote")
+def actualizar_simulaciones_lote(
+    lote: ActualizarSimulacionesLote,
+    session: Session = Depends(get_session),
+):
+    """
+    Aplica los mismos cambios a todas las simulaciones del filtro con un
+    solo UPDATE y deja un resumen en el historial (una sola transacción).
+    """
+    valores = lote.cambios.model_dump(exclude_none=True)
+    if "interes_id" in valores and not session.get(Interes, valores["interes_id"]):
+        raise HTTPException(
+            status_code=400,
+            detail=f"El interés con id {valores['interes_id']} no existe",
+        )
+
+    ids = actualizar_lote(session, Simulacion, _condiciones_simulaciones(lote.filtro), valores)
+    if ids:
+        auditar_lote(session, "Simulación", "ACTUALIZAR_LOTE", "simulaciones", ids, valores)
+    session.commit()
+
+    return {"actualizados": len(ids)}
+
+
+@router.delete("/lote")
+def eliminar_simulaciones_lote(
+    filtro: FiltroSimulaciones,
+    session: Session = Depends(get_session),
+):
+    """
+    Elimina todas las simulaciones del filtro con un solo DELETE y deja un
+    resumen en el historial.
+    """
+    ids = eliminar_lote(session, Simulacion, _condiciones_simulaciones(filtro))
+    if ids:
+        auditar_lote(session, "Simulación", "ELIMINAR_LOTE", "simulaciones", ids)
+    session.commit()
+
+    return {"eliminados": len(ids)}
+
+
 # -----------------------------
 # UPDATE COMPLETO (PUT)
 # -----------------------------
@@ -115,6 +435,8 @@ def obtener_simulacion(
 def actualizar_simulacion(
     simulacion_id: int,
     datos: Simulacion,
+    request: Request,
+    response: Response,
     session: Session = Depends(get_session),
 ) -> Simulacion:
     """
@@ -123,6 +445,8 @@ def actualizar_simulacion(
     simulacion = session.get(Simulacion, simulacion_id)
     if not simulacion:
         raise HTTPException(status_code=404, detail="Simulación no encontrada")
+    verificar_if_match(session, request, simulacion)
+    antes = instantanea(simulacion)
 
     # Validar interés si cambia
     if datos.interes_id != simulacion.interes_id:
@@ -138,24 +462,24 @@ def actualizar_simulacion(
     simulacion.interesTotal = datos.interesTotal
     simulacion.saldoFinal = datos.saldoFinal
 
-    session.commit()
-    session.refresh(simulacion)
-
-    historial = Historial(
-        entidad="Simulación",
-        accion="ACTUALIZAR",
-        descripcion=(
+    auditar(
+        session,
+        "Simulación",
+        "ACTUALIZAR",
+        (
             f"Simulación {simulacion.idSimulacion} actualizada "
             f"(cuotaMensual={simulacion.cuotaMensual}, "
             f"interesTotal={simulacion.interesTotal}, "
             f"saldoFinal={simulacion.saldoFinal}, "
             f"interes_id={simulacion.interes_id})"
         ),
-        fecha=datetime.now(),
+        entidad_id=simulacion.idSimulacion,
+        cambios=diferencias(antes, instantanea(simulacion)),
     )
-    session.add(historial)
     session.commit()
+    session.refresh(simulacion)
 
+    response.headers["ETag"] = etag_de(simulacion)
     return simulacion
 
 
@@ -165,6 +489,8 @@ def actualizar_simulacion(
 @router.patch("/{simulacion_id}", response_model=Simulacion)
 def actualizar_simulacion_parcial(
     simulacion_id: int,
+    request: Request,
+    response: Response,
     cuotaMensual: Optional[float] = None,
     interesTotal: Optional[float] = None,
     saldoFinal: Optional[float] = None,
@@ -178,7 +504,9 @@ def actualizar_simulacion_parcial(
     simulacion = session.get(Simulacion, simulacion_id)
     if not simulacion:
         raise HTTPException(status_code=404, detail="Simulación no encontrada")
+    verificar_if_match(session, request, simulacion)
 
+    antes = instantanea(simulacion)
     cambios = []
 
     if cuotaMensual is not None:
@@ -204,22 +532,22 @@ def actualizar_simulacion_parcial(
         cambios.append("interes_id")
 
     if cambios:
-        session.commit()
-        session.refresh(simulacion)
-
         detalle_cambios = ", ".join(cambios)
-        historial = Historial(
-            entidad="Simulación",
-            accion="ACTUALIZAR_PARCIAL",
-            descripcion=(
+        auditar(
+            session,
+            "Simulación",
+            "ACTUALIZAR_PARCIAL",
+            (
                 f"Simulación {simulacion.idSimulacion} actualizada parcialmente. "
                 f"Campos modificados: {detalle_cambios}"
             ),
-            fecha=datetime.now(),
+            entidad_id=simulacion.idSimulacion,
+            cambios=diferencias(antes, instantanea(simulacion)),
         )
-        session.add(historial)
         session.commit()
+        session.refresh(simulacion)
 
+    response.headers["ETag"] = etag_de(simulacion)
     return simulacion
 
 
@@ -238,13 +566,14 @@ def eliminar_simulacion(
     if not simulacion:
         raise HTTPException(status_code=404, detail="Simulación no encontrada")
 
-    historial = Historial(
-        entidad="Simulación",
-        accion="ELIMINAR",
-        descripcion=f"Simulación {simulacion.idSimulacion} eliminada",
-        fecha=datetime.now(),
+    auditar(
+        session,
+        "Simulación",
+        "ELIMINAR",
+        f"Simulación {simulacion.idSimulacion} eliminada",
+        entidad_id=simulacion.idSimulacion,
+        cambios=cambios_eliminacion(simulacion),
     )
-    session.add(historial)
     session.delete(simulacion)
     session.commit()
 
@@ -0,0 +1,117 @@
+# routers/trabajo_router.py
+
+import os
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import FileResponse
+from sqlmodel import Session, select
+
+from database import get_session
+from models.trabajo import Trabajo, TrabajoCrear
+from services.trabajos import TAREAS, gestor_trabajos
+
+router = APIRouter(prefix="/jobs", tags=["Trabajos"])
+
+
+# -----------------------------
+# CREATE - ENCOLAR TRABAJO
+# -----------------------------
+@router.post("/", response_model=Trabajo, status_code=status.HTTP_202_ACCEPTED)
+def crear_trabajo(
+    datos: TrabajoCrear,
+    session: Session = Depends(get_session),
+) -> Trabajo:
+    """
+    Encola un trabajo pesado y responde de inmediato con su id.
+    El avance se consulta en GET /jobs/{id}.
+    """
+    if datos.tipo not in TAREAS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tipo de trabajo desconocido. Tipos disponibles: {', '.join(sorted(TAREAS))}",
+        )
+    return gestor_trabajos.encolar(
+        session,
+        datos.tipo,
+        datos.parametros,
+        prioridad=datos.prioridad,
+        max_intentos=datos.max_intentos,
+    )
+
+
+# -----------------------------
+# READ - LISTAR
+# -----------------------------
+@router.get("/", response_model=List[Trabajo])
+def listar_trabajos(
+    session: Session = Depends(get_session),
+    estado: Optional[str] = Query(
+        None, description="PENDIENTE, EN_PROCESO, COMPLETADO o FALLIDO"
+    ),
+    tipo: Optional[str] = Query(None, description="Filtrar por tipo de trabajo"),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+) -> List[Trabajo]:
+    query = select(Trabajo)
+    if estado:
+        query = query.where(Trabajo.estado == estado)
+    if tipo:
+        query = query.where(Trabajo.tipo == tipo)
+    query = query.order_by(Trabajo.idTrabajo.desc()).offset(offset).limit(limit)
+    return session.exec(query).all()
+
+
+@router.get("/tipos", response_model=List[str])
+def listar_tipos_trabajo() -> List[str]:
+    """
+    Tipos de trabajo que los workers saben ejecutar.
+    """
+    return sorted(TAREAS)
+
+
+# -----------------------------
+# READ - ESTADO
+# -----------------------------
+@router.get("/{trabajo_id}", response_model=Trabajo)
+def obtener_trabajo(
+    trabajo_id: int,
+    session: Session = Depends(get_session),
+) -> Trabajo:
+    """
+    Estado, avance (0 a 1), intentos y mensaje del trabajo.
+    """
+    trabajo = session.get(Trabajo, trabajo_id)
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return trabajo
+
+
+# -----------------------------
+# READ - DESCARGAR RESULTADO
+# -----------------------------
+@router.get("/{trabajo_id}/resultado")
+def descargar_resultado_trabajo(
+    trabajo_id: int,
+    session: Session = Depends(get_session),
+):
+    """
+    Descarga el archivo generado por el trabajo.
+    Responde 409 si el trabajo aún no ha terminado.
+    """
+    trabajo = session.get(Trabajo, trabajo_id)
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    if trabajo.estado != "COMPLETADO":
+        raise HTTPException(
+            status_code=409,
+            detail=f"El trabajo está {trabajo.estado} ({trabajo.progreso:.0%})",
+        )
+    if not trabajo.resultado or not os.path.exists(trabajo.resultado):
+        raise HTTPException(status_code=404, detail="El trabajo no generó archivo de resultado")
+
+    return FileResponse(
+        trabajo.resultado,
+        media_type=trabajo.resultado_media_type or "application/octet-stream",
+        filename=os.path.basename(trabajo.resultado),
+    )
@@ -2,33 +2,151 @@
 
 import os
 import uuid
-from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 from fastapi import (
     APIRouter,
     Depends,
     HTTPException,
+    Query,
     Form,
     File,
     UploadFile,
+    Request,
+    Response,
 )
 from fastapi.responses import RedirectResponse
 from sqlmodel import Session, select
 
-from database import get_session
+from database import get_session, get_session_lectura
 from models.usuario import Usuario
-from models.historial import Historial
+from models.lote import LoteIds
+from models.portafolio import PortafolioUsuario
+from services.auditoria import auditar, cambios_creacion, diferencias, instantanea
+from services.portafolio import listar_portafolios, portafolio_usuario
+from services.serializacion import campos_de, respuesta_ligera, respuesta_lote, respuesta_registro
+from services.versiones import (
+    etag_coleccion,
+    etag_registro,
+    respuesta_no_modificado,
+)
 
 router = APIRouter(prefix="/usuarios", tags=["Usuarios"])
 
+# El servidor invalida su caché al escribir; el cliente no debe guardar una copia
+# que luego no se entera de la escritura (lectura de lo propio)
+CACHE_CONTROL_PORTAFOLIO = "private, no-cache"
+
 
 # -----------------------------
 # LISTAR (API JSON)
 # -----------------------------
 @router.get("/", response_model=List[Usuario])
-def listar_usuarios(session: Session = Depends(get_session)):
-    return session.exec(select(Usuario)).all()
+def listar_usuarios(
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_session_lectura),
+    ligero: bool = Query(
+        False,
+        description="Modo rápido: selecciona solo columnas y serializa sin validar cada fila",
+    ),
+    campos: Optional[list] = Depends(campos_de(Usuario)),
+):
+    query = select(Usuario)
+
+    etag = etag_coleccion(session, request, query, Usuario)
+    no_modificado = respuesta_no_modificado(request, etag)
+    if no_modificado is not None:
+        return no_modificado
+    response.headers["ETag"] = etag
+
+    if ligero or campos:
+        return respuesta_ligera(session, query, Usuario, campos, headers={"ETag": etag})
+
+    return session.exec(query).all()
+
+
+# -----------------------------
+# PORTAFOLIO (API JSON)
+# -----------------------------
+@router.get("/portafolios", response_model=List[PortafolioUsuario])
+def listar_portafolios_usuarios(
+    response: Response,
+    session: Session = Depends(get_session_lectura),
+    limit: int = Query(100, ge=1, le=1000, description="Cantidad máxima de usuarios"),
+    offset: int = Query(0, ge=0, description="Desplazamiento para paginación"),
+):
+    """
+    Lista el portafolio de cada usuario (paginado), calculado con una
+    sola consulta agregada. Se cachea unos segundos por página.
+    """
+    response.headers["Cache-Control"] = CACHE_CONTROL_PORTAFOLIO
+    return listar_portafolios(session, limit, offset)
+
+
+@router.get("/{usuario_id}/portafolio", response_model=PortafolioUsuario)
+def obtener_portafolio_usuario(
+    usuario_id: int,
+    response: Response,
+    session: Session = Depends(get_session_lectura),
+):
+    """
+    Resumen de exposición de un usuario: cantidad de créditos, monto total,
+    tasa promedio ponderada, interés proyectado, cuotas y flujo libre
+    (ingresos - gastos - Σ cuotas). Se cachea unos segundos por usuario.
+    """
+    portafolio = portafolio_usuario(session, usuario_id)
+    if portafolio is None:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    response.headers["Cache-Control"] = CACHE_CONTROL_PORTAFOLIO
+    return portafolio
+
+
+# -----------------------------
+# OBTENER VARIOS POR ID (API JSON)
+# -----------------------------
+@router.post("/batch-get")
+def obtener_usuarios_por_ids(
+    lote: LoteIds,
+    session: Session = Depends(get_session_lectura),
+    campos: Optional[list] = Depends(campos_de(Usuario)),
+):
+    """
+    Obtiene varios usuarios en una sola consulta (`{"ids": [1, 2, 3]}`).
+    Responde `{"encontrados": {id: usuario}, "faltantes": [ids]}`.
+    """
+    return respuesta_lote(session, Usuario, lote.ids, campos)
+
+
+# -----------------------------
+# OBTENER POR ID (API JSON)
+# -----------------------------
+@router.get("/{usuario_id}", response_model=Usuario)
+def obtener_usuario(
+    usuario_id: int,
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_session_lectura),
+    campos: Optional[list] = Depends(campos_de(Usuario)),
+) -> Usuario:
+    """
+    Obtiene un usuario por su id.
+    """
+    etag = etag_registro(session, request, Usuario, usuario_id, "Usuario no encontrado")
+    no_modificado = respuesta_no_modificado(request, etag)
+    if no_modificado is not None:
+        return no_modificado
+    response.headers["ETag"] = etag
+
+    if campos:
+        return respuesta_registro(
+            session, Usuario, usuario_id, campos, "Usuario no encontrado", headers={"ETag": etag}
+        )
+
+    usuario = session.get(Usuario, usuario_id)
+    if not usuario:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    return usuario
 
 
 # -----------------------------
@@ -75,16 +193,16 @@ def crear_usuario_form(
         cedula=cedula_path,
     )
     session.add(usuario)
-    session.commit()
-    session.refresh(usuario)
+    session.flush()
 
-    historial = Historial(
-        entidad="Usuario",
-        accion="CREAR",
-        descripcion=f"Usuario '{usuario.nombre}' creado con id {usuario.idUsuario}",
-        fecha=datetime.now(),
+    auditar(
+        session,
+        "Usuario",
+        "CREAR",
+        f"Usuario '{usuario.nombre}' creado con id {usuario.idUsuario}",
+        entidad_id=usuario.idUsuario,
+        cambios=cambios_creacion(usuario),
     )
-    session.add(historial)
     session.commit()
 
     # Regresar a la vista HTML
@@ -109,6 +227,7 @@ def actualizar_usuario_form(
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
+    antes = instantanea(usuario)
     usuario.nombre = nombre
     usuario.ingresos = ingresos
     usuario.gastos = gastos
@@ -136,16 +255,14 @@ def actualizar_usuario_form(
 
         usuario.cedula = file_path
 
-    session.commit()
-    session.refresh(usuario)
-
-    historial = Historial(
-        entidad="Usuario",
-        accion="ACTUALIZAR",
-        descripcion=f"Usuario id {usuario.idUsuario} actualizado",
-        fecha=datetime.now(),
+    auditar(
+        session,
+        "Usuario",
+        "ACTUALIZAR",
+        f"Usuario id {usuario.idUsuario} actualizado",
+        entidad_id=usuario.idUsuario,
+        cambios=diferencias(antes, instantanea(usuario)),
     )
-    session.add(historial)
     session.commit()
 
     return RedirectResponse(url="/ui/usuarios", status_code=303)
\ No newline at end of file
@@ -0,0 +1,146 @@
+# services/actividad.py
+"""
+Serie de tiempo de actividad del historial (acciones por entidad y acción).
+
+Cada flush que agrega o elimina registros de Historial suma o resta en
+ActividadHistorial, en la misma transacción, para los tres tamaños de
+intervalo. Las consultas leen esos conteos y no agrupan la tabla
+historial, así que su costo depende del rango pedido y no del tamaño
+del log.
+"""
+
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import event, func
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Connection
+from sqlmodel import Session, select
+
+from models.historial import ActividadHistorial, Historial
+
+# Tamaño del intervalo -> duración en segundos
+GRANULARIDADES: Dict[str, int] = {"minuto": 60, "hora": 3600, "dia": 86400}
+
+# Formato de strftime de SQLite para truncar al inicio del intervalo
+_FORMATOS_SQL = {"minuto": "%Y-%m-%d %H:%M:00", "hora": "%Y-%m-%d %H:00:00", "dia": "%Y-%m-%d 00:00:00"}
+
+# Con granularidad automática se elige la más fina que no pase de estos intervalos
+MAX_INTERVALOS = 500
+
+
+def truncar(fecha: datetime, granularidad: str) -> datetime:
+    fecha = fecha.replace(second=0, microsecond=0)
+    if granularidad in ("hora", "dia"):
+        fecha = fecha.replace(minute=0)
+    if granularidad == "dia":
+        fecha = fecha.replace(hour=0)
+    return fecha
+
+
+def _sumar(conexion: Connection, conteos: Counter) -> None:
+    """
+    Upsert de {(granularidad, inicio, entidad, accion): delta}.
+    """
+    filas = [
+        {"granularidad": g, "inicio": inicio, "entidad": entidad, "accion": accion, "cantidad": delta}
+        for (g, inicio, entidad, accion), delta in conteos.items()
+        if delta
+    ]
+    if not filas:
+        return
+    sentencia = insert(ActividadHistorial)
+    conexion.execute(
+        sentencia.on_conflict_do_update(
+            index_elements=["granularidad", "inicio", "entidad", "accion"],
+            set_={"cantidad": ActividadHistorial.cantidad + sentencia.excluded.cantidad},
+        ),
+        filas,
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _actualizar_actividad(session, contexto) -> None:
+    conteos: Counter = Counter()
+    for signo, objetos in ((1, session.new), (-1, session.deleted)):
+        for obj in objetos:
+            if isinstance(obj, Historial):
+                for g in GRANULARIDADES:
+                    conteos[(g, truncar(obj.fecha, g), obj.entidad, obj.accion)] += signo
+    if conteos:
+        _sumar(session.connection(), conteos)
+
+
+def reconstruir_actividad(conexion: Connection) -> None:
+    """
+    Llena ActividadHistorial a partir de todo el historial (una agrupación
+    por granularidad). Para bases creadas antes de existir la tabla.
+    """
+    conteos: Counter = Counter()
+    for g, formato in _FORMATOS_SQL.items():
+        inicio = func.strftime(formato, Historial.fecha)
+        filas = conexion.execute(
+            select(inicio, Historial.entidad, Historial.accion, func.count())
+            .group_by(inicio, Historial.entidad, Historial.accion)
+        ).all()
+        for texto, entidad, accion, cantidad in filas:
+            conteos[(g, datetime.fromisoformat(texto), entidad, accion)] += cantidad
+    _sumar(conexion, conteos)
+
+
+def elegir_granularidad(desde: datetime, hasta: datetime) -> str:
+    segundos = (hasta - desde).total_seconds()
+    for g, duracion in GRANULARIDADES.items():
+        if segundos / duracion <= MAX_INTERVALOS:
+            return g
+    return "dia"
+
+
+def consultar_actividad(
+    session: Session,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    granularidad: str = "auto",
+    entidad: Optional[str] = None,
+    accion: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Conteos por intervalo, entidad y acción entre `desde` y `hasta`
+    (por defecto, las últimas 24 horas).
+    """
+    hasta = hasta or datetime.now()
+    desde = desde or hasta - timedelta(days=1)
+    if desde > hasta:
+        raise HTTPException(status_code=400, detail="'desde' debe ser anterior a 'hasta'")
+    if granularidad == "auto":
+        granularidad = elegir_granularidad(desde, hasta)
+    elif granularidad not in GRANULARIDADES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Granularidad inválida. Use: auto, {', '.join(GRANULARIDADES)}",
+        )
+
+    query = select(ActividadHistorial).where(
+        ActividadHistorial.granularidad == granularidad,
+        ActividadHistorial.inicio >= truncar(desde, granularidad),
+        ActividadHistorial.inicio <= hasta,
+        ActividadHistorial.cantidad > 0,
+    )
+    if entidad:
+        query = query.where(ActividadHistorial.entidad == entidad)
+    if accion:
+        query = query.where(ActividadHistorial.accion == accion)
+
+    puntos = [
+        {"inicio": a.inicio, "entidad": a.entidad, "accion": a.accion, "cantidad": a.cantidad}
+        for a in session.exec(query.order_by(ActividadHistorial.inicio)).all()
+    ]
+    return {
+        "granularidad": granularidad,
+        "desde": desde,
+        "hasta": hasta,
+        "total": sum(p["cantidad"] for p in puntos),
+        "puntos": puntos,
+    }
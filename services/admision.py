@@ -0,0 +1,196 @@
+# services/admision.py
+
+import asyncio
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+from services.metricas import metricas
+from services.serializacion import RUTA_LOTE, RespuestaJSONRapida
+
+
+@dataclass
+class PresupuestoClase:
+    """
+    Presupuesto de una clase de rutas:
+    - max_concurrencia: peticiones atendiéndose a la vez
+    - max_cola: peticiones que pueden esperar turno
+    - espera_maxima: segundos que una petición puede esperar en cola
+    - retry_after: segundos sugeridos al cliente en el 503
+    """
+
+    max_concurrencia: int
+    max_cola: int
+    espera_maxima: float
+    retry_after: int = 2
+
+
+# Valores por defecto. La suma de concurrencias queda por debajo de los
+# 40 hilos del threadpool de FastAPI, así una clase saturada no deja sin
+# hilos a las demás.
+PRESUPUESTOS_POR_DEFECTO: Dict[str, PresupuestoClase] = {
+    "interactiva": PresupuestoClase(max_concurrencia=16, max_cola=64, espera_maxima=2.0, retry_after=1),
+    "lectura": PresupuestoClase(max_concurrencia=10, max_cola=50, espera_maxima=5.0),
+    "escritura": PresupuestoClase(max_concurrencia=4, max_cola=50, espera_maxima=5.0),
+    "calculo": PresupuestoClase(max_concurrencia=4, max_cola=16, espera_maxima=10.0, retry_after=5),
+    "exportacion": PresupuestoClase(max_concurrencia=2, max_cola=8, espera_maxima=10.0, retry_after=10),
+}
+
+# Rutas que nunca se limitan (monitoreo y archivos estáticos)
+RUTAS_EXENTAS = ("/health", "/metricas", "/static", "/upload", "/docs", "/redoc", "/openapi.json")
+
+# Conexiones de larga duración (feeds): ocuparían un cupo mientras estén abiertas
+RUTAS_STREAMING = ("/historial/stream",)
+
+# Fragmentos de ruta que identifican exportaciones / lecturas pesadas
+RUTAS_EXPORTACION = ("/exportar", "/documento", "/estres", "/resultado")
+
+# POST que solo calculan sobre datos leídos (no escriben) y pueden tardar:
+# van a la clase "calculo" en lugar de gastar el cupo de escritura
+RUTAS_POST_CALCULO = re.compile(r"^/simulaciones/(montecarlo|\d+/escenarios)/?$")
+
+# Un listado con limit mayor o igual a este valor se trata como exportación
+LIMITE_EXPORTACION = 500
+
+
+def es_post_de_lectura(ruta: str) -> bool:
+    """
+    POST que no escribe: batch-get (usa POST solo para mandar la lista de
+    ids) y los cálculos de RUTAS_POST_CALCULO.
+    """
+    return ruta.endswith(RUTA_LOTE) or RUTAS_POST_CALCULO.match(ruta) is not None
+
+
+def clasificar_ruta(scope) -> Optional[str]:
+    """
+    Devuelve la clase de la petición (interactiva, lectura, escritura,
+    calculo, exportacion) o None si la ruta está exenta.
+    """
+    ruta = scope["path"]
+    if ruta.startswith(RUTAS_EXENTAS) or ruta.startswith(RUTAS_STREAMING):
+        return None
+    if ruta == "/" or ruta.startswith("/ui/") or ruta == "/ui":
+        return "interactiva"
+    if any(fragmento in ruta for fragmento in RUTAS_EXPORTACION):
+        return "exportacion"
+    if RUTAS_POST_CALCULO.match(ruta):
+        return "calculo"
+    if scope["method"] not in ("GET", "HEAD") and not es_post_de_lectura(ruta):
+        return "escritura"
+
+    parametros = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    try:
+        limite = int(parametros.get("limit", ["0"])[0])
+    except ValueError:
+        limite = 0
+    if limite >= LIMITE_EXPORTACION:
+        return "exportacion"
+    return "lectura"
+
+
+class _Compuerta:
+    """
+    Semáforo con cola FIFO acotada y tiempo máximo de espera.
+    Al liberar un cupo se entrega directamente al primero de la cola.
+    """
+
+    def __init__(self, nombre: str, presupuesto: PresupuestoClase) -> None:
+        self.nombre = nombre
+        self.presupuesto = presupuesto
+        self.activos = 0
+        self.cola: Deque[asyncio.Future] = deque()
+
+    async def entrar(self) -> Tuple[bool, str]:
+        if self.activos < self.presupuesto.max_concurrencia and not self.cola:
+            self.activos += 1
+            return True, ""
+
+        if len(self.cola) >= self.presupuesto.max_cola:
+            return False, "cola_llena"
+
+        turno = asyncio.get_running_loop().create_future()
+        self.cola.append(turno)
+        self._publicar()
+        inicio = time.monotonic()
+        try:
+            await asyncio.wait_for(turno, timeout=self.presupuesto.espera_maxima)
+            return True, ""
+        except asyncio.TimeoutError:
+            return False, "espera_agotada"
+        except BaseException:
+            # Cliente desconectado: si ya se le había cedido el cupo, devolverlo
+            if turno.done() and not turno.cancelled():
+                self.salir()
+            raise
+        finally:
+            if turno in self.cola:
+                self.cola.remove(turno)
+            metricas.incrementar(
+                "admision_espera_segundos", time.monotonic() - inicio, clase=self.nombre
+            )
+            self._publicar()
+
+    def salir(self) -> None:
+        while self.cola:
+            turno = self.cola.popleft()
+            if not turno.done():
+                turno.set_result(True)  # el cupo pasa al siguiente sin liberarse
+                self._publicar()
+                return
+        self.activos -= 1
+        self._publicar()
+
+    def _publicar(self) -> None:
+        metricas.fijar("admision_en_cola", len(self.cola), clase=self.nombre)
+        metricas.fijar("admision_activos", self.activos, clase=self.nombre)
+
+
+class MiddlewareAdmision:
+    """
+    Control de admisión por clase de ruta (interactiva, lectura, escritura,
+    cálculo, exportación). Cada clase tiene su propio cupo de concurrencia y su
+    cola acotada; si la cola está llena o la espera supera el plazo se
+    responde 503 con Retry-After de inmediato, en lugar de acumular
+    peticiones sobre el threadpool y el único escritor de SQLite.
+    """
+
+    def __init__(
+        self,
+        app,
+        presupuestos: Optional[Dict[str, PresupuestoClase]] = None,
+    ) -> None:
+        self.app = app
+        self.compuertas = {
+            nombre: _Compuerta(nombre, presupuesto)
+            for nombre, presupuesto in (presupuestos or PRESUPUESTOS_POR_DEFECTO).items()
+        }
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        compuerta = self.compuertas.get(clasificar_ruta(scope))
+        if compuerta is None:
+            await self.app(scope, receive, send)
+            return
+
+        admitida, motivo = await compuerta.entrar()
+        if not admitida:
+            metricas.incrementar("admision_rechazos", clase=compuerta.nombre, motivo=motivo)
+            respuesta = RespuestaJSONRapida(
+                {"detail": f"Servidor saturado ({compuerta.nombre}), intente más tarde"},
+                status_code=503,
+                headers={"Retry-After": str(compuerta.presupuesto.retry_after)},
+            )
+            await respuesta(scope, receive, send)
+            return
+
+        metricas.incrementar("admision_admitidas", clase=compuerta.nombre)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            compuerta.salir()
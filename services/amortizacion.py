@@ -0,0 +1,83 @@
+# services/amortizacion.py
+
+from typing import Tuple
+
+import numpy as np
+
+# Sistemas de amortización soportados:
+# - frances: cuota fija
+# - aleman: abono a capital fijo (la cuota baja cada mes; se reporta la primera)
+SISTEMAS = ("frances", "aleman")
+
+
+def tasa_mensual(tasa: "np.ndarray | float") -> np.ndarray:
+    """
+    Convierte la tasa guardada en Interes.tasa (porcentaje mensual, ej: 1.5)
+    a fracción (0.015).
+    """
+    return np.asarray(tasa, dtype=np.float64) / 100.0
+
+
+def cuota_francesa(monto, plazo, tasa) -> np.ndarray:
+    """
+    Cuota fija del sistema francés, vectorizada:
+    cuota = P·r / (1 - (1 + r)^-n); si r = 0, cuota = P / n.
+    """
+    p = np.asarray(monto, dtype=np.float64)
+    n = np.asarray(plazo, dtype=np.float64)
+    r = tasa_mensual(tasa)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cuota = p * r / (1.0 - np.power(1.0 + r, -n))
+    return np.where(r == 0, p / n, cuota)
+
+
+def calcular_simulaciones(
+    montos,
+    plazos,
+    tasas,
+    sistema: str = "frances",
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Calcula en bloque (arreglos de NumPy) los valores de una Simulacion:
+    (cuotaMensual, interesTotal, saldoFinal), donde saldoFinal es el total
+    pagado al terminar el crédito (monto + intereses).
+    """
+    if sistema not in SISTEMAS:
+        raise ValueError(f"Sistema de amortización desconocido: {sistema}")
+
+    p = np.asarray(montos, dtype=np.float64)
+    n = np.asarray(plazos, dtype=np.float64)
+    r = tasa_mensual(tasas)
+
+    if sistema == "frances":
+        cuota = cuota_francesa(p, n, tasas)
+        interes_total = cuota * n - p
+    else:
+        # Abono fijo P/n; el interés se cobra sobre el saldo que va bajando
+        cuota = p / n + p * r
+        interes_total = p * r * (n + 1.0) / 2.0
+
+    return cuota, interes_total, p + interes_total
+
+
+def tabla_amortizacion(monto: float, plazo: int, tasa: float) -> np.ndarray:
+    """
+    Tabla del sistema francés, vectorizada. Devuelve un arreglo (plazo, 5):
+    mes, cuota, interés, abono a capital y saldo al cierre del mes.
+    """
+    n = int(plazo)
+    r = float(tasa_mensual(tasa))
+    cuota = float(cuota_francesa(monto, n, tasa))
+    meses = np.arange(1, n + 1, dtype=np.float64)
+
+    if r == 0:
+        saldos = monto - cuota * meses
+    else:
+        factor = np.power(1.0 + r, meses)
+        saldos = monto * factor - cuota * (factor - 1.0) / r
+    saldos = np.maximum(saldos, 0.0)
+    saldos_previos = np.concatenate(([float(monto)], saldos[:-1]))
+    intereses = saldos_previos * r
+    abonos = cuota - intereses
+
+    return np.column_stack([meses, np.full(n, cuota), intereses, abonos, saldos])
@@ -0,0 +1,137 @@
+# services/auditoria.py
+"""
+Registro estructurado en el historial.
+
+Además de la descripción en texto, cada registro guarda:
+- entidad_id: el registro afectado (índice por (entidad, entidad_id));
+- cambios: diferencia por campo `{"campo": [anterior, nuevo]}`. Al crear,
+  el anterior es None; al eliminar, el nuevo es None. En las
+  actualizaciones en lote solo se conoce el valor nuevo. La columna
+  `version` no se registra.
+
+Las operaciones que tocan muchos registros (lotes, relaciones
+crédito-categoría) dejan un solo Historial y una fila en HistorialAfectado
+por registro, así que también aparecen en el historial de cada uno.
+"""
+
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import insert
+from sqlmodel import Session, SQLModel, select
+
+from models.historial import Historial, HistorialAfectado
+
+# Nombre en la URL -> valor de Historial.entidad
+ENTIDADES = {
+    "usuario": "Usuario",
+    "credito": "Crédito",
+    "interes": "Interés",
+    "simulacion": "Simulación",
+    "reporte": "Reporte",
+    "categoria": "Categoría",
+}
+
+CAMPOS_IGNORADOS = ("version",)
+
+
+def _valor(valor: Any) -> Any:
+    # Las fechas se guardan como texto ISO (la columna es JSON)
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return valor
+
+
+def instantanea(registro: SQLModel) -> Dict[str, Any]:
+    """
+    Valores de columna de un registro, listos para JSON.
+    """
+    return {
+        columna.name: _valor(getattr(registro, columna.name))
+        for columna in registro.__table__.columns
+        if columna.name not in CAMPOS_IGNORADOS
+    }
+
+
+def diferencias(antes: Dict[str, Any], despues: Dict[str, Any]) -> Dict[str, List[Any]]:
+    """
+    Campos que cambiaron entre dos instantáneas: {"campo": [anterior, nuevo]}.
+    """
+    return {campo: [antes.get(campo), valor] for campo, valor in despues.items() if antes.get(campo) != valor}
+
+
+def cambios_creacion(registro: SQLModel) -> Dict[str, List[Any]]:
+    return {campo: [None, valor] for campo, valor in instantanea(registro).items()}
+
+
+def cambios_eliminacion(registro: SQLModel) -> Dict[str, List[Any]]:
+    return {campo: [valor, None] for campo, valor in instantanea(registro).items()}
+
+
+def auditar(
+    session: Session,
+    entidad: str,
+    accion: str,
+    descripcion: str,
+    entidad_id: Optional[int] = None,
+    cambios: Optional[Dict[str, Any]] = None,
+    afectados: Optional[Dict[str, Sequence[int]]] = None,
+) -> Historial:
+    """
+    Agrega un registro de historial a la sesión (sin commit: se confirma
+    junto con el cambio que documenta). `afectados` ({entidad: ids}) se
+    inserta en HistorialAfectado con un solo INSERT.
+    """
+    historial = Historial(
+        entidad=entidad,
+        accion=accion,
+        descripcion=descripcion,
+        fecha=datetime.now(),
+        entidad_id=entidad_id,
+        cambios=cambios or None,
+    )
+    session.add(historial)
+
+    if afectados:
+        session.flush()
+        filas = [
+            {"historial_id": historial.idHistorial, "entidad": nombre, "entidad_id": registro_id}
+            for nombre, ids in afectados.items()
+            for registro_id in dict.fromkeys(ids)
+        ]
+        if filas:
+            session.execute(insert(HistorialAfectado), filas)
+    return historial
+
+
+def historial_de(
+    session: Session,
+    entidad: str,
+    entidad_id: int,
+    limite: int = 100,
+    antes_id: Optional[int] = None,
+) -> List[Historial]:
+    """
+    Historial de un registro, del más reciente al más antiguo: los
+    registros propios (rango sobre ix_historial_entidad_registro) más las
+    operaciones en lote que lo incluyeron (rango sobre
+    ix_historialafectado_registro). `antes_id` pagina por idHistorial.
+    """
+    propios = select(Historial).where(Historial.entidad == entidad, Historial.entidad_id == entidad_id)
+    en_lote = select(HistorialAfectado.historial_id).where(
+        HistorialAfectado.entidad == entidad, HistorialAfectado.entidad_id == entidad_id
+    )
+    if antes_id is not None:
+        propios = propios.where(Historial.idHistorial < antes_id)
+        en_lote = en_lote.where(HistorialAfectado.historial_id < antes_id)
+
+    registros = {
+        h.idHistorial: h
+        for h in session.exec(propios.order_by(Historial.idHistorial.desc()).limit(limite)).all()
+    }
+    ids_lote = session.exec(en_lote.order_by(HistorialAfectado.historial_id.desc()).limit(limite)).all()
+    if ids_lote:
+        for h in session.exec(select(Historial).where(Historial.idHistorial.in_(ids_lote))).all():
+            registros[h.idHistorial] = h
+
+    return [registros[i] for i in sorted(registros, reverse=True)[:limite]]
@@ -0,0 +1,128 @@
+# services/cache.py
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class CacheTTL:
+    """
+    Caché en memoria con expiración por tiempo (TTL) y tamaño máximo.
+
+    Las entradas se guardan en orden de inserción: al superar `max_entradas`
+    se descartan las más antiguas, y las vencidas se purgan en cada escritura.
+    Es segura para usarse desde varios hilos.
+    """
+
+    def __init__(self, ttl_segundos: float, max_entradas: int = 10_000) -> None:
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self._datos: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave: Hashable) -> Optional[Any]:
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            expira, valor = entrada
+            if expira <= time.monotonic():
+                del self._datos[clave]
+                return None
+            return valor
+
+    def guardar(self, clave: Hashable, valor: Any, ttl_segundos: Optional[float] = None) -> None:
+        ahora = time.monotonic()
+        expira = ahora + (ttl_segundos if ttl_segundos is not None else self.ttl_segundos)
+        with self._lock:
+            self._datos.pop(clave, None)
+            self._datos[clave] = (expira, valor)
+            self._purgar(ahora)
+
+    def eliminar(self, clave: Hashable) -> None:
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._datos.clear()
+
+    def _purgar(self, ahora: float) -> None:
+        # Las más antiguas están al principio
+        while self._datos:
+            clave, (expira, _) = next(iter(self._datos.items()))
+            if expira > ahora and len(self._datos) <= self.max_entradas:
+                break
+            del self._datos[clave]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._datos)
+
+
+class CacheLRU:
+    """
+    Caché en memoria sin expiración, acotada por un presupuesto de bytes:
+    al superarlo se descartan las entradas usadas hace más tiempo (LRU).
+
+    `tamano` estima los bytes de cada valor (por defecto `nbytes` de los
+    arreglos de NumPy o `sys.getsizeof`). Lleva la cuenta de aciertos y
+    fallos. Es segura para usarse desde varios hilos.
+    """
+
+    def __init__(self, max_bytes: int, tamano: Optional[Callable[[Any], int]] = None) -> None:
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self._tamano = tamano or _tamano_valor
+        self._datos: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave: Hashable) -> Optional[Any]:
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[1]
+
+    def guardar(self, clave: Hashable, valor: Any) -> None:
+        tamano = self._tamano(valor)
+        if tamano > self.max_bytes:
+            return
+        with self._lock:
+            anterior = self._datos.pop(clave, None)
+            if anterior is not None:
+                self.bytes -= anterior[0]
+            self._datos[clave] = (tamano, valor)
+            self.bytes += tamano
+            # Las usadas hace más tiempo están al principio
+            while self.bytes > self.max_bytes:
+                _, (descartado, _) = self._datos.popitem(last=False)
+                self.bytes -= descartado
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._datos.clear()
+            self.bytes = 0
+
+    def tasa_aciertos(self) -> float:
+        consultas = self.aciertos + self.fallos
+        return self.aciertos / consultas if consultas else 0.0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._datos)
+
+
+def _tamano_valor(valor: Any) -> int:
+    # Arreglos de NumPy: los datos más el encabezado del objeto
+    nbytes = getattr(valor, "nbytes", None)
+    if nbytes is not None:
+        return int(nbytes) + 112
+    return sys.getsizeof(valor)
@@ -0,0 +1,115 @@
+# services/categorias.py
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select
+
+from models.categoria import Categoria
+from models.credito import Credito
+from models.credito_categoria import CreditoCategoria
+
+# Pares por sentencia: SQLite limita la cantidad de parámetros por consulta
+TAMANO_LOTE = 5000
+
+
+def validar_ids_existentes(
+    session: Session,
+    columna,
+    ids: Sequence[int],
+    entidad: str,
+) -> None:
+    """
+    Verifica con consultas WHERE id IN (...) por lotes que todos los ids existan.
+    Lanza 404 indicando los faltantes.
+    """
+    unicos = list(dict.fromkeys(ids))
+    existentes = set()
+    for i in range(0, len(unicos), TAMANO_LOTE):
+        lote = unicos[i:i + TAMANO_LOTE]
+        existentes.update(session.exec(select(columna).where(columna.in_(lote))).all())
+    faltantes = sorted(set(unicos) - existentes)
+    if faltantes:
+        raise HTTPException(
+            status_code=404,
+            detail=f"{entidad} no encontrados: {', '.join(map(str, faltantes))}",
+        )
+
+
+def asignar_relaciones(session: Session, pares: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Inserta pares (credito_id, categoria_id) con
+    INSERT ... ON CONFLICT DO NOTHING ... RETURNING y devuelve los pares que
+    eran nuevos (los que ya existían no se devuelven). No hace commit.
+    """
+    filas = [
+        {"credito_id": credito_id, "categoria_id": categoria_id}
+        for credito_id, categoria_id in dict.fromkeys(pares)
+    ]
+    dialecto = session.get_bind().dialect.name
+    insert = postgresql.insert if dialecto == "postgresql" else sqlite.insert
+
+    insertadas: List[Tuple[int, int]] = []
+    for i in range(0, len(filas), TAMANO_LOTE):
+        sentencia = (
+            insert(CreditoCategoria)
+            .values(filas[i:i + TAMANO_LOTE])
+            .on_conflict_do_nothing(index_elements=["credito_id", "categoria_id"])
+            .returning(CreditoCategoria.credito_id, CreditoCategoria.categoria_id)
+        )
+        insertadas += [tuple(fila) for fila in session.execute(sentencia)]
+    return insertadas
+
+
+def quitar_relaciones(
+    session: Session,
+    categoria_ids: Optional[Sequence[int]] = None,
+    credito_ids: Optional[Sequence[int]] = None,
+) -> List[Tuple[int, int]]:
+    """
+    Borra relaciones con un solo DELETE ... WHERE IN ... RETURNING y devuelve
+    los pares (credito_id, categoria_id) eliminados. Los filtros que se
+    envían se combinan con AND. No hace commit.
+    """
+    sentencia = (
+        delete(CreditoCategoria)
+        .returning(CreditoCategoria.credito_id, CreditoCategoria.categoria_id)
+        .execution_options(synchronize_session=False)
+    )
+    if categoria_ids is not None:
+        sentencia = sentencia.where(CreditoCategoria.categoria_id.in_(categoria_ids))
+    if credito_ids is not None:
+        sentencia = sentencia.where(CreditoCategoria.credito_id.in_(credito_ids))
+    return [tuple(fila) for fila in session.execute(sentencia)]
+
+
+def afectados_de(pares: Sequence[Tuple[int, int]]) -> Dict[str, List[int]]:
+    """
+    Registros para HistorialAfectado a partir de los pares que cambiaron.
+    """
+    return {
+        "Categoría": sorted({categoria_id for _, categoria_id in pares}),
+        "Crédito": sorted({credito_id for credito_id, _ in pares}),
+    }
+
+
+def mapa_categoria_credito(session: Session) -> Dict[int, int]:
+    """
+    Devuelve {categoria_id: credito_id} con un crédito representativo
+    (el de menor id) por categoría, calculado con GROUP BY en SQL.
+    """
+    filas = session.exec(
+        select(CreditoCategoria.categoria_id, func.min(CreditoCategoria.credito_id))
+        .group_by(CreditoCategoria.categoria_id)
+    ).all()
+    return dict(filas)
+
+
+def validar_categorias(session: Session, ids: List[int]) -> None:
+    validar_ids_existentes(session, Categoria.idCategoria, ids, "Categorías")
+
+
+def validar_creditos(session: Session, ids: List[int]) -> None:
+    validar_ids_existentes(session, Credito.idCredito, ids, "Créditos")
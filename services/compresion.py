@@ -0,0 +1,392 @@
+# services/compresion.py
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from services.metricas import metricas
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se negocia gzip
+    brotli = None
+
+
+# Tipos de contenido que vale la pena comprimir.
+# text/event-stream se excluye a propósito: los eventos deben salir sin esperar
+# a juntar el umbral mínimo.
+TIPOS_COMPRIMIBLES = (
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/csv",
+    "text/javascript",
+    "application/json",
+    "application/javascript",
+    "application/x-ndjson",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+def _es_comprimible(content_type: str) -> bool:
+    tipo = content_type.split(";")[0].strip().lower()
+    return tipo in TIPOS_COMPRIMIBLES
+
+
+def negociar_codificacion(accept_encoding: str) -> Optional[str]:
+    """
+    Elige "br" o "gzip" según el encabezado Accept-Encoding (respetando q=).
+    A igual preferencia gana brotli, si está instalado.
+    """
+    preferencias: Dict[str, float] = {}
+    for parte in accept_encoding.lower().split(","):
+        token, _, parametros = parte.strip().partition(";")
+        if not token:
+            continue
+        q = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith("q="):
+            try:
+                q = float(parametros[2:])
+            except ValueError:
+                q = 0.0
+        preferencias[token.strip()] = q
+
+    candidatas = ["br", "gzip"] if brotli is not None else ["gzip"]
+    comodin = preferencias.get("*", 0.0)
+    mejor, mejor_q = None, 0.0
+    for codificacion in candidatas:
+        q = preferencias.get(codificacion, comodin)
+        if q > mejor_q:
+            mejor, mejor_q = codificacion, q
+    return mejor
+
+
+# -----------------------------
+# ETag por codificación
+# -----------------------------
+# La versión comprimida de una respuesta es otro cuerpo: lleva el ETag de la
+# app con la codificación como sufijo ("3-2" -> "3-2-gzip"). En la petición
+# el sufijo se quita de If-None-Match / If-Match, así la app compara contra
+# su propio ETag sin saber de compresión.
+_SUFIJOS_CODIFICACION = ('-gzip"', '-br"')
+
+
+def etag_codificado(etag: str, codificacion: str) -> str:
+    if not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{codificacion}"'
+
+
+def _quitar_codificacion(valor: str) -> Tuple[str, Optional[str]]:
+    """
+    Quita el sufijo de codificación de cada ETag de la lista. Devuelve el
+    valor limpio y la codificación encontrada (si alguna la tenía).
+    """
+    encontrada = None
+    limpios = []
+    for etag in valor.split(","):
+        etag = etag.strip()
+        for sufijo in _SUFIJOS_CODIFICACION:
+            if etag.endswith(sufijo):
+                encontrada = sufijo[1:-1]
+                etag = etag[: -len(sufijo)] + '"'
+                break
+        limpios.append(etag)
+    return ", ".join(limpios), encontrada
+
+
+def _sin_codificacion_en_validadores(scope) -> Tuple[dict, Optional[str]]:
+    encontrada = None
+    headers = []
+    for nombre, valor in scope["headers"]:
+        if nombre in (b"if-none-match", b"if-match"):
+            limpio, codificacion = _quitar_codificacion(valor.decode("latin-1"))
+            encontrada = encontrada or codificacion
+            valor = limpio.encode("latin-1")
+        headers.append((nombre, valor))
+    if encontrada is None:
+        return scope, None
+    return {**scope, "headers": headers}, encontrada
+
+
+# -----------------------------
+# Métricas de compresión
+# -----------------------------
+def _ratio_compresion() -> float:
+    originales = metricas.valor("compresion_bytes_originales")
+    comprimidos = metricas.valor("compresion_bytes_comprimidos")
+    return round(comprimidos / originales, 4) if originales else 0.0
+
+
+metricas.registrar_calculado("compresion_ratio", _ratio_compresion)
+
+
+class _Compresor:
+    """
+    Compresor incremental: cada bloque sale con un flush de sincronización
+    para que el cliente pueda ir descomprimiendo mientras llega el stream.
+    """
+
+    def __init__(self, codificacion: str, nivel: int) -> None:
+        self.codificacion = codificacion
+        if codificacion == "br":
+            self._obj = brotli.Compressor(quality=nivel)
+        else:
+            self._obj = zlib.compressobj(nivel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self.bytes_originales = 0
+        self.bytes_comprimidos = 0
+        self.cpu_segundos = 0.0
+
+    def comprimir(self, datos: bytes, final: bool) -> bytes:
+        t0 = time.thread_time()
+        if self.codificacion == "br":
+            salida = self._obj.process(datos)
+            salida += self._obj.finish() if final else self._obj.flush()
+        else:
+            salida = self._obj.compress(datos)
+            salida += self._obj.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+        self.cpu_segundos += time.thread_time() - t0
+        self.bytes_originales += len(datos)
+        self.bytes_comprimidos += len(salida)
+        return salida
+
+    def registrar(self) -> None:
+        metricas.incrementar("compresion_respuestas", codificacion=self.codificacion)
+        metricas.incrementar("compresion_bytes_originales", self.bytes_originales)
+        metricas.incrementar("compresion_bytes_comprimidos", self.bytes_comprimidos)
+        metricas.incrementar("compresion_cpu_segundos", self.cpu_segundos)
+
+
+class _VarianteEstatica:
+    """
+    Archivo estático con sus versiones ya comprimidas (gzip y, si hay, brotli).
+    """
+
+    def __init__(self, ruta: str, datos: bytes) -> None:
+        estado = os.stat(ruta)
+        self.ruta = ruta
+        self.mtime = estado.st_mtime
+        self.media_type = mimetypes.guess_type(ruta)[0] or "application/octet-stream"
+        self.etag = '"' + hashlib.md5(f"{estado.st_mtime}-{estado.st_size}".encode()).hexdigest() + '"'
+        self.cuerpos = {"gzip": gzip.compress(datos, compresslevel=9)}
+        if brotli is not None:
+            self.cuerpos["br"] = brotli.compress(datos, quality=11)
+
+    def vigente(self) -> bool:
+        try:
+            return os.stat(self.ruta).st_mtime == self.mtime
+        except OSError:
+            return False
+
+
+# -----------------------------
+# Middleware ASGI
+# -----------------------------
+class MiddlewareCompresion:
+    """
+    Comprime con gzip/brotli (negociado por Accept-Encoding) las respuestas
+    dinámicas cuyo cuerpo supera `minimo_bytes`.
+
+    - Respuestas completas: se comprimen de una vez y se ajusta Content-Length.
+    - StreamingResponse: se acumula hasta el umbral y luego cada bloque se
+      comprime y se envía de forma incremental.
+    - Archivos estáticos de `estaticos` ({prefijo_url: carpeta}): se
+      precomprimen al arrancar con el nivel máximo y se sirven directo
+      mientras el archivo no cambie en disco.
+
+    Los niveles por defecto (gzip 5, brotli 4) priorizan poco CPU por respuesta.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimo_bytes: int = 1024,
+        nivel_gzip: int = 5,
+        calidad_brotli: int = 4,
+        estaticos: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.app = app
+        self.minimo_bytes = minimo_bytes
+        self.niveles = {"gzip": nivel_gzip, "br": calidad_brotli}
+        self._estaticos: Dict[str, _VarianteEstatica] = {}
+        for prefijo, carpeta in (estaticos or {}).items():
+            self._precomprimir(prefijo.rstrip("/"), carpeta)
+
+    def _precomprimir(self, prefijo: str, carpeta: str) -> None:
+        for raiz, _, archivos in os.walk(carpeta):
+            for nombre in archivos:
+                ruta = os.path.join(raiz, nombre)
+                media_type = mimetypes.guess_type(ruta)[0] or ""
+                if not _es_comprimible(media_type):
+                    continue
+                with open(ruta, "rb") as f:
+                    datos = f.read()
+                if len(datos) < self.minimo_bytes:
+                    continue
+                relativa = os.path.relpath(ruta, carpeta).replace(os.sep, "/")
+                self._estaticos[f"{prefijo}/{relativa}"] = _VarianteEstatica(ruta, datos)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        scope, codificacion_validador = _sin_codificacion_en_validadores(scope)
+        headers = Headers(scope=scope)
+        codificacion = negociar_codificacion(headers.get("accept-encoding", ""))
+        if "range" in headers:
+            await self.app(scope, receive, send)
+            return
+
+        variante = self._estaticos.get(scope["path"])
+        if (
+            codificacion is not None
+            and variante is not None
+            and scope["method"] == "GET"
+            and variante.vigente()
+        ):
+            await self._enviar_estatico(variante, codificacion, headers, send)
+            return
+
+        respondedor = _RespondedorComprimido(self, codificacion, send, codificacion_validador)
+        await self.app(scope, receive, respondedor.send)
+
+    async def _enviar_estatico(
+        self,
+        variante: _VarianteEstatica,
+        codificacion: str,
+        headers: Headers,
+        send,
+    ) -> None:
+        if headers.get("if-none-match") == variante.etag:
+            await send({
+                "type": "http.response.start",
+                "status": 304,
+                "headers": [(b"etag", variante.etag.encode()), (b"vary", b"Accept-Encoding")],
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        cuerpo = variante.cuerpos[codificacion]
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", variante.media_type.encode()),
+                (b"content-encoding", codificacion.encode()),
+                (b"content-length", str(len(cuerpo)).encode()),
+                (b"etag", variante.etag.encode()),
+                (b"vary", b"Accept-Encoding"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": cuerpo})
+        metricas.incrementar("compresion_estaticos_precomprimidos", codificacion=codificacion)
+
+
+class _RespondedorComprimido:
+    """
+    Envoltura de `send` que decide, al ver el primer bloque del cuerpo,
+    si la respuesta se comprime o pasa tal cual. Las respuestas de un tipo
+    comprimible llevan `Vary: Accept-Encoding` aunque no se compriman
+    (cliente sin gzip/br o cuerpo bajo el umbral), para que un caché no
+    entregue esa versión a quien pidió otra.
+    """
+
+    def __init__(
+        self,
+        middleware: MiddlewareCompresion,
+        codificacion: Optional[str],
+        send,
+        codificacion_validador: Optional[str] = None,
+    ) -> None:
+        self.middleware = middleware
+        self.codificacion = codificacion
+        # Codificación que traía el ETag de If-None-Match: un 304 la repite
+        self.codificacion_validador = codificacion_validador
+        self.send_original = send
+        self.inicio: Optional[dict] = None
+        self.pendiente: List[bytes] = []
+        self.tamano_pendiente = 0
+        self.compresor: Optional[_Compresor] = None
+        self.pasar_directo = False
+
+    async def send(self, mensaje: dict) -> None:
+        if mensaje["type"] == "http.response.start":
+            self.inicio = dict(mensaje)
+            self.inicio["headers"] = list(mensaje.get("headers", []))
+            headers = MutableHeaders(raw=self.inicio["headers"])
+            if self.inicio["status"] == 304 and self.codificacion_validador and "etag" in headers:
+                headers["ETag"] = etag_codificado(headers["etag"], self.codificacion_validador)
+                headers.add_vary_header("Accept-Encoding")
+            if (
+                "content-encoding" in headers
+                or not _es_comprimible(headers.get("content-type", ""))
+                or self.inicio["status"] in (204, 304)
+            ):
+                self.pasar_directo = True
+                await self.send_original(self.inicio)
+            elif self.codificacion is None:
+                self.pasar_directo = True
+                headers.add_vary_header("Accept-Encoding")
+                await self.send_original(self.inicio)
+            return
+
+        if mensaje["type"] != "http.response.body" or self.pasar_directo:
+            await self.send_original(mensaje)
+            return
+
+        cuerpo = mensaje.get("body", b"")
+        hay_mas = mensaje.get("more_body", False)
+
+        if self.compresor is not None:
+            salida = self.compresor.comprimir(cuerpo, final=not hay_mas)
+            await self.send_original(
+                {"type": "http.response.body", "body": salida, "more_body": hay_mas}
+            )
+            if not hay_mas:
+                self.compresor.registrar()
+            return
+
+        # Aún no se decide: acumular hasta alcanzar el umbral o el final
+        self.pendiente.append(cuerpo)
+        self.tamano_pendiente += len(cuerpo)
+        if self.tamano_pendiente < self.middleware.minimo_bytes:
+            if hay_mas:
+                return
+            MutableHeaders(raw=self.inicio["headers"]).add_vary_header("Accept-Encoding")
+            await self.send_original(self.inicio)
+            await self.send_original(
+                {"type": "http.response.body", "body": b"".join(self.pendiente)}
+            )
+            return
+
+        self.compresor = _Compresor(
+            self.codificacion, self.middleware.niveles[self.codificacion]
+        )
+        salida = self.compresor.comprimir(b"".join(self.pendiente), final=not hay_mas)
+        self.pendiente = []
+
+        headers = MutableHeaders(raw=self.inicio["headers"])
+        headers["Content-Encoding"] = self.codificacion
+        headers.add_vary_header("Accept-Encoding")
+        if "etag" in headers:
+            headers["ETag"] = etag_codificado(headers["etag"], self.codificacion)
+        if hay_mas:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(len(salida))
+
+        await self.send_original(self.inicio)
+        await self.send_original(
+            {"type": "http.response.body", "body": salida, "more_body": hay_mas}
+        )
+        if not hay_mas:
+            self.compresor.registrar()
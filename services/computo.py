@@ -0,0 +1,191 @@
+# services/computo.py
+"""
+Ejecución de cálculos vectorizados grandes en varios núcleos.
+
+Un lote se parte en fragmentos (rangos de filas) y cada fragmento lo
+procesa un proceso del pool. Las entradas y salidas viajan en bloques de
+memoria compartida (`multiprocessing.shared_memory`): el proceso padre
+copia cada entrada una sola vez, los hijos leen y escriben sus filas
+directamente sobre esos bloques y solo se envían por pickle los nombres,
+formas y parámetros pequeños.
+
+Un "kernel" es una función de nivel de módulo con la firma
+`kernel(entradas, salidas, inicio, fin, **parametros)` que escribe
+`salidas[nombre][inicio:fin]`. Con ejecución "inline" el mismo kernel se
+corre en el proceso actual, fragmento por fragmento, con el mismo
+resultado.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.metricas import metricas
+
+EJECUCIONES = ("inline", "pool")
+
+# nombre -> (forma, dtype) de cada salida
+EspecSalidas = Dict[str, Tuple[Tuple[int, ...], Any]]
+# nombre -> (nombre del bloque compartido, forma, dtype)
+EspecBloques = Dict[str, Tuple[str, Tuple[int, ...], str]]
+
+
+def procesos_por_defecto() -> int:
+    try:
+        return max(len(os.sched_getaffinity(0)), 1)
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def fragmentos(total: int, tamano: int) -> List[Tuple[int, int]]:
+    """
+    Rangos [inicio, fin) de `tamano` filas que cubren `total`.
+    """
+    return [(inicio, min(inicio + tamano, total)) for inicio in range(0, total, tamano)]
+
+
+# -----------------------------
+# Lado del proceso hijo
+# -----------------------------
+def _adjuntar(especificacion: EspecBloques) -> Tuple[List[shared_memory.SharedMemory], Dict[str, np.ndarray]]:
+    bloques, arreglos = [], {}
+    for nombre, (bloque_nombre, forma, dtype) in especificacion.items():
+        # Los hijos "spawn" comparten el resource_tracker del padre, que es
+        # quien borra el bloque (unlink) al terminar el lote
+        bloque = shared_memory.SharedMemory(name=bloque_nombre)
+        bloques.append(bloque)
+        arreglos[nombre] = np.ndarray(forma, dtype=np.dtype(dtype), buffer=bloque.buf)
+    return bloques, arreglos
+
+
+def _ejecutar_fragmento(
+    kernel: Callable[..., None],
+    entradas: EspecBloques,
+    salidas: EspecBloques,
+    inicio: int,
+    fin: int,
+    parametros: Dict[str, Any],
+) -> None:
+    bloques_entrada, arreglos_entrada = _adjuntar(entradas)
+    bloques_salida, arreglos_salida = _adjuntar(salidas)
+    try:
+        kernel(arreglos_entrada, arreglos_salida, inicio, fin, **parametros)
+    finally:
+        # Las vistas deben soltarse antes de cerrar los bloques
+        del arreglos_entrada, arreglos_salida
+        for bloque in bloques_entrada + bloques_salida:
+            bloque.close()
+
+
+# -----------------------------
+# Lado del proceso padre
+# -----------------------------
+class EjecutorComputo:
+    """
+    Pool de procesos para kernels vectorizados sobre memoria compartida.
+    El pool se crea al primer uso ("spawn", como el de documentos).
+    """
+
+    def __init__(self, procesos: Optional[int] = None) -> None:
+        self.procesos = procesos or procesos_por_defecto()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _obtener_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.procesos, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def _reiniciar_pool(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def ejecutar(
+        self,
+        kernel: Callable[..., None],
+        rangos: List[Tuple[int, int]],
+        entradas: Dict[str, np.ndarray],
+        salidas: EspecSalidas,
+        parametros: Optional[Dict[str, Any]] = None,
+        ejecucion: str = "pool",
+    ) -> Dict[str, np.ndarray]:
+        """
+        Corre `kernel` sobre cada rango y devuelve las salidas completas.
+        """
+        if ejecucion not in EJECUCIONES:
+            raise ValueError(f"Ejecución desconocida: {ejecucion}. Use: {', '.join(EJECUCIONES)}")
+        parametros = parametros or {}
+        metricas.incrementar("computo_fragmentos", len(rangos), ejecucion=ejecucion)
+
+        if ejecucion == "inline" or len(rangos) <= 1:
+            resultado = {nombre: np.zeros(forma, dtype=dtype) for nombre, (forma, dtype) in salidas.items()}
+            for inicio, fin in rangos:
+                kernel(entradas, resultado, inicio, fin, **parametros)
+            return resultado
+
+        bloques: List[shared_memory.SharedMemory] = []
+        vistas: Dict[str, np.ndarray] = {}
+        try:
+            espec_entradas: EspecBloques = {}
+            for nombre, arreglo in entradas.items():
+                arreglo = np.ascontiguousarray(arreglo)
+                bloque = shared_memory.SharedMemory(create=True, size=max(arreglo.nbytes, 1))
+                bloques.append(bloque)
+                np.ndarray(arreglo.shape, dtype=arreglo.dtype, buffer=bloque.buf)[...] = arreglo
+                espec_entradas[nombre] = (bloque.name, arreglo.shape, arreglo.dtype.str)
+
+            espec_salidas: EspecBloques = {}
+            for nombre, (forma, dtype) in salidas.items():
+                dtype = np.dtype(dtype)
+                bloque = shared_memory.SharedMemory(
+                    create=True, size=max(int(np.prod(forma)) * dtype.itemsize, 1)
+                )
+                bloques.append(bloque)
+                vistas[nombre] = np.ndarray(forma, dtype=dtype, buffer=bloque.buf)
+                vistas[nombre][...] = 0
+                espec_salidas[nombre] = (bloque.name, tuple(forma), dtype.str)
+
+            pool = self._obtener_pool()
+            try:
+                futuros = [
+                    pool.submit(_ejecutar_fragmento, kernel, espec_entradas, espec_salidas, inicio, fin, parametros)
+                    for inicio, fin in rangos
+                ]
+                # Se espera a todos antes de liberar los bloques, aunque alguno falle
+                wait(futuros)
+                for futuro in futuros:
+                    futuro.result()
+            except BrokenProcessPool:
+                # Un hijo murió: el próximo lote usa un pool nuevo
+                self._reiniciar_pool()
+                raise
+
+            # Copia fuera de los bloques antes de liberarlos
+            return {nombre: vista.copy() for nombre, vista in vistas.items()}
+        finally:
+            # Las vistas deben soltarse antes de cerrar los bloques
+            vistas.clear()
+            for bloque in bloques:
+                bloque.close()
+                bloque.unlink()
+
+    def cerrar(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+
+# Instancia única del proceso
+ejecutor_computo = EjecutorComputo(procesos=int(os.getenv("BANCO_COMPUTO_PROCESOS", "0")) or None)
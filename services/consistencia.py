@@ -0,0 +1,46 @@
+# services/consistencia.py
+
+import time
+
+from database import COOKIE_ESCRITURA, replica
+from services.admision import es_post_de_lectura
+
+METODOS_LECTURA = ("GET", "HEAD", "OPTIONS")
+
+
+class MiddlewareEscrituraPropia:
+    """
+    Lectura de lo propio con réplica: después de cada escritura exitosa
+    (POST/PUT/PATCH/DELETE con status < 400, salvo los POST que solo leen,
+    ver `es_post_de_lectura`) deja una cookie con el momento
+    en que terminó. `get_session_lectura` la compara con la antigüedad de la
+    réplica y, si la réplica todavía no incluye esa escritura, lee de la
+    base de datos principal.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] in METODOS_LECTURA
+            or es_post_de_lectura(scope["path"])
+            or not replica.activa
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_con_cookie(mensaje):
+            if mensaje["type"] == "http.response.start" and mensaje["status"] < 400:
+                cookie = (
+                    f"{COOKIE_ESCRITURA}={time.time():.6f}; Path=/; "
+                    f"Max-Age={int(replica.lag_maximo_segundos) + 1}; HttpOnly; SameSite=Lax"
+                )
+                mensaje = dict(mensaje)
+                mensaje["headers"] = list(mensaje.get("headers", [])) + [
+                    (b"set-cookie", cookie.encode("latin-1"))
+                ]
+            await send(mensaje)
+
+        await self.app(scope, receive, send_con_cookie)
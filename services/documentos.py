@@ -0,0 +1,274 @@
+# services/documentos.py
+#
+# Renderizado de documentos de Reporte (PDF y XLSX) sin dependencias externas.
+# Este módulo no importa la base de datos ni los modelos: las funciones reciben
+# un dict con datos simples para poder ejecutarse en un proceso aparte.
+
+import io
+import zipfile
+import zlib
+from typing import Any, Dict, List, Sequence
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from services.amortizacion import tabla_amortizacion
+
+FORMATOS = {
+    "pdf": "application/pdf",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+COLUMNAS_AMORTIZACION = ["Mes", "Cuota", "Interés", "Abono a capital", "Saldo"]
+
+
+# -----------------------------
+# Secciones comunes
+# -----------------------------
+def _secciones(datos: Dict[str, Any]) -> List[tuple]:
+    """
+    Pares (título, [(etiqueta, valor), ...]) comunes a ambos formatos.
+    """
+    secciones = []
+    etiquetas = {
+        "usuario": ("Usuario", ["idUsuario", "nombre", "correo", "telefono", "ingresos", "gastos"]),
+        "credito": ("Crédito", ["idCredito", "tipo", "monto", "plazo", "descripcion"]),
+        "interes": ("Interés", ["idInteres", "tipo", "tasa"]),
+        "simulacion": ("Simulación", ["idSimulacion", "cuotaMensual", "interesTotal", "saldoFinal"]),
+    }
+    for clave, (titulo, campos) in etiquetas.items():
+        registro = datos.get(clave)
+        if registro:
+            secciones.append((titulo, [(campo, registro.get(campo)) for campo in campos]))
+    return secciones
+
+
+def _texto(valor: Any) -> str:
+    if valor is None:
+        return "-"
+    if isinstance(valor, float):
+        return f"{valor:,.2f}"
+    return str(valor)
+
+
+# -----------------------------
+# PDF
+# -----------------------------
+def _pdf_cadena(texto: str) -> bytes:
+    # Fuentes estándar con WinAnsiEncoding (cp1252 cubre tildes y ñ)
+    crudo = texto.encode("cp1252", errors="replace")
+    return b"(" + crudo.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _pdf_paginas(datos: Dict[str, Any]) -> List[List[tuple]]:
+    """
+    Distribuye las líneas en páginas A4. Cada línea es (fuente, tamaño, x, texto).
+    """
+    lineas: List[tuple] = []
+    reporte = datos["reporte"]
+    lineas.append(("F2", 16, 50, reporte.get("titulo") or "Reporte"))
+    lineas.append(("F1", 9, 50, f"Reporte #{reporte['idReporte']} - fecha {reporte.get('fecha') or '-'}"))
+    if reporte.get("descripcion"):
+        lineas.append(("F1", 10, 50, reporte["descripcion"]))
+    lineas.append(("F1", 10, 50, ""))
+
+    for titulo, campos in _secciones(datos):
+        lineas.append(("F2", 12, 50, titulo))
+        for campo, valor in campos:
+            lineas.append(("F1", 10, 60, f"{campo}: {_texto(valor)}"))
+        lineas.append(("F1", 10, 50, ""))
+
+    tabla = datos.get("amortizacion") or []
+    if tabla:
+        lineas.append(("F2", 12, 50, "Tabla de amortización"))
+        lineas.append(("F3", 8, 50, "".join(f"{c:>18}" if i else f"{c:>5}" for i, c in enumerate(COLUMNAS_AMORTIZACION))))
+        for fila in tabla:
+            lineas.append(("F3", 8, 50, f"{int(fila[0]):>5}" + "".join(f"{v:>18,.2f}" for v in fila[1:])))
+
+    paginas: List[List[tuple]] = [[]]
+    y = 800
+    for fuente, tamano, x, texto in lineas:
+        alto = tamano + 4
+        if y - alto < 40:
+            paginas.append([])
+            y = 800
+        y -= alto
+        paginas[-1].append((fuente, tamano, x, y, texto))
+    return paginas
+
+
+def renderizar_pdf(datos: Dict[str, Any]) -> bytes:
+    paginas = _pdf_paginas(datos)
+    objetos: List[bytes] = []
+
+    def agregar(contenido: bytes) -> int:
+        objetos.append(contenido)
+        return len(objetos)
+
+    catalogo = agregar(b"")  # se completa al final
+    raiz_paginas = agregar(b"")
+    fuentes = {
+        nombre: agregar(
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /" + base + b" /Encoding /WinAnsiEncoding >>"
+        )
+        for nombre, base in (("F1", b"Helvetica"), ("F2", b"Helvetica-Bold"), ("F3", b"Courier"))
+    }
+    recursos = b"<< /Font << " + b" ".join(
+        f"/{nombre} {num} 0 R".encode() for nombre, num in fuentes.items()
+    ) + b" >> >>"
+
+    hijos = []
+    for pagina in paginas:
+        flujo = b"\n".join(
+            f"BT /{fuente} {tamano} Tf {x} {y} Td ".encode() + _pdf_cadena(texto) + b" Tj ET"
+            for fuente, tamano, x, y, texto in pagina
+        )
+        comprimido = zlib.compress(flujo)
+        contenido = agregar(
+            f"<< /Length {len(comprimido)} /Filter /FlateDecode >>\nstream\n".encode()
+            + comprimido + b"\nendstream"
+        )
+        hijos.append(agregar(
+            f"<< /Type /Page /Parent {raiz_paginas} 0 R /MediaBox [0 0 595 842] "
+            f"/Contents {contenido} 0 R /Resources ".encode() + recursos + b" >>"
+        ))
+
+    objetos[catalogo - 1] = f"<< /Type /Catalog /Pages {raiz_paginas} 0 R >>".encode()
+    objetos[raiz_paginas - 1] = (
+        f"<< /Type /Pages /Count {len(hijos)} /Kids [".encode()
+        + b" ".join(f"{h} 0 R".encode() for h in hijos) + b"] >>"
+    )
+
+    salida = io.BytesIO()
+    salida.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    posiciones = []
+    for numero, contenido in enumerate(objetos, 1):
+        posiciones.append(salida.tell())
+        salida.write(f"{numero} 0 obj\n".encode() + contenido + b"\nendobj\n")
+    inicio_xref = salida.tell()
+    salida.write(f"xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n".encode())
+    for posicion in posiciones:
+        salida.write(f"{posicion:010d} 00000 n \n".encode())
+    salida.write(
+        f"trailer\n<< /Size {len(objetos) + 1} /Root {catalogo} 0 R >>\n"
+        f"startxref\n{inicio_xref}\n%%EOF\n".encode()
+    )
+    return salida.getvalue()
+
+
+# -----------------------------
+# XLSX
+# -----------------------------
+def _columna(indice: int) -> str:
+    letras = ""
+    indice += 1
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+
+def _xlsx_hoja(filas: Sequence[Sequence[Any]]) -> str:
+    partes = []
+    for i, fila in enumerate(filas, 1):
+        celdas = []
+        for j, valor in enumerate(fila):
+            ref = f"{_columna(j)}{i}"
+            if valor is None:
+                continue
+            if isinstance(valor, (int, float, np.floating, np.integer)) and not isinstance(valor, bool):
+                celdas.append(f'<c r="{ref}"><v>{float(valor)!r}</v></c>')
+            else:
+                celdas.append(f'<c r="{ref}" t="inlineStr"><is><t>{escape(str(valor))}</t></is></c>')
+        partes.append(f'<row r="{i}">{"".join(celdas)}</row>')
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        f'<sheetData>{"".join(partes)}</sheetData></worksheet>'
+    )
+
+
+def renderizar_xlsx(datos: Dict[str, Any]) -> bytes:
+    reporte = datos["reporte"]
+    resumen: List[List[Any]] = [
+        [reporte.get("titulo") or "Reporte"],
+        ["idReporte", reporte["idReporte"]],
+        ["fecha", reporte.get("fecha")],
+        ["descripcion", reporte.get("descripcion")],
+        [],
+    ]
+    for titulo, campos in _secciones(datos):
+        resumen.append([titulo])
+        resumen.extend([campo, valor] for campo, valor in campos)
+        resumen.append([])
+
+    hojas = [("Resumen", resumen)]
+    tabla = datos.get("amortizacion") or []
+    if tabla:
+        hojas.append(("Amortización", [COLUMNAS_AMORTIZACION] + [list(f) for f in tabla]))
+
+    ns_rel = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    salida = io.BytesIO()
+    with zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            + "".join(
+                f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+                'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                for i in range(1, len(hojas) + 1)
+            )
+            + '</Types>'
+        ))
+        zf.writestr("_rels/.rels", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'<Relationship Id="rId1" Type="{ns_rel}/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>'
+        ))
+        zf.writestr("xl/workbook.xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            f'xmlns:r="{ns_rel}"><sheets>'
+            + "".join(
+                f'<sheet name="{escape(nombre)}" sheetId="{i}" r:id="rId{i}"/>'
+                for i, (nombre, _) in enumerate(hojas, 1)
+            )
+            + '</sheets></workbook>'
+        ))
+        zf.writestr("xl/_rels/workbook.xml.rels", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + "".join(
+                f'<Relationship Id="rId{i}" Type="{ns_rel}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+                for i in range(1, len(hojas) + 1)
+            )
+            + '</Relationships>'
+        ))
+        for i, (_, filas) in enumerate(hojas, 1):
+            zf.writestr(f"xl/worksheets/sheet{i}.xml", _xlsx_hoja(filas))
+    return salida.getvalue()
+
+
+# -----------------------------
+# Punto de entrada para el pool de procesos
+# -----------------------------
+def renderizar(formato: str, datos: Dict[str, Any]) -> bytes:
+    """
+    Calcula la tabla de amortización y genera el documento.
+    Se ejecuta en un proceso del pool (recibe y devuelve datos serializables).
+    """
+    credito, interes = datos.get("credito"), datos.get("interes")
+    if credito and interes and credito.get("plazo"):
+        datos = dict(datos, amortizacion=tabla_amortizacion(
+            credito["monto"], credito["plazo"], interes["tasa"]
+        ).tolist())
+    if formato == "pdf":
+        return renderizar_pdf(datos)
+    if formato == "xlsx":
+        return renderizar_xlsx(datos)
+    raise ValueError(f"Formato desconocido: {formato}")
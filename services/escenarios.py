@@ -0,0 +1,257 @@
+# services/escenarios.py
+"""
+Escenarios sobre el cronograma de un crédito (sistema francés): abonos
+extraordinarios (parciales o totales, reduciendo plazo o cuota), periodos
+de gracia y refinanciación.
+
+Entre dos eventos la tasa y la cuota son constantes, así que cada tramo se
+calcula de forma cerrada y vectorizada:
+
+    saldo(k) = S·(1+r)^k - c·((1+r)^k - 1) / r
+
+Un escenario son unos pocos tramos, sin bucles por mes.
+"""
+
+import math
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from services.amortizacion import cuota_francesa, tasa_mensual
+from services.memo_amortizacion import memo_amortizacion
+
+TIPOS_EVENTO = ("abono", "gracia", "refinanciacion")
+# Abono: qué se reduce con el saldo restante
+REDUCCIONES = ("plazo", "cuota")
+# Gracia: "total" capitaliza el interés; "intereses" solo paga el interés
+MODALIDADES_GRACIA = ("total", "intereses")
+# Saldo por debajo del cual el crédito se considera pagado
+EPSILON = 0.005
+
+
+class Cronograma:
+    """
+    Columnas mes a mes de un cronograma: cuota pagada, interés causado,
+    abono extraordinario y saldo al cierre.
+    """
+
+    def __init__(self) -> None:
+        self._cuotas: List[np.ndarray] = []
+        self._intereses: List[np.ndarray] = []
+        self._saldos: List[np.ndarray] = []
+        self.abonos_extra: Dict[int, float] = {}
+        self.costos = 0.0
+        self.meses = 0
+
+    def agregar(self, cuotas: np.ndarray, intereses: np.ndarray, saldos: np.ndarray) -> None:
+        self._cuotas.append(cuotas)
+        self._intereses.append(intereses)
+        self._saldos.append(saldos)
+        self.meses += len(cuotas)
+
+    def columnas(self) -> Dict[str, np.ndarray]:
+        def unir(partes):
+            return np.concatenate(partes) if partes else np.zeros(0)
+
+        return {
+            "cuota": unir(self._cuotas),
+            "interes": unir(self._intereses),
+            "saldo": unir(self._saldos),
+        }
+
+    def resumen(self) -> Dict[str, Any]:
+        columnas = self.columnas()
+        cuotas = columnas["cuota"]
+        con_pago = cuotas[cuotas > 0]
+        abonos = sum(self.abonos_extra.values())
+        return {
+            # Un abono total cierra el crédito en su mes aunque no se pague cuota
+            "plazo": max([self.meses, *self.abonos_extra]),
+            "cuota_inicial": round(float(cuotas[0]), 2) if cuotas.size else 0.0,
+            "cuota_final": round(float(con_pago[-1]), 2) if con_pago.size else 0.0,
+            "cuota_maxima": round(float(cuotas.max()), 2) if cuotas.size else 0.0,
+            "interes_total": round(float(columnas["interes"].sum()), 2),
+            "abonos_extra": round(float(abonos), 2),
+            "costos": round(self.costos, 2),
+            "total_pagado": round(float(cuotas.sum()) + abonos, 2),
+        }
+
+
+def _tramo(saldo: float, r: float, cuota: float, meses: int):
+    """
+    `meses` pagos de `cuota` a tasa r desde `saldo`. Si el saldo se agota
+    antes, el último pago es solo lo que falta y el tramo se corta ahí.
+    Devuelve (cuotas, intereses, saldos).
+    """
+    k = np.arange(1, meses + 1, dtype=np.float64)
+    if r == 0:
+        saldos = saldo - cuota * k
+    else:
+        factor = np.power(1.0 + r, k)
+        saldos = saldo * factor - cuota * (factor - 1.0) / r
+    previos = np.concatenate(([saldo], saldos[:-1]))
+    intereses = previos * r
+    cuotas = np.full(meses, cuota)
+
+    pagado = np.flatnonzero(saldos <= EPSILON)
+    if pagado.size:
+        ultimo = int(pagado[0])
+        cuotas = cuotas[: ultimo + 1]
+        intereses = intereses[: ultimo + 1]
+        cuotas[ultimo] = previos[ultimo] * (1.0 + r)
+        saldos = np.concatenate((saldos[:ultimo], [0.0]))
+    return cuotas, intereses, saldos
+
+
+def _meses_para_pagar(saldo: float, r: float, cuota: float) -> int:
+    # Número de cuotas de valor `cuota` que cancelan `saldo` (se redondea hacia arriba)
+    if r == 0:
+        return max(math.ceil(saldo / cuota - 1e-9), 1)
+    return max(math.ceil(-math.log(1.0 - saldo * r / cuota) / math.log(1.0 + r) - 1e-9), 1)
+
+
+def cronograma(
+    monto: float,
+    plazo: int,
+    tasa: float,
+    eventos: Sequence[Dict[str, Any]] = (),
+    base: Optional[np.ndarray] = None,
+) -> Cronograma:
+    """
+    Cronograma del crédito aplicando `eventos` (dicts ordenados por mes; cada
+    evento ocurre al inicio de su mes, antes de pagar la cuota):
+
+    - abono:          {"mes", "monto" (None = pago total), "reducir": "plazo"|"cuota"}
+    - gracia:         {"mes", "meses", "modalidad": "total"|"intereses"}
+      total: no se paga y el interés se capitaliza; intereses: solo se paga
+      el interés. Al terminar, el plazo restante se corre.
+    - refinanciacion: {"mes", "tasa", "plazo" (None = el restante), "costo"}
+      el costo se suma al saldo.
+
+    `base` es la tabla sin eventos (`tabla_amortizacion`): hasta el primer
+    evento el cronograma es idéntico, así que esos meses se copian de ella.
+    """
+    resultado = Cronograma()
+    saldo = float(monto)
+    r = float(tasa_mensual(tasa))
+    restantes = int(plazo)
+    cuota = float(cuota_francesa(saldo, restantes, tasa))
+    aplicados = 0
+
+    def amortizar(meses: int) -> None:
+        nonlocal saldo, restantes
+        if meses <= 0 or saldo <= EPSILON:
+            return
+        if base is not None and not aplicados:
+            meses = min(meses, len(base))
+            cuotas, intereses, saldos = base[:meses, 1], base[:meses, 2], base[:meses, 4]
+        else:
+            cuotas, intereses, saldos = _tramo(saldo, r, cuota, meses)
+        resultado.agregar(cuotas, intereses, saldos)
+        saldo = float(saldos[-1])
+        restantes -= len(cuotas)
+
+    for evento in sorted(eventos, key=lambda e: e["mes"]):
+        mes = int(evento["mes"])
+        if mes <= resultado.meses:
+            raise ValueError(f"El evento del mes {mes} se cruza con uno anterior")
+        amortizar(mes - 1 - resultado.meses)
+        if saldo <= EPSILON:
+            raise ValueError(f"El crédito ya está pagado en el mes {mes}")
+
+        aplicados += 1
+        tipo = evento["tipo"]
+        if tipo not in TIPOS_EVENTO:
+            raise ValueError(f"Tipo de evento desconocido: {tipo}. Use: {', '.join(TIPOS_EVENTO)}")
+
+        if tipo == "abono":
+            reducir = evento.get("reducir") or "plazo"
+            if reducir not in REDUCCIONES:
+                raise ValueError(f"reducir debe ser uno de: {', '.join(REDUCCIONES)}")
+            extra = saldo if evento.get("monto") is None else min(float(evento["monto"]), saldo)
+            resultado.abonos_extra[mes] = resultado.abonos_extra.get(mes, 0.0) + extra
+            saldo -= extra
+            if saldo <= EPSILON:
+                saldo = 0.0
+                break
+            if reducir == "cuota":
+                cuota = float(cuota_francesa(saldo, restantes, r * 100.0))
+            else:
+                restantes = _meses_para_pagar(saldo, r, cuota)
+
+        elif tipo == "gracia":
+            meses = int(evento.get("meses") or 0)
+            modalidad = evento.get("modalidad") or "total"
+            if meses < 1 or modalidad not in MODALIDADES_GRACIA:
+                raise ValueError(
+                    f"La gracia requiere meses >= 1 y modalidad en: {', '.join(MODALIDADES_GRACIA)}"
+                )
+            pago = 0.0 if modalidad == "total" else saldo * r
+            cuotas, intereses, saldos = _tramo(saldo, r, pago, meses)
+            resultado.agregar(cuotas, intereses, saldos)
+            saldo = float(saldos[-1])
+            cuota = float(cuota_francesa(saldo, restantes, r * 100.0))
+
+        else:
+            if evento.get("tasa") is None:
+                raise ValueError("La refinanciación requiere la nueva tasa")
+            costo = float(evento.get("costo") or 0.0)
+            resultado.costos += costo
+            saldo += costo
+            r = float(tasa_mensual(evento["tasa"]))
+            if evento.get("plazo") is not None:
+                restantes = int(evento["plazo"])
+            cuota = float(cuota_francesa(saldo, restantes, r * 100.0))
+
+    amortizar(restantes)
+    return resultado
+
+
+def comparar(base: Dict[str, Any], escenario: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Diferencias escenario - base de los valores numéricos del resumen.
+    """
+    return {
+        clave: round(escenario[clave] - base[clave], 2)
+        for clave in ("plazo", "cuota_final", "cuota_maxima", "interes_total", "total_pagado")
+    }
+
+
+def evaluar_escenarios(
+    monto: float,
+    plazo: int,
+    tasa: float,
+    escenarios: Sequence[Dict[str, Any]],
+    incluir_tabla: bool = False,
+) -> Dict[str, Any]:
+    """
+    Toma el cronograma base de la memoización (se calcula una sola vez por
+    condiciones) y evalúa cada escenario contra él.
+    """
+    tabla_base = memo_amortizacion.tabla(monto, plazo, tasa)
+    base = cronograma(monto, plazo, tasa, base=tabla_base).resumen()
+    resultados = []
+    for i, escenario in enumerate(escenarios, start=1):
+        calculado = cronograma(monto, plazo, tasa, escenario["eventos"], base=tabla_base)
+        resumen = calculado.resumen()
+        item: Dict[str, Any] = {
+            "nombre": escenario.get("nombre") or f"Escenario {i}",
+            **resumen,
+            "diferencia": comparar(base, resumen),
+        }
+        if incluir_tabla:
+            columnas = calculado.columnas()
+            item["tabla"] = [
+                {
+                    "mes": mes,
+                    "cuota": round(float(c), 2),
+                    "interes": round(float(interes), 2),
+                    "abono_extra": round(calculado.abonos_extra.get(mes, 0.0), 2),
+                    "saldo": round(float(s), 2),
+                }
+                for mes, (c, interes, s) in enumerate(
+                    zip(columnas["cuota"], columnas["interes"], columnas["saldo"]), start=1
+                )
+            ]
+        resultados.append(item)
+    return {"base": base, "escenarios": resultados}
@@ -0,0 +1,270 @@
+# services/estres.py
+"""
+Prueba de estrés de tasa sobre todo el portafolio.
+
+Recorre Crédito + último Interés + Usuario con un cursor del lado del
+servidor (`yield_per`), en lotes ordenados por usuario. Por lote arma una
+matriz (créditos × escenarios) y calcula cuota e interés de todos los
+choques a la vez con broadcasting. La memoria queda acotada por el tamaño
+del lote más los acumuladores por grupo (tipo, categoría, segmento), que
+no crecen con el número de créditos.
+
+Los choques van en puntos básicos sobre la tasa anual nominal (12 × la
+tasa mensual de Interes.tasa): +100 pb suben la tasa mensual en 1/12 de
+punto porcentual.
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+
+from models.categoria import Categoria
+from models.credito import Credito
+from models.credito_categoria import CreditoCategoria
+from models.interes import Interes
+from models.usuario import Usuario
+from services.amortizacion import cuota_francesa
+from services.serializacion import a_json
+
+CHOQUES_POR_DEFECTO = (-300, -200, -100, 100, 200, 300)
+
+# Segmentos de usuario por ingresos mensuales: (límite superior, nombre)
+SEGMENTOS_INGRESOS = ((2_000_000, "bajo"), (5_000_000, "medio"), (float("inf"), "alto"))
+
+
+def etiqueta_choque(pb: int) -> str:
+    return "base" if pb == 0 else f"{pb:+d}"
+
+
+_LIMITES_SEGMENTO = np.array([limite for limite, _ in SEGMENTOS_INGRESOS[:-1]])
+_NOMBRES_SEGMENTO = np.array([nombre for _, nombre in SEGMENTOS_INGRESOS])
+
+
+def _segmentos(ingresos: np.ndarray) -> np.ndarray:
+    return _NOMBRES_SEGMENTO[np.searchsorted(_LIMITES_SEGMENTO, ingresos, side="right")]
+
+
+def _segmento(ingresos: float) -> str:
+    return next(nombre for limite, nombre in SEGMENTOS_INGRESOS if ingresos < limite)
+
+
+class Acumulador:
+    """
+    Sumas por grupo (créditos, monto, cuota e interés por escenario).
+    """
+
+    def __init__(self, escenarios: int) -> None:
+        self.escenarios = escenarios
+        self.grupos: Dict[Any, Dict[str, Any]] = {}
+
+    def agregar(self, claves: np.ndarray, monto: np.ndarray, cuotas: np.ndarray, intereses: np.ndarray) -> None:
+        if claves.size == 0:
+            return
+        unicas, indices = np.unique(claves, return_inverse=True)
+        sumas_cuota = np.zeros((len(unicas), self.escenarios))
+        sumas_interes = np.zeros((len(unicas), self.escenarios))
+        np.add.at(sumas_cuota, indices, cuotas)
+        np.add.at(sumas_interes, indices, intereses)
+        cantidades = np.bincount(indices, minlength=len(unicas))
+        montos = np.bincount(indices, weights=monto, minlength=len(unicas))
+
+        for i, clave in enumerate(unicas.tolist()):
+            grupo = self.grupos.setdefault(
+                clave,
+                {
+                    "creditos": 0,
+                    "monto": 0.0,
+                    "cuota": np.zeros(self.escenarios),
+                    "interes": np.zeros(self.escenarios),
+                },
+            )
+            grupo["creditos"] += int(cantidades[i])
+            grupo["monto"] += float(montos[i])
+            grupo["cuota"] += sumas_cuota[i]
+            grupo["interes"] += sumas_interes[i]
+
+    def resultado(self, etiquetas: List[str], nombres: Optional[Dict[Any, str]] = None) -> Dict[str, Any]:
+        salida = {}
+        for clave, grupo in sorted(self.grupos.items(), key=lambda item: str(item[0])):
+            salida[str(clave)] = _resumen_grupo(grupo, etiquetas)
+            if nombres is not None:
+                salida[str(clave)]["nombre"] = nombres.get(clave)
+        return salida
+
+    def total(self, etiquetas: List[str]) -> Dict[str, Any]:
+        suma = {
+            "creditos": sum(g["creditos"] for g in self.grupos.values()),
+            "monto": sum(g["monto"] for g in self.grupos.values()),
+            "cuota": sum((g["cuota"] for g in self.grupos.values()), np.zeros(self.escenarios)),
+            "interes": sum((g["interes"] for g in self.grupos.values()), np.zeros(self.escenarios)),
+        }
+        return _resumen_grupo(suma, etiquetas)
+
+
+def _resumen_grupo(grupo: Dict[str, Any], etiquetas: List[str]) -> Dict[str, Any]:
+    cuota, interes = grupo["cuota"], grupo["interes"]
+    return {
+        "creditos": grupo["creditos"],
+        "monto": round(grupo["monto"], 2),
+        "cuota": {e: round(float(v), 2) for e, v in zip(etiquetas, cuota)},
+        "delta_cuota": {e: round(float(v - cuota[0]), 2) for e, v in zip(etiquetas[1:], cuota[1:])},
+        "interes": {e: round(float(v), 2) for e, v in zip(etiquetas, interes)},
+        "delta_interes": {e: round(float(v - interes[0]), 2) for e, v in zip(etiquetas[1:], interes[1:])},
+    }
+
+
+def _consulta_portafolio() -> Any:
+    # Último interés de cada crédito (el vigente)
+    ultimo_interes = (
+        select(Interes.credito_id, func.max(Interes.idInteres).label("id"))
+        .group_by(Interes.credito_id)
+        .subquery()
+    )
+    return (
+        select(
+            Credito.idCredito,
+            Credito.usuario_id,
+            Credito.monto,
+            Credito.plazo,
+            Credito.tipo,
+            Interes.tasa,
+            Usuario.ingresos,
+            Usuario.gastos,
+        )
+        .join(ultimo_interes, ultimo_interes.c.credito_id == Credito.idCredito)
+        .join(Interes, Interes.idInteres == ultimo_interes.c.id)
+        .join(Usuario, Usuario.idUsuario == Credito.usuario_id)
+        .order_by(Credito.usuario_id, Credito.idCredito)
+    )
+
+
+def _categorias_de(session: Session, credito_ids: List[int]) -> List[Tuple[int, int]]:
+    return session.exec(
+        select(CreditoCategoria.credito_id, CreditoCategoria.categoria_id).where(
+            CreditoCategoria.credito_id.in_(credito_ids)
+        )
+    ).all()
+
+
+def estres_portafolio(
+    engine: Engine,
+    choques_pb: Sequence[int] = CHOQUES_POR_DEFECTO,
+    tamano_lote: int = 5000,
+) -> Iterator[bytes]:
+    """
+    Produce NDJSON: una línea por usuario con su cuota, interés y carga
+    (cuotas / ingresos) en cada escenario, y una línea final con los
+    agregados por tipo de crédito, categoría y segmento de ingresos.
+    """
+    choques = [0] + [int(c) for c in choques_pb if int(c) != 0]
+    etiquetas = [etiqueta_choque(c) for c in choques]
+    delta = np.array(choques, dtype=np.float64) / 1200.0  # puntos porcentuales mensuales
+    escenarios = len(choques)
+
+    por_tipo = Acumulador(escenarios)
+    por_categoria = Acumulador(escenarios)
+    por_segmento = Acumulador(escenarios)
+    usuarios_en_riesgo: Dict[str, np.ndarray] = {}
+    usuarios_por_segmento: Dict[str, int] = {}
+
+    # Usuario del final del lote anterior: puede seguir en el lote siguiente
+    pendiente: Optional[Dict[str, Any]] = None
+
+    def linea_usuario(u: Dict[str, Any]) -> bytes:
+        margen = u["ingresos"] - u["gastos"]
+        en_riesgo = u["cuota"] > margen
+        segmento = _segmento(u["ingresos"])
+        usuarios_por_segmento[segmento] = usuarios_por_segmento.get(segmento, 0) + 1
+        usuarios_en_riesgo[segmento] = usuarios_en_riesgo.get(segmento, np.zeros(escenarios, dtype=np.int64)) + en_riesgo
+        carga = u["cuota"] / u["ingresos"] if u["ingresos"] > 0 else np.full(escenarios, np.inf)
+        return a_json(
+            {
+                "tipo": "usuario",
+                "usuario_id": u["usuario_id"],
+                "segmento": segmento,
+                "creditos": u["creditos"],
+                "ingresos": u["ingresos"],
+                "margen": margen,
+                "cuota": {e: round(float(v), 2) for e, v in zip(etiquetas, u["cuota"])},
+                "interes": {e: round(float(v), 2) for e, v in zip(etiquetas, u["interes"])},
+                "carga": {e: (round(float(v), 4) if np.isfinite(v) else None) for e, v in zip(etiquetas, carga)},
+                "en_riesgo": [e for e, r in zip(etiquetas, en_riesgo) if r],
+            }
+        ) + b"\n"
+
+    yield a_json({"tipo": "parametros", "choques_pb": choques[1:], "escenarios": etiquetas}) + b"\n"
+
+    with Session(engine) as session:
+        filas = session.exec(_consulta_portafolio().execution_options(yield_per=tamano_lote))
+        for lote in filas.partitions():
+            ids, usuarios, montos, plazos, tipos, tasas, ingresos, gastos = zip(*lote)
+            usuarios = np.array(usuarios, dtype=np.int64)
+            montos = np.array(montos, dtype=np.float64)
+            plazos = np.array(plazos, dtype=np.float64)
+            tipos = np.array(tipos, dtype=object).astype(str)
+            ingresos = np.array(ingresos, dtype=np.float64)
+            gastos = np.array(gastos, dtype=np.float64)
+
+            # (créditos × escenarios): todos los choques en una sola operación
+            tasas_choque = np.maximum(np.array(tasas, dtype=np.float64)[:, None] + delta[None, :], 0.0)
+            cuotas = cuota_francesa(montos[:, None], plazos[:, None], tasas_choque)
+            intereses = cuotas * plazos[:, None] - montos[:, None]
+
+            por_tipo.agregar(tipos, montos, cuotas, intereses)
+            por_segmento.agregar(_segmentos(ingresos), montos, cuotas, intereses)
+
+            posicion = {credito_id: i for i, credito_id in enumerate(ids)}
+            pares = _categorias_de(session, list(ids))
+            if pares:
+                filas_cat = np.array([posicion[c] for c, _ in pares])
+                categorias = np.array([cat for _, cat in pares], dtype=np.int64)
+                por_categoria.agregar(categorias, montos[filas_cat], cuotas[filas_cat], intereses[filas_cat])
+
+            # Sumas por usuario (las filas vienen ordenadas por usuario)
+            inicios = np.concatenate(([0], np.flatnonzero(np.diff(usuarios)) + 1))
+            cuotas_usuario = np.add.reduceat(cuotas, inicios, axis=0)
+            intereses_usuario = np.add.reduceat(intereses, inicios, axis=0)
+            creditos_usuario = np.diff(np.append(inicios, len(usuarios)))
+
+            for j, inicio in enumerate(inicios):
+                usuario = {
+                    "usuario_id": int(usuarios[inicio]),
+                    "ingresos": float(ingresos[inicio]),
+                    "gastos": float(gastos[inicio]),
+                    "creditos": int(creditos_usuario[j]),
+                    "cuota": cuotas_usuario[j],
+                    "interes": intereses_usuario[j],
+                }
+                if pendiente is not None:
+                    if pendiente["usuario_id"] == usuario["usuario_id"]:
+                        usuario["creditos"] += pendiente["creditos"]
+                        usuario["cuota"] = usuario["cuota"] + pendiente["cuota"]
+                        usuario["interes"] = usuario["interes"] + pendiente["interes"]
+                    else:
+                        yield linea_usuario(pendiente)
+                pendiente = usuario
+
+        if pendiente is not None:
+            yield linea_usuario(pendiente)
+
+        nombres_categoria = dict(session.exec(select(Categoria.idCategoria, Categoria.nombre)).all())
+
+    segmentos = por_segmento.resultado(etiquetas)
+    for segmento, datos in segmentos.items():
+        datos["usuarios"] = usuarios_por_segmento.get(segmento, 0)
+        riesgo = usuarios_en_riesgo.get(segmento, np.zeros(escenarios, dtype=np.int64))
+        datos["usuarios_en_riesgo"] = {e: int(v) for e, v in zip(etiquetas, riesgo)}
+
+    yield a_json(
+        {
+            "tipo": "agregados",
+            # Cada crédito tiene un solo tipo: el total sale de sumar los tipos
+            "total": por_tipo.total(etiquetas),
+            "por_tipo": por_tipo.resultado(etiquetas),
+            "por_categoria": por_categoria.resultado(etiquetas, nombres_categoria),
+            "por_segmento": segmentos,
+        }
+    ) + b"\n"
@@ -0,0 +1,325 @@
+# services/eventos.py
+
+import asyncio
+import os
+import threading
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event, func
+from sqlmodel import Session, select
+
+from database import engine
+from models.historial import Historial
+from services.metricas import metricas
+
+# Qué hacer cuando el buffer de un suscriptor lento se llena
+POLITICAS = ("antiguos", "recientes", "desconectar")
+
+# Cada cuánto se buscan en la BD los registros confirmados por otros
+# workers (los de este proceso se publican apenas hacen commit)
+SONDEO_SEGUNDOS = float(os.getenv("BANCO_HISTORIAL_SONDEO", "0.25"))
+
+
+def _como_evento(registro: Historial) -> Dict[str, Any]:
+    return {
+        "idHistorial": registro.idHistorial,
+        "entidad": registro.entidad,
+        "accion": registro.accion,
+        "descripcion": registro.descripcion,
+        "fecha": registro.fecha.isoformat() if registro.fecha else None,
+        "entidad_id": registro.entidad_id,
+        "cambios": registro.cambios,
+    }
+
+
+class Suscriptor:
+    """
+    Un cliente conectado al feed. Mientras está inactivo solo ocupa un
+    deque vacío y un asyncio.Event: no hay tareas ni sondeos por cliente.
+    """
+
+    def __init__(
+        self,
+        entidad: Optional[str],
+        accion: Optional[str],
+        max_buffer: int,
+        politica: str,
+    ) -> None:
+        self.entidad = entidad
+        self.accion = accion
+        self.max_buffer = max_buffer
+        self.politica = politica
+        self.buffer: Deque[Dict[str, Any]] = deque()
+        self.aviso = asyncio.Event()
+        self.descartados = 0
+        self.cerrado = False
+
+    def acepta(self, evento: Dict[str, Any]) -> bool:
+        return (
+            (self.entidad is None or evento["entidad"] == self.entidad)
+            and (self.accion is None or evento["accion"] == self.accion)
+        )
+
+    def entregar(self, evento: Dict[str, Any]) -> None:
+        if len(self.buffer) >= self.max_buffer:
+            metricas.incrementar("historial_eventos_descartados", politica=self.politica)
+            if self.politica == "desconectar":
+                self.cerrado = True
+                self.aviso.set()
+                return
+            self.descartados += 1
+            if self.politica == "recientes":
+                return
+            self.buffer.popleft()
+        self.buffer.append(evento)
+        self.aviso.set()
+
+    def tomar(self) -> List[Dict[str, Any]]:
+        eventos = list(self.buffer)
+        self.buffer.clear()
+        self.aviso.clear()
+        return eventos
+
+
+class HubHistorial:
+    """
+    Publicación/suscripción en memoria de los registros de Historial.
+
+    - Se alimenta de la tabla: un hilo lee los registros con id mayor al
+      último leído cada `sondeo_segundos`, así ve lo confirmado por
+      cualquier worker. Un commit con Historial en este proceso despierta
+      el hilo enseguida (listener de la sesión de SQLAlchemy).
+    - Como en SQLite los ids se asignan en orden de commit, lo leído sale
+      completo y ordenado: el buffer circular de los últimos eventos sirve
+      para reanudar desde un id (Last-Event-ID) sin ir a la base de datos.
+    - Los suscriptores se indexan por entidad: publicar un evento solo
+      recorre los interesados en esa entidad y los que no filtran.
+    """
+
+    def __init__(self, tamano_historico: int = 1000, sondeo_segundos: float = SONDEO_SEGUNDOS) -> None:
+        self.recientes: Deque[Dict[str, Any]] = deque(maxlen=tamano_historico)
+        self.sondeo_segundos = sondeo_segundos
+        self._por_entidad: Dict[Optional[str], Set[Suscriptor]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._ultimo_leido: Optional[int] = None
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+        self.ultimo_error: Optional[str] = None
+
+        metricas.registrar_calculado(
+            "historial_suscriptores", lambda: sum(len(s) for s in self._por_entidad.values())
+        )
+
+    # -----------------------------
+    # Lectura de la tabla (hilo en segundo plano)
+    # -----------------------------
+    def iniciar(self) -> None:
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        # Solo lo nuevo desde el arranque; lo anterior se reanuda desde la BD
+        with Session(engine) as session:
+            self._ultimo_leido = session.exec(select(func.max(Historial.idHistorial))).one() or 0
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="historial-feed", daemon=True)
+        self._hilo.start()
+
+    def despertar(self) -> None:
+        self._despertar.set()
+
+    def cerrar(self) -> None:
+        self._detener.set()
+        self._despertar.set()
+
+    def _bucle(self) -> None:
+        while not self._detener.is_set():
+            self._despertar.wait(timeout=self.sondeo_segundos)
+            self._despertar.clear()
+            try:
+                self.leer_nuevos()
+                self.ultimo_error = None
+            except Exception as exc:  # el hilo no debe morir por un error puntual
+                self.ultimo_error = f"{type(exc).__name__}: {exc}"
+
+    def leer_nuevos(self) -> int:
+        """
+        Publica los registros con id mayor al último leído. Devuelve cuántos.
+        """
+        total = 0
+        while True:
+            query = (
+                select(Historial)
+                .where(Historial.idHistorial > (self._ultimo_leido or 0))
+                .order_by(Historial.idHistorial)
+                .limit(LIMITE_REANUDACION)
+            )
+            with Session(engine) as session:
+                eventos = [_como_evento(h) for h in session.exec(query)]
+            if not eventos:
+                return total
+            self._ultimo_leido = eventos[-1]["idHistorial"]
+            self.publicar(eventos)
+            total += len(eventos)
+
+    # -----------------------------
+    # Publicación (desde cualquier hilo)
+    # -----------------------------
+    def publicar(self, eventos: List[Dict[str, Any]]) -> None:
+        if not eventos:
+            return
+        metricas.incrementar("historial_eventos_publicados", len(eventos))
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(self._distribuir, eventos)
+                return
+            except RuntimeError:  # el loop se cerró entre la verificación y la llamada
+                pass
+        with self._lock:
+            self.recientes.extend(eventos)
+
+    def _distribuir(self, eventos: List[Dict[str, Any]]) -> None:
+        # Corre en el event loop: no compite con suscribir/desuscribir
+        with self._lock:
+            self.recientes.extend(eventos)
+        for evento in eventos:
+            for clave in (evento["entidad"], None):
+                for suscriptor in self._por_entidad.get(clave, ()):
+                    if suscriptor.acepta(evento):
+                        suscriptor.entregar(evento)
+
+    # -----------------------------
+    # Suscripción (desde el event loop)
+    # -----------------------------
+    def suscribir(
+        self,
+        entidad: Optional[str] = None,
+        accion: Optional[str] = None,
+        max_buffer: int = 256,
+        politica: str = "antiguos",
+    ) -> Suscriptor:
+        self._loop = asyncio.get_running_loop()
+        suscriptor = Suscriptor(entidad, accion, max_buffer, politica)
+        self._por_entidad.setdefault(entidad, set()).add(suscriptor)
+        return suscriptor
+
+    def desuscribir(self, suscriptor: Suscriptor) -> None:
+        grupo = self._por_entidad.get(suscriptor.entidad)
+        if grupo is not None:
+            grupo.discard(suscriptor)
+            if not grupo:
+                del self._por_entidad[suscriptor.entidad]
+
+    def desde_memoria(self, ultimo_id: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Eventos con id mayor a ultimo_id desde el buffer circular, o None si
+        el buffer ya no alcanza a cubrir ese punto (hay que ir a la BD).
+        """
+        with self._lock:
+            recientes = list(self.recientes)
+        if not recientes or recientes[0]["idHistorial"] > ultimo_id + 1:
+            return None
+        return [e for e in recientes if e["idHistorial"] > ultimo_id]
+
+
+hub_historial = HubHistorial()
+
+
+# -----------------------------
+# Flujo para los endpoints SSE / WebSocket
+# -----------------------------
+# Registros por página al reanudar desde la BD
+LIMITE_REANUDACION = 1000
+
+
+def _historial_desde_bd(
+    ultimo_id: int,
+    entidad: Optional[str],
+    accion: Optional[str],
+) -> List[Dict[str, Any]]:
+    query = select(Historial).where(Historial.idHistorial > ultimo_id)
+    if entidad:
+        query = query.where(Historial.entidad == entidad)
+    if accion:
+        query = query.where(Historial.accion == accion)
+    query = query.order_by(Historial.idHistorial).limit(LIMITE_REANUDACION)
+    with Session(engine) as session:
+        return [_como_evento(h) for h in session.exec(query)]
+
+
+async def _pendientes_desde(suscriptor: Suscriptor, ultimo_id: int) -> List[Dict[str, Any]]:
+    """
+    Lo ocurrido después de ultimo_id: del buffer circular si alcanza,
+    si no, de la BD por páginas (por id, usando la clave primaria).
+    """
+    eventos: List[Dict[str, Any]] = []
+    while True:
+        en_memoria = hub_historial.desde_memoria(ultimo_id)
+        if en_memoria is not None:
+            return eventos + [e for e in en_memoria if suscriptor.acepta(e)]
+        pagina = await run_in_threadpool(
+            _historial_desde_bd, ultimo_id, suscriptor.entidad, suscriptor.accion
+        )
+        if not pagina:
+            return eventos
+        eventos.extend(pagina)
+        ultimo_id = pagina[-1]["idHistorial"]
+
+
+async def flujo_historial(
+    suscriptor: Suscriptor,
+    ultimo_id: Optional[int],
+    keepalive_segundos: float = 15.0,
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Produce tuplas (tipo, dato): ("historial", evento), ("descartados", n),
+    ("ping", None) o ("cerrado", motivo). El suscriptor debe estar ya
+    registrado, así no se pierde lo que llegue mientras se reanuda.
+    """
+    if ultimo_id is not None:
+        for evento in await _pendientes_desde(suscriptor, ultimo_id):
+            ultimo_id = evento["idHistorial"]
+            yield "historial", evento
+
+    while True:
+        try:
+            await asyncio.wait_for(suscriptor.aviso.wait(), keepalive_segundos)
+        except asyncio.TimeoutError:
+            yield "ping", None
+            continue
+
+        if suscriptor.cerrado:
+            yield "cerrado", "buffer lleno"
+            return
+        if suscriptor.descartados:
+            yield "descartados", suscriptor.descartados
+            suscriptor.descartados = 0
+        for evento in suscriptor.tomar():
+            # Lo que ya se envió al reanudar puede repetirse en el buffer
+            if ultimo_id is not None and evento["idHistorial"] <= ultimo_id:
+                continue
+            yield "historial", evento
+
+
+# -----------------------------
+# Aviso desde la sesión de SQLAlchemy
+# -----------------------------
+@event.listens_for(Session, "after_flush")
+def _capturar_historial(session, contexto) -> None:
+    if any(isinstance(obj, Historial) for obj in session.new):
+        session.info["historial_nuevos"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _publicar_historial(session) -> None:
+    # Lo publica el hilo del hub al leerlo de la tabla, sin esperar al sondeo
+    if session.info.pop("historial_nuevos", None):
+        hub_historial.despertar()
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_historial(session) -> None:
+    session.info.pop("historial_nuevos", None)
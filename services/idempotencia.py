@@ -0,0 +1,357 @@
+# services/idempotencia.py
+
+import asyncio
+import hashlib
+import re
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import select
+from starlette.datastructures import Headers
+
+from database import engine
+from models.idempotencia import ClaveIdempotencia
+from services.metricas import metricas
+from services.serializacion import RespuestaJSONRapida
+
+
+# Campo oculto que llevan los formularios HTML (un formulario no puede
+# enviar encabezados); las plantillas lo llenan con clave_idempotencia()
+CAMPO_FORMULARIO = "idempotency_key"
+_CAMPO_MULTIPART = re.compile(
+    rb'name="' + CAMPO_FORMULARIO.encode() + rb'"\r\n\r\n([^\r\n]{1,200})\r\n'
+)
+
+# En multipart el campo va al principio del formulario: solo se busca en
+# los primeros bytes y el resto (p. ej. la foto de la cédula) no se retiene
+PREFIJO_MULTIPART_BYTES = 64 * 1024
+
+# Espera entre consultas mientras otro worker ejecuta la petición original
+ESPERA_INICIAL_SEGUNDOS = 0.05
+ESPERA_MAXIMA_SEGUNDOS = 0.5
+
+
+def _clave_de_formulario(content_type: str, cuerpo: bytes) -> Optional[str]:
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        valores = parse_qs(cuerpo.decode("latin-1")).get(CAMPO_FORMULARIO)
+        return valores[0] if valores else None
+    encontrado = _CAMPO_MULTIPART.search(cuerpo)
+    return encontrado.group(1).decode("latin-1") if encontrado else None
+
+
+class HuellaCuerpo:
+    """
+    SHA-256 del content-type y del cuerpo, calculado a medida que se lee.
+    En multipart el boundary cambia en cada reenvío del navegador, así que
+    el cuerpo no sirve para comparar: solo se usa la clave.
+    """
+
+    def __init__(self, content_type: str) -> None:
+        self.multipart = content_type.startswith("multipart/")
+        self._sha = hashlib.sha256(content_type.encode() + b"\0")
+        self.completa = False
+        # El cliente se desconectó (o el servidor dejó de entregar el
+        # cuerpo) antes del final: la huella no representa la petición
+        self.cortada = False
+
+    def actualizar(self, mensaje: dict) -> None:
+        if mensaje["type"] != "http.request":
+            self.completa = self.cortada = True
+            return
+        if not self.multipart:
+            self._sha.update(mensaje.get("body", b""))
+        if not mensaje.get("more_body", False):
+            self.completa = True
+
+    def envolver(self, receive):
+        async def receive_con_huella():
+            mensaje = await receive()
+            self.actualizar(mensaje)
+            return mensaje
+
+        return receive_con_huella
+
+    async def consumir(self, receive) -> None:
+        # Lo que el endpoint no leyó también cuenta para la huella
+        while not self.completa and not self.multipart:
+            self.actualizar(await receive())
+
+    @property
+    def valor(self) -> Optional[str]:
+        if self.multipart:
+            return "multipart"
+        return None if self.cortada else self._sha.hexdigest()
+
+
+class AlmacenIdempotencia:
+    """
+    Claves y respuestas guardadas en la tabla ClaveIdempotencia, para que
+    un reintento que llega a otro worker (o tras un reinicio) encuentre la
+    respuesta de la petición original.
+
+    Cada clave se reclama con un INSERT … ON CONFLICT: solo un worker la
+    gana. Si el que la ganó muere, su arriendo vence y otro la reclama.
+    """
+
+    def __init__(self, ttl_segundos: float, arriendo_segundos: float) -> None:
+        self.ttl_segundos = ttl_segundos
+        self.arriendo_segundos = arriendo_segundos
+        self._purgada_en = 0.0
+
+    def reclamar(self, ruta: str, clave: str, token: str) -> Optional[ClaveIdempotencia]:
+        """
+        Devuelve None si la clave quedó a nombre de `token` (hay que ejecutar
+        la petición) o la fila existente (en curso o completa).
+        """
+        ahora = datetime.now()
+        self._purgar(ahora)
+        sentencia = insert(ClaveIdempotencia).values(
+            ruta=ruta,
+            clave=clave,
+            estado="EN_CURSO",
+            token=token,
+            expira=ahora + timedelta(seconds=self.arriendo_segundos),
+        )
+        # Una fila vencida (respuesta fuera de TTL o arriendo de un worker
+        # caído) se puede volver a reclamar
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=["ruta", "clave"],
+            set_={
+                "estado": sentencia.excluded.estado,
+                "token": sentencia.excluded.token,
+                "expira": sentencia.excluded.expira,
+                "huella": None,
+                "status": None,
+                "headers": None,
+                "cuerpo": None,
+            },
+            where=ClaveIdempotencia.expira < ahora,
+        ).returning(ClaveIdempotencia.token)
+        with engine.begin() as conn:
+            if conn.execute(sentencia).first() is not None:
+                return None
+            fila = conn.execute(
+                select(ClaveIdempotencia).where(
+                    ClaveIdempotencia.ruta == ruta, ClaveIdempotencia.clave == clave
+                )
+            ).first()
+        return ClaveIdempotencia.model_validate(fila._mapping) if fila else None
+
+    def guardar(
+        self,
+        ruta: str,
+        clave: str,
+        token: str,
+        huella: Optional[str],
+        status: int,
+        headers: List[Tuple[bytes, bytes]],
+        cuerpo: bytes,
+    ) -> None:
+        with engine.begin() as conn:
+            conn.execute(
+                update(ClaveIdempotencia)
+                .where(
+                    ClaveIdempotencia.ruta == ruta,
+                    ClaveIdempotencia.clave == clave,
+                    ClaveIdempotencia.token == token,
+                )
+                .values(
+                    estado="COMPLETA",
+                    expira=datetime.now() + timedelta(seconds=self.ttl_segundos),
+                    huella=huella,
+                    status=status,
+                    headers=[[k.decode("latin-1"), v.decode("latin-1")] for k, v in headers],
+                    cuerpo=zlib.compress(cuerpo, 1),
+                )
+            )
+
+    def liberar(self, ruta: str, clave: str, token: str) -> None:
+        # Respuesta que no se guarda (5xx, error de formulario): se puede reintentar
+        with engine.begin() as conn:
+            conn.execute(
+                delete(ClaveIdempotencia).where(
+                    ClaveIdempotencia.ruta == ruta,
+                    ClaveIdempotencia.clave == clave,
+                    ClaveIdempotencia.token == token,
+                )
+            )
+
+    def contar(self) -> int:
+        with engine.connect() as conn:
+            return conn.execute(
+                select(func.count()).select_from(ClaveIdempotencia).where(ClaveIdempotencia.estado == "COMPLETA")
+            ).scalar_one()
+
+    def _purgar(self, ahora: datetime) -> None:
+        # Como mucho una vez por minuto y por proceso
+        if time.monotonic() - self._purgada_en < 60:
+            return
+        self._purgada_en = time.monotonic()
+        with engine.begin() as conn:
+            conn.execute(delete(ClaveIdempotencia).where(ClaveIdempotencia.expira < ahora))
+
+
+class MiddlewareIdempotencia:
+    """
+    Soporte de encabezado `Idempotency-Key` para los POST de creación. Los
+    formularios HTML envían la clave en el campo oculto CAMPO_FORMULARIO.
+
+    - La primera petición con una clave se ejecuta normalmente y su respuesta
+      (status, headers y cuerpo) se guarda en la base de datos durante
+      `ttl_segundos`, visible para todos los workers.
+    - Los reintentos con la misma clave reciben la respuesta guardada sin
+      volver a ejecutar el endpoint (no tocan tablas ni escriben historial).
+    - Si llega un duplicado mientras la original sigue en curso (en este u
+      otro worker), espera a que termine y reutiliza su respuesta.
+    - Reusar la clave con otro cuerpo devuelve 422.
+
+    El cuerpo no se retiene en memoria: la huella se calcula mientras el
+    endpoint lo lee. Las respuestas 5xx no se guardan, para permitir
+    reintentar. Con la clave de un formulario tampoco las 4xx: el usuario
+    corrige el error y vuelve a enviar el mismo formulario (misma clave,
+    otro cuerpo).
+    """
+
+    def __init__(
+        self,
+        app,
+        ttl_segundos: float = 24 * 3600,
+        arriendo_segundos: float = 120,
+    ) -> None:
+        self.app = app
+        self.almacen = AlmacenIdempotencia(ttl_segundos, arriendo_segundos)
+        metricas.registrar_calculado("idempotencia_claves_guardadas", self.almacen.contar)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        clave_cliente = headers.get("idempotency-key")
+        max_status = 500
+        content_type = headers.get("content-type", "")
+        if not clave_cliente and content_type.startswith(
+            ("application/x-www-form-urlencoded", "multipart/form-data")
+        ):
+            prefijo, completo = await self._leer_prefijo(receive, content_type)
+            clave_cliente = _clave_de_formulario(content_type, prefijo)
+            receive = self._reproducir(prefijo, completo, receive)
+            max_status = 400
+        if not clave_cliente:
+            await self.app(scope, receive, send)
+            return
+
+        ruta, token = scope["path"], uuid.uuid4().hex
+        huella = HuellaCuerpo(content_type)
+        espera = ESPERA_INICIAL_SEGUNDOS
+        while True:
+            existente = await run_in_threadpool(self.almacen.reclamar, ruta, clave_cliente, token)
+            if existente is None:
+                break
+            if existente.estado == "COMPLETA":
+                await huella.consumir(receive)
+                await self._repetir(existente, huella.valor, scope, send)
+                return
+            # Duplicado concurrente: esperar a que termine la petición original
+            if espera == ESPERA_INICIAL_SEGUNDOS:
+                metricas.incrementar("idempotencia_coalescidas")
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, ESPERA_MAXIMA_SEGUNDOS)
+
+        try:
+            await self._ejecutar(scope, receive, send, ruta, clave_cliente, token, huella, max_status)
+        except BaseException:
+            await run_in_threadpool(self.almacen.liberar, ruta, clave_cliente, token)
+            raise
+
+    @staticmethod
+    async def _leer_prefijo(receive, content_type: str) -> Tuple[bytes, bool]:
+        """
+        Lee lo necesario para encontrar la clave del formulario: todo el
+        cuerpo si es urlencoded, los primeros bytes si es multipart.
+        Devuelve (bytes leídos, si se leyó el cuerpo completo).
+        """
+        partes: List[bytes] = []
+        leidos = 0
+        while True:
+            mensaje = await receive()
+            parte = mensaje.get("body", b"")
+            partes.append(parte)
+            leidos += len(parte)
+            if not mensaje.get("more_body", False):
+                return b"".join(partes), True
+            if content_type.startswith("multipart/") and (
+                leidos >= PREFIJO_MULTIPART_BYTES or _CAMPO_MULTIPART.search(b"".join(partes))
+            ):
+                return b"".join(partes), False
+
+    @staticmethod
+    def _reproducir(prefijo: bytes, completo: bool, receive):
+        # receive() que entrega primero los bytes ya leídos y luego el resto
+        entregado = False
+
+        async def receive_con_prefijo():
+            nonlocal entregado
+            if not entregado:
+                entregado = True
+                return {"type": "http.request", "body": prefijo, "more_body": not completo}
+            if completo:
+                return {"type": "http.disconnect"}
+            return await receive()
+
+        return receive_con_prefijo
+
+    async def _ejecutar(
+        self, scope, receive, send, ruta: str, clave: str, token: str,
+        huella: HuellaCuerpo, max_status: int,
+    ) -> None:
+        inicio: Dict = {}
+        partes: List[bytes] = []
+
+        async def send_capturado(mensaje):
+            if mensaje["type"] == "http.response.start":
+                inicio.update(mensaje)
+            elif mensaje["type"] == "http.response.body":
+                partes.append(mensaje.get("body", b""))
+            await send(mensaje)
+
+        await self.app(scope, huella.envolver(receive), send_capturado)
+
+        status = inicio.get("status", 500)
+        if status >= max_status:
+            await run_in_threadpool(self.almacen.liberar, ruta, clave, token)
+            return
+        await huella.consumir(receive)
+        headers = [(k, v) for k, v in inicio.get("headers", []) if k.lower() != b"date"]
+        await run_in_threadpool(
+            self.almacen.guardar, ruta, clave, token, huella.valor, status, headers, b"".join(partes)
+        )
+
+    @staticmethod
+    async def _repetir(guardada: ClaveIdempotencia, huella: Optional[str], scope, send) -> None:
+        # Sin huella de alguno de los dos lados solo se compara la clave
+        if None not in (guardada.huella, huella) and guardada.huella != huella:
+            metricas.incrementar("idempotencia_conflictos")
+            respuesta = RespuestaJSONRapida(
+                {"detail": "La Idempotency-Key ya se usó con otra petición"},
+                status_code=422,
+            )
+            await respuesta(scope, None, send)
+            return
+
+        metricas.incrementar("idempotencia_repeticiones")
+        headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in guardada.headers or []]
+        await send({
+            "type": "http.response.start",
+            "status": guardada.status,
+            "headers": headers + [(b"idempotent-replayed", b"true")],
+        })
+        await send({"type": "http.response.body", "body": zlib.decompress(guardada.cuerpo)})
@@ -0,0 +1,268 @@
+# services/instantaneas.py
+"""
+Reconstrucción de registros a una fecha (Crédito, Interés, Usuario).
+
+Cada cierto tiempo se guarda una Instantanea de los registros que
+cambiaron desde la anterior (y de los que nunca tuvieron una). Para
+saber cómo estaba un registro en la fecha T se parte de su última
+instantánea anterior a T y se aplican encima los `cambios` del historial
+posteriores a ella: el costo depende de los cambios ocurridos en un
+intervalo, no del largo del historial.
+"""
+
+import os
+import threading
+
+try:  # bloqueo entre procesos (solo POSIX)
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Type
+
+from fastapi import HTTPException
+from sqlalchemy import func, insert
+from sqlmodel import Session, SQLModel, select
+
+from database import engine, sqlite_file_name
+from models.credito import Credito
+from models.historial import Historial, HistorialAfectado, Instantanea
+from models.interes import Interes
+from models.usuario import Usuario
+from services.auditoria import ENTIDADES, instantanea
+from services.serializacion import clave_primaria
+
+# Nombre en la URL -> modelo que se puede reconstruir
+RECONSTRUIBLES: Dict[str, Type[SQLModel]] = {
+    "credito": Credito,
+    "interes": Interes,
+    "usuario": Usuario,
+}
+
+INTERVALO_SEGUNDOS = float(os.getenv("BANCO_INSTANTANEAS_INTERVALO", "3600"))
+
+# Ids por consulta IN (límite de variables de SQLite)
+FRAGMENTO = 500
+
+# Con varios workers solo toma instantáneas el proceso que tiene este
+# bloqueo; los demás reintentan tomarlo cada REINTENTO_LIDER_SEGUNDOS
+ARCHIVO_BLOQUEO = f"{sqlite_file_name}.instantaneas.lock"
+REINTENTO_LIDER_SEGUNDOS = 30.0
+
+
+def _ids_cambiados(session: Session, entidad: str, desde_id: int, hasta_id: int) -> Set[int]:
+    """
+    Registros de `entidad` con historial en (desde_id, hasta_id]: propios
+    y de operaciones en lote.
+    """
+    propios = session.exec(
+        select(Historial.entidad_id).where(
+            Historial.idHistorial > desde_id,
+            Historial.idHistorial <= hasta_id,
+            Historial.entidad == entidad,
+            Historial.entidad_id.is_not(None),
+        )
+    ).all()
+    en_lote = session.exec(
+        select(HistorialAfectado.entidad_id)
+        .join(Historial, Historial.idHistorial == HistorialAfectado.historial_id)
+        .where(
+            HistorialAfectado.historial_id > desde_id,
+            HistorialAfectado.historial_id <= hasta_id,
+            HistorialAfectado.entidad == entidad,
+            Historial.entidad == entidad,
+        )
+    ).all()
+    return set(propios) | set(en_lote)
+
+
+def tomar_instantaneas(session: Session) -> Dict[str, int]:
+    """
+    Guarda una instantánea de cada registro reconstruible que cambió desde
+    la última corrida o que aún no tiene ninguna. Devuelve cuántas se
+    guardaron por entidad. Hace commit.
+    """
+    ultimo = session.exec(select(func.max(Instantanea.historial_id))).one() or 0
+    hasta = session.exec(select(func.max(Historial.idHistorial))).one() or 0
+    ahora = datetime.now()
+    guardadas: Dict[str, int] = {}
+
+    for slug, modelo in RECONSTRUIBLES.items():
+        entidad = ENTIDADES[slug]
+        pk = clave_primaria(modelo)
+        sin_instantanea = session.exec(
+            select(pk).where(
+                pk.not_in(select(Instantanea.entidad_id).where(Instantanea.entidad == entidad))
+            )
+        ).all()
+        ids = sorted(_ids_cambiados(session, entidad, ultimo, hasta) | set(sin_instantanea))
+
+        filas = []
+        for i in range(0, len(ids), FRAGMENTO):
+            fragmento = ids[i:i + FRAGMENTO]
+            actuales = {
+                getattr(r, pk.key): instantanea(r)
+                for r in session.exec(select(modelo).where(pk.in_(fragmento))).all()
+            }
+            # Un id sin fila actual fue eliminado: datos = None
+            filas += [
+                {
+                    "entidad": entidad,
+                    "entidad_id": registro_id,
+                    "historial_id": hasta,
+                    "fecha": ahora,
+                    "datos": actuales.get(registro_id),
+                }
+                for registro_id in fragmento
+            ]
+        if filas:
+            session.execute(insert(Instantanea), filas)
+        guardadas[entidad] = len(filas)
+
+    session.commit()
+    return guardadas
+
+
+def reconstruir(session: Session, entidad: str, entidad_id: int, fecha: datetime) -> Dict[str, Any]:
+    """
+    Estado del registro en `fecha`: última instantánea con fecha <= `fecha`
+    más los cambios del historial posteriores a ella y hasta `fecha`.
+    """
+    if entidad not in RECONSTRUIBLES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Solo se pueden reconstruir: {', '.join(RECONSTRUIBLES)}",
+        )
+    nombre = ENTIDADES[entidad]
+
+    base = session.exec(
+        select(Instantanea)
+        .where(
+            Instantanea.entidad == nombre,
+            Instantanea.entidad_id == entidad_id,
+            Instantanea.fecha <= fecha,
+        )
+        .order_by(Instantanea.historial_id.desc())
+        .limit(1)
+    ).first()
+    desde_id = base.historial_id if base else 0
+
+    propios = select(Historial).where(
+        Historial.entidad == nombre,
+        Historial.entidad_id == entidad_id,
+        Historial.idHistorial > desde_id,
+        Historial.fecha <= fecha,
+    )
+    en_lote = (
+        select(Historial)
+        .join(HistorialAfectado, HistorialAfectado.historial_id == Historial.idHistorial)
+        .where(
+            HistorialAfectado.entidad == nombre,
+            HistorialAfectado.entidad_id == entidad_id,
+            HistorialAfectado.historial_id > desde_id,
+            Historial.entidad == nombre,
+            Historial.fecha <= fecha,
+        )
+    )
+    registros: List[Historial] = sorted(
+        {h.idHistorial: h for h in [*session.exec(propios).all(), *session.exec(en_lote).all()]}.values(),
+        key=lambda h: h.idHistorial,
+    )
+
+    if base is None and not registros:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No hay información de {nombre} id {entidad_id} a esa fecha",
+        )
+
+    datos: Optional[Dict[str, Any]] = dict(base.datos) if base and base.datos is not None else None
+    for h in registros:
+        if h.accion.startswith("ELIMINAR"):
+            datos = None
+        elif h.cambios:
+            datos = {**(datos or {}), **{campo: valores[1] for campo, valores in h.cambios.items()}}
+
+    return {
+        "entidad": nombre,
+        "entidad_id": entidad_id,
+        "fecha": fecha,
+        "existe": datos is not None,
+        "datos": datos,
+        "instantanea": base.fecha if base else None,
+        "cambios_aplicados": len(registros),
+    }
+
+
+class InstantaneasPeriodicas:
+    """
+    Hilo en segundo plano que llama a tomar_instantaneas cada
+    `intervalo_segundos`. Con varios workers corre en un solo proceso: el
+    que tiene el bloqueo de ARCHIVO_BLOQUEO. Si ese proceso muere, el
+    sistema libera el bloqueo y otro lo toma en su siguiente intento.
+    """
+
+    def __init__(self, intervalo_segundos: float) -> None:
+        self.intervalo_segundos = intervalo_segundos
+        self._hilo: Optional[threading.Thread] = None
+        self._detener = threading.Event()
+        self._bloqueo = None
+
+        self.ultima_ejecucion: Optional[datetime] = None
+        self.ultimo_resultado: Dict[str, int] = {}
+        self.ultimo_error: Optional[str] = None
+
+    def iniciar(self) -> None:
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        self._hilo = threading.Thread(target=self._bucle, name="instantaneas-historial", daemon=True)
+        self._hilo.start()
+
+    def ejecutar(self) -> Dict[str, int]:
+        with Session(engine) as session:
+            self.ultimo_resultado = tomar_instantaneas(session)
+        self.ultima_ejecucion = datetime.now()
+        self.ultimo_error = None
+        return self.ultimo_resultado
+
+    def estado(self) -> dict:
+        return {
+            "intervalo_segundos": self.intervalo_segundos,
+            "ultima_ejecucion": self.ultima_ejecucion,
+            "ultimo_resultado": self.ultimo_resultado,
+            "ultimo_error": self.ultimo_error,
+            "lider": fcntl is None or self._bloqueo is not None,
+        }
+
+    def _es_lider(self) -> bool:
+        if fcntl is None or self._bloqueo is not None:
+            return True
+        archivo = open(ARCHIVO_BLOQUEO, "a")
+        try:
+            fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            archivo.close()
+            return False
+        self._bloqueo = archivo
+        return True
+
+    def _bucle(self) -> None:
+        # La primera corrida al arrancar deja la instantánea inicial
+        while not self._detener.is_set():
+            espera = min(self.intervalo_segundos, REINTENTO_LIDER_SEGUNDOS)
+            try:
+                if self._es_lider():
+                    self.ejecutar()
+                    espera = self.intervalo_segundos
+            except Exception as exc:  # el hilo no debe morir por un error puntual
+                self.ultimo_error = f"{type(exc).__name__}: {exc}"
+            self._detener.wait(timeout=espera)
+
+    def cerrar(self) -> None:
+        self._detener.set()
+        if self._bloqueo is not None:
+            self._bloqueo.close()
+            self._bloqueo = None
+
+
+# Instancia única del proceso
+instantaneas = InstantaneasPeriodicas(INTERVALO_SEGUNDOS)
@@ -0,0 +1,104 @@
+# services/lotes.py
+"""
+Actualización y borrado masivo por filtro o lista de ids.
+
+Cada operación es una sola sentencia UPDATE / DELETE ... RETURNING (el
+UPDATE sube `version` en la misma sentencia) y deja un único registro de
+resumen en el historial, con los ids afectados en HistorialAfectado.
+Nada hace commit: el router confirma todo en una sola transacción.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Type
+
+from fastapi import HTTPException
+from sqlalchemy import delete, update
+from sqlmodel import Session, SQLModel
+
+from models.historial import Historial
+from services.auditoria import auditar
+from services.serializacion import LOTE_MAX_IDS, clave_primaria
+
+# Ids que se listan en la descripción del historial
+IDS_EN_RESUMEN = 20
+
+
+def condiciones_lote(
+    modelo: Type[SQLModel],
+    ids: Optional[Sequence[int]],
+    condiciones: List[Any],
+) -> List[Any]:
+    """
+    Agrega el filtro por ids a `condiciones` y exige al menos un criterio,
+    para que un cuerpo vacío no afecte a toda la tabla.
+    """
+    condiciones = list(condiciones)
+    if ids is not None:
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            raise HTTPException(status_code=400, detail="La lista de ids está vacía")
+        if len(ids) > LOTE_MAX_IDS:
+            raise HTTPException(
+                status_code=400, detail=f"Se admiten como máximo {LOTE_MAX_IDS} ids por petición"
+            )
+        condiciones.append(clave_primaria(modelo).in_(ids))
+    if not condiciones:
+        raise HTTPException(status_code=400, detail="Debe indicar ids o al menos un filtro")
+    return condiciones
+
+
+def actualizar_lote(
+    session: Session,
+    modelo: Type[SQLModel],
+    condiciones: List[Any],
+    valores: Dict[str, Any],
+) -> List[int]:
+    """
+    UPDATE ... SET valores, version = version + 1 WHERE condiciones.
+    Devuelve los ids actualizados. No hace commit.
+    """
+    if not valores:
+        raise HTTPException(status_code=400, detail="No se enviaron cambios")
+    sentencia = (
+        update(modelo)
+        .where(*condiciones)
+        .values(**valores, version=modelo.version + 1)
+        .returning(clave_primaria(modelo))
+        .execution_options(synchronize_session=False)
+    )
+    return list(session.execute(sentencia).scalars())
+
+
+def eliminar_lote(session: Session, modelo: Type[SQLModel], condiciones: List[Any]) -> List[int]:
+    """
+    DELETE ... WHERE condiciones. Devuelve los ids eliminados. No hace commit.
+    """
+    sentencia = (
+        delete(modelo)
+        .where(*condiciones)
+        .returning(clave_primaria(modelo))
+        .execution_options(synchronize_session=False)
+    )
+    return list(session.execute(sentencia).scalars())
+
+
+def auditar_lote(
+    session: Session,
+    entidad: str,
+    accion: str,
+    plural: str,
+    ids: List[int],
+    valores: Optional[Dict[str, Any]] = None,
+) -> Historial:
+    """
+    Registro de resumen de una operación en lote: cantidad, primeros ids
+    y, en las actualizaciones, los valores aplicados (sin el anterior, que
+    puede ser distinto en cada registro).
+    """
+    listados = ", ".join(str(i) for i in sorted(ids)[:IDS_EN_RESUMEN])
+    if len(ids) > IDS_EN_RESUMEN:
+        listados += f" y {len(ids) - IDS_EN_RESUMEN} más"
+    descripcion = f"{len(ids)} {plural} (ids {listados})"
+    if valores:
+        descripcion += ". Cambios: " + ", ".join(f"{k}={v!r}" for k, v in valores.items())
+    cambios = {campo: [None, valor] for campo, valor in (valores or {}).items()}
+    return auditar(session, entidad, accion, descripcion, cambios=cambios, afectados={entidad: ids})
@@ -0,0 +1,236 @@
+# services/memo_amortizacion.py
+"""
+Memoización de resultados de amortización por (monto, plazo, tasa, sistema).
+
+Muchos créditos comparten condiciones (ej. 10M a 12 meses al 1,5 %): el
+resumen (cuota, interés total, saldo final) y la tabla mes a mes se
+calculan una vez y se reutilizan.
+
+- En memoria: LRU acotada por bytes (BANCO_MEMO_MB, 32 por defecto).
+- En disco (opcional, BANCO_MEMO_ARCHIVO): un SQLite con los arreglos en
+  binario que sobrevive a reinicios y se comparte entre workers.
+
+La tasa de aciertos y el uso de memoria se ven en GET /metricas/.
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.amortizacion import SISTEMAS, calcular_simulaciones, tabla_amortizacion
+from services.cache import CacheLRU
+from services.metricas import metricas
+
+MEMO_MB = float(os.getenv("BANCO_MEMO_MB", "32"))
+MEMO_ARCHIVO = os.getenv("BANCO_MEMO_ARCHIVO", "")
+
+Clave = Tuple[float, int, float, str]
+
+
+def clave_amortizacion(monto: float, plazo: int, tasa: float, sistema: str = "frances") -> Clave:
+    # Se redondea para que 10000000 y 10000000.0000001 compartan entrada
+    return (round(float(monto), 2), int(plazo), round(float(tasa), 6), sistema)
+
+
+class DiscoMemo:
+    """
+    Persistencia de la memoización en SQLite: (tipo, clave) -> arreglo float64.
+    La forma del arreglo se deduce del tipo y de la clave, así que no se
+    usa pickle.
+    """
+
+    def __init__(self, archivo: str) -> None:
+        self.archivo = archivo
+        self._lock = threading.Lock()
+        self._conexion: Optional[sqlite3.Connection] = None
+
+    def _conectar(self) -> sqlite3.Connection:
+        if self._conexion is None:
+            self._conexion = sqlite3.connect(self.archivo, timeout=5, check_same_thread=False)
+            self._conexion.execute("PRAGMA journal_mode=WAL")
+            self._conexion.execute(
+                "CREATE TABLE IF NOT EXISTS memo ("
+                "tipo TEXT NOT NULL, clave TEXT NOT NULL, valor BLOB NOT NULL, "
+                "PRIMARY KEY (tipo, clave))"
+            )
+        return self._conexion
+
+    @staticmethod
+    def _texto(clave: Clave) -> str:
+        return "|".join(str(parte) for parte in clave)
+
+    def obtener_varios(self, tipo: str, claves: List[Clave]) -> Dict[Clave, np.ndarray]:
+        encontrados: Dict[Clave, np.ndarray] = {}
+        por_texto = {self._texto(c): c for c in claves}
+        textos = list(por_texto)
+        with self._lock:
+            conexion = self._conectar()
+            for i in range(0, len(textos), 500):
+                parte = textos[i:i + 500]
+                filas = conexion.execute(
+                    f"SELECT clave, valor FROM memo WHERE tipo = ? AND clave IN ({','.join('?' * len(parte))})",
+                    [tipo, *parte],
+                ).fetchall()
+                for texto, valor in filas:
+                    encontrados[por_texto[texto]] = np.frombuffer(valor, dtype=np.float64)
+        return encontrados
+
+    def guardar_varios(self, tipo: str, valores: Dict[Clave, np.ndarray]) -> None:
+        if not valores:
+            return
+        with self._lock:
+            conexion = self._conectar()
+            conexion.executemany(
+                "INSERT OR IGNORE INTO memo (tipo, clave, valor) VALUES (?, ?, ?)",
+                [
+                    (tipo, self._texto(c), np.ascontiguousarray(v, dtype=np.float64).tobytes())
+                    for c, v in valores.items()
+                ],
+            )
+            conexion.commit()
+
+    def cerrar(self) -> None:
+        with self._lock:
+            if self._conexion is not None:
+                self._conexion.close()
+                self._conexion = None
+
+
+class MemoAmortizacion:
+    """
+    Resúmenes y tablas de amortización memoizados. Los arreglos devueltos
+    se comparten entre llamadas: son de solo lectura.
+    """
+
+    def __init__(self, max_bytes: int, archivo: str = "") -> None:
+        self.cache = CacheLRU(max_bytes=max_bytes)
+        self.disco = DiscoMemo(archivo) if archivo else None
+        self._cuentas = {"memoria": 0, "disco": 0, "calculado": 0}
+
+        metricas.registrar_calculado("memo_amortizacion_bytes", lambda: self.cache.bytes)
+        metricas.registrar_calculado("memo_amortizacion_entradas", lambda: len(self.cache))
+        metricas.registrar_calculado("memo_amortizacion_tasa_aciertos", self.tasa_aciertos)
+
+    def _contar(self, tipo: str, resultado: str, cantidad: int = 1) -> None:
+        if cantidad:
+            self._cuentas[resultado] += cantidad
+            metricas.incrementar("memo_amortizacion", cantidad, tipo=tipo, resultado=resultado)
+
+    def tasa_aciertos(self) -> float:
+        total = sum(self._cuentas.values())
+        return (self._cuentas["memoria"] + self._cuentas["disco"]) / total if total else 0.0
+
+    def _buscar(self, tipo: str, claves: List[Clave]) -> Dict[Clave, np.ndarray]:
+        """
+        Busca en memoria y, lo que falte, en disco (subiéndolo a memoria).
+        """
+        encontrados: Dict[Clave, np.ndarray] = {}
+        faltantes: List[Clave] = []
+        for clave in claves:
+            valor = self.cache.obtener((tipo, clave))
+            if valor is None:
+                faltantes.append(clave)
+            else:
+                encontrados[clave] = valor
+        self._contar(tipo, "memoria", len(encontrados))
+
+        if faltantes and self.disco is not None:
+            en_disco = self.disco.obtener_varios(tipo, faltantes)
+            for clave, valor in en_disco.items():
+                if tipo == "tabla":
+                    valor = valor.reshape(-1, 5)
+                self._guardar_memoria(tipo, clave, valor)
+                encontrados[clave] = valor
+            self._contar(tipo, "disco", len(en_disco))
+        return encontrados
+
+    def _guardar_memoria(self, tipo: str, clave: Clave, valor: np.ndarray) -> None:
+        valor.setflags(write=False)
+        self.cache.guardar((tipo, clave), valor)
+
+    def _guardar(self, tipo: str, valores: Dict[Clave, np.ndarray]) -> None:
+        for clave, valor in valores.items():
+            self._guardar_memoria(tipo, clave, valor)
+        self._contar(tipo, "calculado", len(valores))
+        if self.disco is not None:
+            self.disco.guardar_varios(tipo, valores)
+
+    # -----------------------------
+    # Consultas
+    # -----------------------------
+    def resumen(self, monto: float, plazo: int, tasa: float, sistema: str = "frances") -> Tuple[float, float, float]:
+        """
+        (cuotaMensual, interesTotal, saldoFinal) de un crédito.
+        """
+        cuotas, intereses, saldos = self.calcular_lote([monto], [plazo], [tasa], sistema)
+        return float(cuotas[0]), float(intereses[0]), float(saldos[0])
+
+    def calcular_lote(
+        self,
+        montos,
+        plazos,
+        tasas,
+        sistema: str = "frances",
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Igual que `calcular_simulaciones`, pero cada combinación distinta del
+        lote se busca en la memoización y solo las nuevas se calculan (en
+        bloque, con NumPy).
+        """
+        if sistema not in SISTEMAS:
+            raise ValueError(f"Sistema de amortización desconocido: {sistema}")
+
+        claves = [clave_amortizacion(m, n, t, sistema) for m, n, t in zip(montos, plazos, tasas)]
+        unicas = list(dict.fromkeys(claves))
+        valores = self._buscar("resumen", unicas)
+
+        nuevas = [c for c in unicas if c not in valores]
+        if nuevas:
+            cuotas, intereses, saldos = calcular_simulaciones(
+                [c[0] for c in nuevas], [c[1] for c in nuevas], [c[2] for c in nuevas], sistema
+            )
+            calculados = {
+                clave: np.array([cuotas[i], intereses[i], saldos[i]])
+                for i, clave in enumerate(nuevas)
+            }
+            self._guardar("resumen", calculados)
+            valores.update(calculados)
+
+        resultado = np.array([valores[c] for c in claves]).reshape(-1, 3)
+        return resultado[:, 0], resultado[:, 1], resultado[:, 2]
+
+    def tabla(self, monto: float, plazo: int, tasa: float) -> np.ndarray:
+        """
+        Tabla del sistema francés (plazo, 5): mes, cuota, interés, abono y saldo.
+        """
+        clave = clave_amortizacion(monto, plazo, tasa)
+        encontrada = self._buscar("tabla", [clave]).get(clave)
+        if encontrada is not None:
+            return encontrada
+        tabla = tabla_amortizacion(clave[0], clave[1], clave[2])
+        self._guardar("tabla", {clave: tabla})
+        return tabla
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "entradas": len(self.cache),
+            "bytes": self.cache.bytes,
+            "max_bytes": self.cache.max_bytes,
+            "archivo": self.disco.archivo if self.disco is not None else None,
+            **self._cuentas,
+            "tasa_aciertos": round(self.tasa_aciertos(), 4),
+        }
+
+    def limpiar(self) -> None:
+        self.cache.limpiar()
+
+    def cerrar(self) -> None:
+        if self.disco is not None:
+            self.disco.cerrar()
+
+
+# Instancia única del proceso
+memo_amortizacion = MemoAmortizacion(max_bytes=int(MEMO_MB * 1024 * 1024), archivo=MEMO_ARCHIVO)
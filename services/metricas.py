@@ -0,0 +1,66 @@
+# services/metricas.py
+
+import threading
+from collections import defaultdict
+from typing import Callable, Dict
+
+
+class RegistroMetricas:
+    """
+    Registro en memoria de métricas del proceso.
+
+    - Contadores: valores que solo crecen (bytes, rechazos, aciertos...).
+    - Medidores: valores puntuales que se fijan o se calculan al leerlos
+      (profundidad de cola, ratio de compresión...).
+
+    Las etiquetas se pasan como kwargs: incrementar("x", codificacion="gzip").
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._contadores: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self._medidores: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self._calculados: Dict[str, Callable[[], float]] = {}
+
+    @staticmethod
+    def _clave(etiquetas: Dict[str, object]) -> str:
+        return ",".join(f"{k}={v}" for k, v in sorted(etiquetas.items()))
+
+    def incrementar(self, nombre: str, valor: float = 1.0, **etiquetas: object) -> None:
+        with self._lock:
+            self._contadores[nombre][self._clave(etiquetas)] += valor
+
+    def fijar(self, nombre: str, valor: float, **etiquetas: object) -> None:
+        with self._lock:
+            self._medidores[nombre][self._clave(etiquetas)] = valor
+
+    def registrar_calculado(self, nombre: str, funcion: Callable[[], float]) -> None:
+        """
+        Registra un medidor cuyo valor se calcula en el momento de leer las métricas.
+        """
+        with self._lock:
+            self._calculados[nombre] = funcion
+
+    def valor(self, nombre: str, **etiquetas: object) -> float:
+        clave = self._clave(etiquetas)
+        with self._lock:
+            if clave in self._contadores.get(nombre, {}):
+                return self._contadores[nombre][clave]
+            return self._medidores.get(nombre, {}).get(clave, 0.0)
+
+    def instantanea(self) -> Dict[str, Dict[str, float]]:
+        """
+        Devuelve una copia de todas las métricas: {nombre: {etiquetas: valor}}.
+        """
+        with self._lock:
+            datos = {n: dict(v) for n, v in self._contadores.items()}
+            datos.update({n: dict(v) for n, v in self._medidores.items()})
+            calculados = dict(self._calculados)
+
+        for nombre, funcion in calculados.items():
+            datos[nombre] = {"": funcion()}
+        return datos
+
+
+# Registro global del proceso
+metricas = RegistroMetricas()
@@ -0,0 +1,193 @@
+# services/montecarlo.py
+"""
+Simulación Monte Carlo de créditos a tasa variable.
+
+La tasa mensual sigue un proceso con reversión a la media (Vasicek /
+Ornstein-Uhlenbeck, discretización exacta):
+
+    r(t+1) = θ + (r(t) - θ)·e^(-κ) + σ·sqrt((1 - e^(-2κ)) / 2κ)·Z
+
+y en cada mes la cuota se recalcula (sistema francés) con la tasa vigente
+sobre el saldo y el plazo restantes. Todo va vectorizado sobre las
+trayectorias: el bucle es sobre los meses, y en memoria solo hay un
+puñado de vectores del tamaño del número de trayectorias.
+
+Las trayectorias se procesan por fragmentos con `services.computo`, en el
+proceso actual o repartidas en varios núcleos.
+"""
+
+import math
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from services.computo import ejecutor_computo, fragmentos
+from services.memo_amortizacion import memo_amortizacion
+
+PERCENTILES_POR_DEFECTO = (5.0, 25.0, 50.0, 75.0, 95.0)
+
+
+def _percentiles(valores: np.ndarray, percentiles: Sequence[float]) -> Dict[str, float]:
+    if valores.size == 0:
+        return {}
+    calculados = np.percentile(valores, percentiles)
+    return {f"p{p:g}": round(float(v), 2) for p, v in zip(percentiles, calculados)}
+
+
+# Trayectorias por fragmento: cada fragmento tiene su propio generador
+# aleatorio (derivado de la semilla y de su posición), así el resultado no
+# depende de si se corre inline o en el pool, ni de cuántos procesos haya
+FRAGMENTO_TRAYECTORIAS = 5000
+
+SALIDAS_TRAYECTORIA = ("tasa_final", "cuota_promedio", "cuota_maxima", "interes_total", "mes_impago")
+
+
+def kernel_trayectorias(
+    entradas: Dict[str, np.ndarray],
+    salidas: Dict[str, np.ndarray],
+    inicio: int,
+    fin: int,
+    *,
+    monto: float,
+    plazo: int,
+    tasa: float,
+    margen: Optional[float],
+    reversion: float,
+    tasa_largo_plazo: float,
+    volatilidad: float,
+    tasa_minima: float,
+    semilla: int,
+) -> None:
+    """
+    Simula las trayectorias [inicio, fin) y escribe, por trayectoria, la
+    tasa final, la cuota promedio y máxima, el interés total y el mes del
+    primer impago (0 = nunca) en `salidas`.
+    """
+    n = int(plazo)
+    k = fin - inicio
+    theta = float(tasa_largo_plazo)
+    rng = np.random.default_rng(np.random.SeedSequence(semilla, spawn_key=(inicio,)))
+
+    # Coeficientes de la discretización exacta
+    a = math.exp(-reversion) if reversion > 0 else 1.0
+    b = volatilidad * (math.sqrt((1.0 - a * a) / (2.0 * reversion)) if reversion > 0 else 1.0)
+
+    tasas = np.full(k, float(tasa))
+    saldo = np.full(k, float(monto))
+    interes_total = np.zeros(k)
+    cuota_maxima = np.zeros(k)
+    suma_cuotas = np.zeros(k)
+    mes_impago = np.zeros(k)
+    cuota = np.empty(k)
+    interes = np.empty(k)
+    umbral = np.inf if margen is None else float(margen)
+
+    for mes in range(1, n + 1):
+        if mes > 1:
+            tasas -= theta
+            tasas *= a
+            tasas += theta + b * rng.standard_normal(k)
+            np.maximum(tasas, tasa_minima, out=tasas)
+
+        r = tasas / 100.0
+        restantes = n - mes + 1
+        with np.errstate(divide="ignore", invalid="ignore"):
+            np.divide(saldo * r, 1.0 - np.power(1.0 + r, -restantes), out=cuota)
+        sin_tasa = r == 0
+        if sin_tasa.any():
+            cuota[sin_tasa] = saldo[sin_tasa] / restantes
+
+        np.multiply(saldo, r, out=interes)
+        saldo -= cuota - interes
+        interes_total += interes
+        suma_cuotas += cuota
+        np.maximum(cuota_maxima, cuota, out=cuota_maxima)
+        mes_impago[(mes_impago == 0) & (cuota > umbral)] = mes
+
+    salidas["tasa_final"][inicio:fin] = tasas
+    salidas["cuota_promedio"][inicio:fin] = suma_cuotas / n
+    salidas["cuota_maxima"][inicio:fin] = cuota_maxima
+    salidas["interes_total"][inicio:fin] = interes_total
+    salidas["mes_impago"][inicio:fin] = mes_impago
+
+
+def simular_credito(
+    monto: float,
+    plazo: int,
+    tasa: float,
+    margen: Optional[float] = None,
+    trayectorias: int = 10_000,
+    reversion: float = 0.05,
+    tasa_largo_plazo: Optional[float] = None,
+    volatilidad: float = 0.1,
+    tasa_minima: float = 0.0,
+    percentiles: Sequence[float] = PERCENTILES_POR_DEFECTO,
+    semilla: Optional[int] = None,
+    ejecucion: str = "inline",
+) -> Dict[str, Any]:
+    """
+    Corre `trayectorias` escenarios de tasa sobre un crédito.
+
+    - tasa, tasa_largo_plazo, volatilidad y tasa_minima van en porcentaje
+      mensual, igual que Interes.tasa (1.5 = 1,5 % mensual); la volatilidad
+      es la desviación del choque de un mes.
+    - reversion (κ) es la velocidad mensual de regreso a tasa_largo_plazo
+      (por defecto, la tasa actual).
+    - margen es lo que el cliente puede pagar por mes (ingresos - gastos):
+      una trayectoria cuenta como impago el primer mes en que la cuota lo
+      supera.
+    - ejecucion: "inline" (en este proceso) o "pool" (fragmentos repartidos
+      en el pool de procesos de services.computo).
+    """
+    n = int(plazo)
+    k = int(trayectorias)
+    if semilla is None:
+        semilla = int(np.random.SeedSequence().entropy)
+
+    salidas = ejecutor_computo.ejecutar(
+        kernel_trayectorias,
+        fragmentos(k, FRAGMENTO_TRAYECTORIAS),
+        entradas={},
+        salidas={nombre: ((k,), np.float64) for nombre in SALIDAS_TRAYECTORIA},
+        parametros={
+            "monto": float(monto),
+            "plazo": n,
+            "tasa": float(tasa),
+            "margen": margen,
+            "reversion": float(reversion),
+            "tasa_largo_plazo": float(tasa if tasa_largo_plazo is None else tasa_largo_plazo),
+            "volatilidad": float(volatilidad),
+            "tasa_minima": float(tasa_minima),
+            "semilla": semilla,
+        },
+        ejecucion=ejecucion,
+    )
+
+    mes_impago = salidas["mes_impago"]
+    impagos = mes_impago > 0
+    cuota_fija, interes_fijo, _ = memo_amortizacion.resumen(monto, n, tasa)
+
+    return {
+        "trayectorias": k,
+        "meses": n,
+        "monto": float(monto),
+        "tasa_inicial": float(tasa),
+        "cuota_tasa_fija": round(cuota_fija, 2),
+        "interes_total_tasa_fija": round(interes_fijo, 2),
+        "tasa_final": _percentiles(salidas["tasa_final"], percentiles),
+        "cuota_promedio": _percentiles(salidas["cuota_promedio"], percentiles),
+        "cuota_maxima": _percentiles(salidas["cuota_maxima"], percentiles),
+        "interes_total": _percentiles(salidas["interes_total"], percentiles),
+        "margen": None if margen is None else float(margen),
+        "probabilidad_impago": float(impagos.mean()) if margen is not None else None,
+        "mes_impago": _percentiles(mes_impago[impagos], percentiles),
+    }
+
+
+def percentiles_validos(percentiles: List[float]) -> List[float]:
+    """
+    Ordena, quita duplicados y valida que estén entre 0 y 100.
+    """
+    if any(p < 0 or p > 100 for p in percentiles):
+        raise ValueError("Los percentiles deben estar entre 0 y 100")
+    return sorted(set(percentiles))
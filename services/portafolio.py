@@ -0,0 +1,154 @@
+# services/portafolio.py
+
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import case, func
+from sqlmodel import Session, select
+
+from database import engine
+from models.cambios_tabla import CambiosTabla
+from models.credito import Credito
+from models.interes import Interes
+from models.portafolio import PortafolioUsuario
+from models.simulacion import Simulacion
+from models.usuario import Usuario
+from services.cache import CacheTTL
+
+# Los resúmenes se guardan unos segundos por usuario / página junto con los
+# contadores de CambiosTabla de los modelos que usan. Los contadores están
+# en la base de datos, así que una escritura hecha en cualquier worker los
+# cambia: en cada acierto se comparan y, si difieren, se recalcula. El TTL
+# solo acota la memoria.
+cache_portafolios = CacheTTL(ttl_segundos=30, max_entradas=10_000)
+
+MODELOS_PORTAFOLIO = (Usuario, Credito, Interes, Simulacion)
+_TABLAS_PORTAFOLIO = [m.__tablename__ for m in MODELOS_PORTAFOLIO]
+
+
+# -----------------------------
+# Validez de lo cacheado
+# -----------------------------
+def _firma() -> Tuple[Tuple[str, int], ...]:
+    """
+    Contadores de cambios de las tablas del portafolio, leídos siempre de la
+    principal (la réplica puede estar atrasada).
+    """
+    with engine.connect() as conn:
+        filas = conn.execute(
+            select(CambiosTabla.tabla, CambiosTabla.cambios)
+            .where(CambiosTabla.tabla.in_(_TABLAS_PORTAFOLIO))
+            .order_by(CambiosTabla.tabla)
+        ).all()
+    return tuple((tabla, cambios) for tabla, cambios in filas)
+
+
+def _obtener(clave: Any) -> Tuple[Tuple[Tuple[str, int], ...], Optional[Any]]:
+    """
+    Devuelve (firma actual, valor cacheado si sigue vigente).
+    """
+    firma = _firma()
+    entrada = cache_portafolios.obtener(clave)
+    if entrada is None:
+        return firma, None
+    firma_guardada, valor = entrada
+    if firma_guardada != firma:
+        cache_portafolios.eliminar(clave)
+        return firma, None
+    return firma, valor
+
+
+def _guardar(session: Session, firma: Any, clave: Any, valor: Any) -> None:
+    # La firma se leyó antes de la consulta: si hubo una escritura en medio,
+    # el próximo acierto verá otra firma y recalculará. Lo leído de la
+    # réplica puede estar atrasado: solo se cachea lo de la principal.
+    if session.get_bind() is engine:
+        cache_portafolios.guardar(clave, (firma, valor))
+
+
+def _consulta_portafolios() -> Any:
+    """
+    Arma una sola consulta agregada con el portafolio de cada usuario:
+    - cantidad de créditos y monto total
+    - tasa promedio ponderada por monto (promedio de las tasas de cada crédito)
+    - interés proyectado y cuotas, tomando la simulación más reciente de cada interés
+    - flujo libre = ingresos - gastos - Σ cuotas
+    """
+    tasas = (
+        select(Interes.credito_id, func.avg(Interes.tasa).label("tasa"))
+        .group_by(Interes.credito_id)
+        .subquery()
+    )
+    ultimas = (
+        select(func.max(Simulacion.idSimulacion).label("id"))
+        .group_by(Simulacion.interes_id)
+        .subquery()
+    )
+    simulaciones = (
+        select(
+            Interes.credito_id,
+            func.sum(Simulacion.interesTotal).label("interes_total"),
+            func.sum(Simulacion.cuotaMensual).label("cuotas"),
+        )
+        .join(Simulacion, Simulacion.interes_id == Interes.idInteres)
+        .join(ultimas, ultimas.c.id == Simulacion.idSimulacion)
+        .group_by(Interes.credito_id)
+        .subquery()
+    )
+
+    monto_con_tasa = func.sum(case((tasas.c.tasa.isnot(None), Credito.monto), else_=0.0))
+    cuotas = func.coalesce(func.sum(simulaciones.c.cuotas), 0.0)
+
+    return (
+        select(
+            Usuario.idUsuario.label("usuario_id"),
+            Usuario.nombre,
+            Usuario.ingresos,
+            Usuario.gastos,
+            func.count(Credito.idCredito).label("creditos"),
+            func.coalesce(func.sum(Credito.monto), 0.0).label("monto_total"),
+            (
+                func.sum(Credito.monto * tasas.c.tasa) / func.nullif(monto_con_tasa, 0)
+            ).label("tasa_promedio_ponderada"),
+            func.coalesce(func.sum(simulaciones.c.interes_total), 0.0).label(
+                "interes_proyectado_total"
+            ),
+            cuotas.label("cuotas_mensuales_total"),
+            (Usuario.ingresos - Usuario.gastos - cuotas).label("flujo_libre"),
+        )
+        .select_from(Usuario)
+        .outerjoin(Credito, Credito.usuario_id == Usuario.idUsuario)
+        .outerjoin(tasas, tasas.c.credito_id == Credito.idCredito)
+        .outerjoin(simulaciones, simulaciones.c.credito_id == Credito.idCredito)
+        .group_by(Usuario.idUsuario)
+        .order_by(Usuario.idUsuario)
+    )
+
+
+def portafolio_usuario(session: Session, usuario_id: int) -> Optional[PortafolioUsuario]:
+    """
+    Portafolio de un usuario (None si no existe), con caché por usuario.
+    """
+    clave = ("usuario", usuario_id)
+    firma, portafolio = _obtener(clave)
+    if portafolio is None:
+        fila = session.exec(
+            _consulta_portafolios().where(Usuario.idUsuario == usuario_id)
+        ).first()
+        if fila is None:
+            return None
+        portafolio = PortafolioUsuario(**fila._mapping)
+        _guardar(session, firma, clave, portafolio)
+    return portafolio
+
+
+def listar_portafolios(session: Session, limit: int, offset: int) -> List[PortafolioUsuario]:
+    """
+    Página de portafolios ordenada por id de usuario, con caché por página.
+    """
+    clave = ("pagina", limit, offset)
+    firma, pagina = _obtener(clave)
+    if pagina is None:
+        filas = session.exec(_consulta_portafolios().offset(offset).limit(limit)).all()
+        pagina = [PortafolioUsuario(**fila._mapping) for fila in filas]
+        _guardar(session, firma, clave, pagina)
+    return pagina
@@ -0,0 +1,214 @@
+# services/recalculo.py
+
+import threading
+import time
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, event, func, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session, select
+
+from database import engine
+from models.credito import Credito
+from models.interes import Interes
+from models.recalculo_pendiente import RecalculoPendiente
+from models.simulacion import Simulacion
+from services.auditoria import auditar
+from services.memo_amortizacion import memo_amortizacion
+from services.metricas import metricas
+from services.versiones import incrementar_versiones
+
+
+class RecalculoSimulaciones:
+    """
+    Etapa de recálculo incremental de simulaciones.
+
+    Cuando cambia la tasa de un Interes, sus simulaciones quedan desactualizadas.
+    Los routers encolan el interes_id en la tabla RecalculoPendiente dentro
+    de la misma transacción que el cambio; un hilo en segundo plano toma los
+    pendientes, recalcula todas sus simulaciones en bloques vectorizados con
+    NumPy, las actualiza con un UPDATE masivo por clave primaria y deja un
+    único registro de resumen en el historial.
+
+    La cola está en la base de datos: un reinicio entre el cambio de tasa y
+    el recálculo no pierde nada, y con varios workers cualquiera de ellos
+    procesa los pendientes (el que borra las filas primero se las lleva).
+    """
+
+    def __init__(self, intervalo_segundos: float = 1.0, tamano_lote: int = 500) -> None:
+        self.intervalo_segundos = intervalo_segundos
+        self.tamano_lote = tamano_lote
+        self._en_proceso = 0
+        self._despertar = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+        self.total_recalculadas = 0
+        self.ultima_ejecucion: Optional[datetime] = None
+        self.ultimo_lote = 0
+        self.ultimo_error: Optional[str] = None
+
+        metricas.registrar_calculado("recalculo_pendientes", lambda: self._pendientes()[0])
+        metricas.registrar_calculado("recalculo_lag_segundos", self.lag_segundos)
+
+    # -----------------------------
+    # API para los routers
+    # -----------------------------
+    def encolar(self, session: Session, interes_ids: Iterable[int]) -> None:
+        """
+        Marca los intereses como pendientes de recálculo. No hace commit: se
+        confirma junto con el cambio de tasa, y al confirmar se despierta el
+        hilo de este proceso.
+        """
+        filas = [{"interes_id": interes_id} for interes_id in interes_ids]
+        if not filas:
+            return
+        session.execute(
+            insert(RecalculoPendiente).values(encolado=datetime.now()).on_conflict_do_nothing(),
+            filas,
+        )
+        session.info["recalculo_despertar"] = True
+
+    def despertar(self) -> None:
+        self._despertar.set()
+
+    def iniciar(self) -> None:
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        self._hilo = threading.Thread(target=self._bucle, name="recalculo-simulaciones", daemon=True)
+        self._hilo.start()
+
+    def _pendientes(self) -> Tuple[int, Optional[datetime]]:
+        with engine.connect() as conn:
+            return tuple(conn.execute(
+                select(func.count(), func.min(RecalculoPendiente.encolado))
+            ).one())
+
+    def lag_segundos(self) -> float:
+        """
+        Antigüedad del cambio de tasa más viejo que aún no se ha aplicado
+        (en cualquier worker).
+        """
+        _, mas_antiguo = self._pendientes()
+        if mas_antiguo is None:
+            return 0.0
+        return round((datetime.now() - mas_antiguo).total_seconds(), 3)
+
+    def estado(self) -> dict:
+        pendientes, _ = self._pendientes()
+        return {
+            "intereses_pendientes": pendientes,
+            "intereses_en_proceso": self._en_proceso,
+            "lag_segundos": self.lag_segundos(),
+            "simulaciones_recalculadas_total": self.total_recalculadas,
+            "ultimo_lote": self.ultimo_lote,
+            "ultima_ejecucion": self.ultima_ejecucion,
+            "ultimo_error": self.ultimo_error,
+        }
+
+    # -----------------------------
+    # Trabajo en segundo plano
+    # -----------------------------
+    def _bucle(self) -> None:
+        while True:
+            self._despertar.wait(timeout=self.intervalo_segundos)
+            self._despertar.clear()
+            # Pequeña espera para juntar cambios que llegan en ráfaga
+            time.sleep(self.intervalo_segundos / 10)
+            try:
+                self.procesar_pendientes()
+            except Exception as exc:  # el hilo no debe morir por un error puntual
+                self.ultimo_error = f"{type(exc).__name__}: {exc}"
+
+    def procesar_pendientes(self) -> int:
+        """
+        Recalcula las simulaciones de todos los intereses pendientes.
+        Devuelve cuántas simulaciones se actualizaron.
+
+        Los pendientes se borran con DELETE … RETURNING en la misma
+        transacción que el recálculo: si algo falla, el rollback los deja
+        en la cola; si otro worker los tomó antes, aquí no aparecen.
+        """
+        with Session(engine) as session:
+            if session.exec(select(RecalculoPendiente.interes_id).limit(1)).first() is None:
+                return 0
+            interes_ids = sorted(
+                session.execute(
+                    delete(RecalculoPendiente).returning(RecalculoPendiente.interes_id)
+                ).scalars().all()
+            )
+            if not interes_ids:
+                return 0
+
+            self._en_proceso = len(interes_ids)
+            try:
+                actualizadas = 0
+                for i in range(0, len(interes_ids), self.tamano_lote):
+                    actualizadas += self._recalcular_lote(session, interes_ids[i:i + self.tamano_lote])
+
+                auditar(
+                    session,
+                    "Simulación",
+                    "RECALCULAR",
+                    (
+                        f"{actualizadas} simulaciones recalculadas por cambio de tasa "
+                        f"en {len(interes_ids)} intereses "
+                        f"(ids: {', '.join(map(str, interes_ids[:50]))}"
+                        f"{', ...' if len(interes_ids) > 50 else ''})"
+                    ),
+                    afectados={"Interés": interes_ids},
+                )
+                session.commit()
+            finally:
+                self._en_proceso = 0
+
+        self.total_recalculadas += actualizadas
+        self.ultimo_lote = actualizadas
+        self.ultima_ejecucion = datetime.now()
+        self.ultimo_error = None
+        metricas.incrementar("recalculo_simulaciones", actualizadas)
+        return actualizadas
+
+    def _recalcular_lote(self, session: Session, interes_ids: List[int]) -> int:
+        filas = session.exec(
+            select(Simulacion.idSimulacion, Credito.monto, Credito.plazo, Interes.tasa)
+            .join(Interes, Interes.idInteres == Simulacion.interes_id)
+            .join(Credito, Credito.idCredito == Interes.credito_id)
+            .where(Simulacion.interes_id.in_(interes_ids))
+        ).all()
+        if not filas:
+            return 0
+
+        ids, montos, plazos, tasas = zip(*filas)
+        # Muchas simulaciones comparten condiciones: se calcula una vez cada combinación
+        cuotas, intereses, saldos = memo_amortizacion.calcular_lote(montos, plazos, tasas)
+
+        session.execute(
+            update(Simulacion),
+            [
+                {
+                    "idSimulacion": sim_id,
+                    "cuotaMensual": float(cuota),
+                    "interesTotal": float(interes),
+                    "saldoFinal": float(saldo),
+                }
+                for sim_id, cuota, interes, saldo in zip(ids, cuotas, intereses, saldos)
+            ],
+        )
+        incrementar_versiones(session, Simulacion, list(ids))
+        return len(ids)
+
+
+# Instancia única del proceso
+recalculo = RecalculoSimulaciones()
+
+
+@event.listens_for(Session, "after_commit")
+def _despertar_recalculo(session) -> None:
+    if session.info.pop("recalculo_despertar", False):
+        recalculo.despertar()
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_despertar(session) -> None:
+    session.info.pop("recalculo_despertar", None)
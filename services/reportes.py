@@ -0,0 +1,246 @@
+# services/reportes.py
+
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session, select
+
+from database import engine
+from models.credito import Credito
+from models.interes import Interes
+from models.reporte import Reporte
+from models.simulacion import Simulacion
+from models.usuario import Usuario
+from services.documentos import FORMATOS, renderizar
+from services.metricas import metricas
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DOCUMENTOS_DIR = os.path.join(BASE_DIR, "documentos")
+
+# Cambiar si cambia el diseño de los documentos, para invalidar la caché
+VERSION_PLANTILLA = "1"
+
+# Una versión reemplazada se borra cuando lleva este tiempo sin usarse, no
+# enseguida: puede haber una descarga (FileResponse) de ese archivo en curso.
+# También es cada cuánto se barre la carpeta.
+GRACIA_BORRADO_SEGUNDOS = 600
+
+
+def _como_dict(registro, campos) -> Optional[Dict[str, Any]]:
+    if registro is None:
+        return None
+    return {campo: getattr(registro, campo) for campo in campos}
+
+
+def datos_reporte(session: Session, reporte_id: int) -> Dict[str, Any]:
+    """
+    Reúne en un dict serializable todo lo que va en el documento:
+    reporte, usuario, crédito, interés y simulación.
+    El interés es el de la simulación; sin simulación se usa el
+    último interés del crédito.
+    """
+    reporte = session.get(Reporte, reporte_id)
+    if not reporte:
+        raise HTTPException(status_code=404, detail="Reporte no encontrado")
+
+    simulacion = session.get(Simulacion, reporte.simulacion_id) if reporte.simulacion_id else None
+    interes = session.get(Interes, simulacion.interes_id) if simulacion else None
+
+    credito_id = reporte.credito_id or (interes.credito_id if interes else None)
+    credito = session.get(Credito, credito_id) if credito_id else None
+    if interes is None and credito is not None:
+        interes = session.exec(
+            select(Interes)
+            .where(Interes.credito_id == credito.idCredito)
+            .order_by(Interes.idInteres.desc())
+        ).first()
+
+    usuario_id = reporte.usuario_id or (credito.usuario_id if credito else None)
+    usuario = session.get(Usuario, usuario_id) if usuario_id else None
+
+    return {
+        "reporte": {
+            "idReporte": reporte.idReporte,
+            "titulo": reporte.titulo,
+            "descripcion": reporte.descripcion,
+            "fecha": reporte.fecha.isoformat(sep=" ", timespec="seconds") if reporte.fecha else None,
+        },
+        "usuario": _como_dict(usuario, ["idUsuario", "nombre", "correo", "telefono", "ingresos", "gastos"]),
+        "credito": _como_dict(credito, ["idCredito", "tipo", "monto", "plazo", "descripcion"]),
+        "interes": _como_dict(interes, ["idInteres", "tipo", "tasa"]),
+        "simulacion": _como_dict(
+            simulacion, ["idSimulacion", "cuotaMensual", "interesTotal", "saldoFinal"]
+        ),
+    }
+
+
+def huella_documento(datos: Dict[str, Any], formato: str) -> str:
+    """
+    Hash del contenido de entrada: si no cambian el crédito, el interés,
+    la simulación (ni el resto de datos mostrados), el documento es el mismo.
+    """
+    canonico = json.dumps(
+        {"version": VERSION_PLANTILLA, "formato": formato, "datos": datos},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(canonico.encode()).hexdigest()
+
+
+class GeneradorDocumentos:
+    """
+    Genera los documentos en un pool de procesos (el render de PDF/XLSX
+    y la tabla de amortización son CPU puro) y guarda el resultado en
+    disco con el id del reporte y el hash de los datos como nombre.
+    Peticiones simultáneas por el mismo documento comparten el mismo render.
+
+    Cada uso de un archivo actualiza su mtime; `barrer` borra los que no
+    son la versión vigente de su reporte y llevan GRACIA_BORRADO_SEGUNDOS
+    sin usarse.
+    """
+
+    def __init__(self, procesos: int = 2, directorio: str = DOCUMENTOS_DIR) -> None:
+        self.procesos = procesos
+        self.directorio = directorio
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._en_curso: Dict[str, asyncio.Future] = {}
+        self._barrido_en: Optional[float] = None
+
+    def _obtener_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # "spawn": el proceso hijo no hereda los hilos ni las conexiones del servidor
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.procesos, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    @staticmethod
+    def nombre(reporte_id: int, huella: str, formato: str) -> str:
+        return f"{reporte_id}-{huella}.{formato}"
+
+    def ruta(self, reporte_id: int, huella: str, formato: str) -> str:
+        return os.path.join(self.directorio, self.nombre(reporte_id, huella, formato))
+
+    @staticmethod
+    def _usar(ruta: str) -> bool:
+        # Marca el archivo como usado ahora; False si no existe (o se acaba de borrar)
+        try:
+            os.utime(ruta)
+            return True
+        except FileNotFoundError:
+            return False
+
+    async def obtener(self, datos: Dict[str, Any], formato: str) -> Tuple[str, str]:
+        """
+        Devuelve (ruta del archivo, huella). Solo renderiza si no existe
+        un documento con la misma huella.
+        """
+        if formato not in FORMATOS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Formato no soportado. Use: {', '.join(FORMATOS)}",
+            )
+        huella = huella_documento(datos, formato)
+        ruta = self.ruta(datos["reporte"]["idReporte"], huella, formato)
+
+        if self._usar(ruta):
+            metricas.incrementar("documentos_cache", resultado="acierto", formato=formato)
+        elif huella in self._en_curso:
+            metricas.incrementar("documentos_cache", resultado="coalescido", formato=formato)
+            await asyncio.shield(self._en_curso[huella])
+        else:
+            metricas.incrementar("documentos_cache", resultado="fallo", formato=formato)
+            futuro = asyncio.get_running_loop().create_future()
+            self._en_curso[huella] = futuro
+            try:
+                contenido = await asyncio.get_running_loop().run_in_executor(
+                    self._obtener_pool(), renderizar, formato, datos
+                )
+                os.makedirs(self.directorio, exist_ok=True)
+                temporal = ruta + ".tmp"
+                with open(temporal, "wb") as archivo:
+                    archivo.write(contenido)
+                os.replace(temporal, ruta)
+                futuro.set_result(None)
+            except BaseException as exc:
+                if isinstance(exc, BrokenProcessPool):
+                    # Un proceso murió: el próximo pedido crea un pool nuevo
+                    self._pool = None
+                futuro.set_exception(exc)
+                futuro.exception()  # marcar como consultada si nadie más espera
+                raise
+            finally:
+                del self._en_curso[huella]
+
+        if self._barrido_en is None or time.monotonic() - self._barrido_en >= GRACIA_BORRADO_SEGUNDOS:
+            self._barrido_en = time.monotonic()
+            await run_in_threadpool(self.barrer)
+        return ruta, huella
+
+    def barrer(self) -> int:
+        """
+        Borra de la carpeta los documentos que no son la versión vigente de
+        su reporte (o cuyo reporte ya no existe) y que llevan más de
+        GRACIA_BORRADO_SEGUNDOS sin usarse. Lo vigente se calcula desde la
+        BD, así que funciona tras un reinicio y con varios workers.
+        Devuelve cuántos archivos se borraron.
+        """
+        self._barrido_en = time.monotonic()
+        limite = time.time() - GRACIA_BORRADO_SEGUNDOS
+        try:
+            nombres = os.listdir(self.directorio)
+        except FileNotFoundError:
+            return 0
+
+        viejos = []
+        for nombre in nombres:
+            try:
+                if os.path.getmtime(os.path.join(self.directorio, nombre)) < limite:
+                    viejos.append(nombre)
+            except OSError:
+                pass
+        if not viejos:
+            return 0
+
+        prefijos = {nombre.split("-", 1)[0] for nombre in viejos}
+        vigentes = set()
+        with Session(engine) as session:
+            for reporte_id in sorted(int(p) for p in prefijos if p.isdigit()):
+                try:
+                    datos = datos_reporte(session, reporte_id)
+                except HTTPException:  # reporte eliminado
+                    continue
+                vigentes.update(
+                    self.nombre(reporte_id, huella_documento(datos, formato), formato)
+                    for formato in FORMATOS
+                )
+
+        borrados = 0
+        for nombre in viejos:
+            if nombre in vigentes:
+                continue
+            try:
+                os.remove(os.path.join(self.directorio, nombre))
+                borrados += 1
+            except OSError:
+                pass
+        metricas.incrementar("documentos_borrados", borrados)
+        return borrados
+
+    def cerrar(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# Instancia única del proceso
+generador_documentos = GeneradorDocumentos()
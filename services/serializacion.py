@@ -0,0 +1,199 @@
+# services/serializacion.py
+
+import json
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Type
+
+from fastapi import HTTPException, Query
+from fastapi.responses import Response
+from sqlmodel import Session, SQLModel, select
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa json estándar
+    orjson = None
+
+
+# -----------------------------
+# Codificación JSON
+# -----------------------------
+def _valor_por_defecto(valor: Any) -> Any:
+    """
+    Convierte los tipos que json estándar no sabe serializar
+    (fechas) al mismo formato ISO que usa FastAPI.
+    """
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable a JSON: {type(valor).__name__}")
+
+
+def a_json(contenido: Any) -> bytes:
+    """
+    Serializa `contenido` a bytes JSON, usando orjson si está instalado.
+    """
+    if orjson is not None:
+        return orjson.dumps(contenido, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        contenido,
+        default=_valor_por_defecto,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class RespuestaJSONRapida(Response):
+    """
+    Respuesta JSON respaldada por orjson (con respaldo a json estándar).
+    Se usa como clase de respuesta por defecto de la app.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return a_json(content)
+
+
+# -----------------------------
+# Modo ligero (filas como tuplas)
+# -----------------------------
+def columnas_de(modelo: Type[SQLModel]) -> List[Any]:
+    """
+    Devuelve los atributos de columna de un modelo tabla, en el orden de la tabla.
+    """
+    return [getattr(modelo, columna.name) for columna in modelo.__table__.columns]
+
+
+def clave_primaria(modelo: Type[SQLModel]) -> Any:
+    """
+    Devuelve el atributo de la clave primaria de un modelo tabla (ej: Credito.idCredito).
+    """
+    columna = list(modelo.__table__.primary_key.columns)[0]
+    return getattr(modelo, columna.name)
+
+
+def respuesta_ligera(
+    session: Session,
+    query: Any,
+    modelo: Type[SQLModel],
+    columnas: Optional[Sequence[Any]] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> RespuestaJSONRapida:
+    """
+    Ejecuta `query` seleccionando solo columnas (sin instanciar el modelo
+    ni validar cada fila con `response_model`) y serializa las tuplas
+    directamente con orjson.
+
+    Conserva los filtros, el orden y la paginación ya aplicados a `query`.
+    """
+    columnas = list(columnas) if columnas else columnas_de(modelo)
+    nombres = [columna.key for columna in columnas]
+    filas = session.execute(query.with_only_columns(*columnas)).all()
+    return RespuestaJSONRapida([dict(zip(nombres, fila)) for fila in filas], headers=headers)
+
+
+# -----------------------------
+# Proyección de campos (?fields=)
+# -----------------------------
+def campos_de(modelo: Type[SQLModel]) -> Callable[..., Optional[List[Any]]]:
+    """
+    Crea una dependencia que lee `?fields=a,b,c`, valida los nombres contra
+    las columnas de `modelo` y devuelve los atributos de columna a proyectar
+    (o None si no se pidió proyección).
+
+    Los campos desconocidos se rechazan con 400 antes de tocar la base de datos.
+    """
+    disponibles = [columna.name for columna in modelo.__table__.columns]
+
+    def dependencia(
+        fields: Optional[str] = Query(
+            None,
+            description=f"Campos a devolver separados por coma ({', '.join(disponibles)})",
+        ),
+    ) -> Optional[List[Any]]:
+        if not fields:
+            return None
+
+        nombres = list(dict.fromkeys(n.strip() for n in fields.split(",") if n.strip()))
+        desconocidos = [n for n in nombres if n not in disponibles]
+        if desconocidos or not nombres:
+            raise HTTPException(
+                status_code=400,
+                detail=(
+                    f"Campos desconocidos: {', '.join(desconocidos) or '(vacío)'}. "
+                    f"Campos disponibles: {', '.join(disponibles)}"
+                ),
+            )
+        return [getattr(modelo, n) for n in nombres]
+
+    return dependencia
+
+
+def respuesta_registro(
+    session: Session,
+    modelo: Type[SQLModel],
+    registro_id: int,
+    columnas: Sequence[Any],
+    detalle_no_encontrado: str,
+    headers: Optional[Dict[str, str]] = None,
+) -> RespuestaJSONRapida:
+    """
+    Obtiene un solo registro por id seleccionando solo `columnas`.
+    Lanza 404 con `detalle_no_encontrado` si no existe.
+    """
+    nombres = [columna.key for columna in columnas]
+    fila = session.execute(
+        select(*columnas).where(clave_primaria(modelo) == registro_id)
+    ).first()
+    if fila is None:
+        raise HTTPException(status_code=404, detail=detalle_no_encontrado)
+    return RespuestaJSONRapida(dict(zip(nombres, fila)), headers=headers)
+
+
+# -----------------------------
+# Obtención por lote de ids (POST /.../batch-get)
+# -----------------------------
+RUTA_LOTE = "/batch-get"
+
+# Ids máximos por petición y por consulta IN (SQLite admite pocos parámetros)
+LOTE_MAX_IDS = 5000
+LOTE_FRAGMENTO = 500
+
+
+def respuesta_lote(
+    session: Session,
+    modelo: Type[SQLModel],
+    ids: Sequence[int],
+    columnas: Optional[Sequence[Any]] = None,
+) -> RespuestaJSONRapida:
+    """
+    Obtiene varios registros por id con `WHERE id IN (...)`, en fragmentos
+    de LOTE_FRAGMENTO ids, y devuelve
+    `{"encontrados": {id: registro}, "faltantes": [ids sin registro]}`.
+    Los ids repetidos se consultan una sola vez.
+    """
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise HTTPException(status_code=400, detail="Debe enviar al menos un id")
+    if len(ids) > LOTE_MAX_IDS:
+        raise HTTPException(
+            status_code=400, detail=f"Se admiten como máximo {LOTE_MAX_IDS} ids por petición"
+        )
+
+    pk = clave_primaria(modelo)
+    columnas = list(columnas) if columnas else columnas_de(modelo)
+    nombres = [columna.key for columna in columnas]
+
+    encontrados: Dict[int, Dict[str, Any]] = {}
+    for inicio in range(0, len(ids), LOTE_FRAGMENTO):
+        parte = ids[inicio:inicio + LOTE_FRAGMENTO]
+        # La clave primaria va primero aunque no esté entre los campos pedidos
+        filas = session.execute(select(pk, *columnas).where(pk.in_(parte))).all()
+        for fila in filas:
+            encontrados[fila[0]] = dict(zip(nombres, fila[1:]))
+
+    return RespuestaJSONRapida(
+        {
+            "encontrados": {i: encontrados[i] for i in ids if i in encontrados},
+            "faltantes": [i for i in ids if i not in encontrados],
+        }
+    )
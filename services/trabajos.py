@@ -0,0 +1,364 @@
+# services/trabajos.py
+
+import csv
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import func, or_, update
+from sqlmodel import Session, select
+
+from database import engine
+from models.credito import Credito
+from models.historial import Historial
+from models.trabajo import Trabajo
+from services.metricas import metricas
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTADOS_DIR = os.path.join(BASE_DIR, "trabajos")
+
+# Una tarea recibe el contexto del trabajo y sus parámetros y devuelve
+# (ruta del archivo de resultado, media type) o None si no genera archivo.
+Tarea = Callable[["ContextoTrabajo", Dict[str, Any]], Optional[Tuple[str, str]]]
+TAREAS: Dict[str, Tarea] = {}
+
+
+def tarea(tipo: str):
+    """
+    Decorador para registrar una tarea que los workers pueden ejecutar.
+    """
+    def registrar(funcion: Tarea) -> Tarea:
+        TAREAS[tipo] = funcion
+        return funcion
+    return registrar
+
+
+class ArriendoPerdido(Exception):
+    """
+    El arriendo del trabajo venció y otro worker lo retomó: este intento
+    debe abandonarse sin escribir nada más.
+    """
+
+
+# -----------------------------
+# Contexto que recibe cada tarea
+# -----------------------------
+class ContextoTrabajo:
+    """
+    Permite a una tarea reportar su avance y saber dónde dejar el resultado.
+    Cada reporte de avance también renueva el arriendo del trabajo, solo si
+    sigue siendo de este intento (`intentos` no cambió).
+    """
+
+    def __init__(self, gestor: "GestorTrabajos", trabajo_id: int, intento: int) -> None:
+        self.gestor = gestor
+        self.trabajo_id = trabajo_id
+        self.intento = intento
+        self._ultimo_reporte = 0.0
+
+    def progreso(self, fraccion: float, mensaje: Optional[str] = None) -> None:
+        # Se limita la frecuencia de escrituras para no competir con la API
+        ahora = time.monotonic()
+        if fraccion < 1.0 and ahora - self._ultimo_reporte < 0.5:
+            return
+        self._ultimo_reporte = ahora
+        valores: Dict[str, Any] = {
+            "progreso": round(min(max(fraccion, 0.0), 1.0), 4),
+            "bloqueado_hasta": datetime.now() + timedelta(seconds=self.gestor.arriendo_segundos),
+            "actualizado": datetime.now(),
+        }
+        if mensaje is not None:
+            valores["mensaje"] = mensaje
+        with engine.begin() as conn:
+            renovado = conn.execute(
+                update(Trabajo)
+                .where(Trabajo.idTrabajo == self.trabajo_id, Trabajo.intentos == self.intento)
+                .values(**valores)
+            ).rowcount
+        if not renovado:
+            raise ArriendoPerdido(f"El trabajo {self.trabajo_id} fue retomado por otro worker")
+
+    def ruta_resultado(self, extension: str) -> str:
+        # Un archivo por intento: un worker atrasado no pisa el del que lo retomó
+        os.makedirs(RESULTADOS_DIR, exist_ok=True)
+        return os.path.join(RESULTADOS_DIR, f"trabajo_{self.trabajo_id}_{self.intento}.{extension}")
+
+
+# -----------------------------
+# Cola y workers
+# -----------------------------
+class GestorTrabajos:
+    """
+    Cola de trabajos persistida en la misma base de datos (sin broker externo).
+
+    - Los routers encolan filas en la tabla `trabajo` y responden de inmediato.
+    - Hilos worker toman el siguiente trabajo disponible (mayor prioridad
+      primero) con un UPDATE condicionado al estado, así dos workers (o dos
+      procesos) nunca toman el mismo.
+    - Si una tarea falla se reintenta con backoff exponencial hasta
+      max_intentos; luego queda FALLIDO.
+    - Un trabajo EN_PROCESO cuyo arriendo vence (el worker murió) vuelve
+      a estar disponible. Cada toma sube `intentos`, que identifica al
+      dueño: el avance y el cierre solo se escriben si no cambió.
+    """
+
+    def __init__(
+        self,
+        hilos: int = 2,
+        intervalo_segundos: float = 1.0,
+        arriendo_segundos: float = 60.0,
+        backoff_base_segundos: float = 5.0,
+    ) -> None:
+        self.hilos = hilos
+        self.intervalo_segundos = intervalo_segundos
+        self.arriendo_segundos = arriendo_segundos
+        self.backoff_base_segundos = backoff_base_segundos
+        self._despertar = threading.Event()
+        self._workers: list = []
+        self._identidad = ""
+        self.ultimo_error: Optional[str] = None
+
+        metricas.registrar_calculado("trabajos_pendientes", self._contar_pendientes)
+
+    # -----------------------------
+    # API para los routers
+    # -----------------------------
+    def encolar(
+        self,
+        session: Session,
+        tipo: str,
+        parametros: Optional[Dict[str, Any]] = None,
+        prioridad: int = 0,
+        max_intentos: int = 3,
+    ) -> Trabajo:
+        """
+        Crea el trabajo en estado PENDIENTE y despierta a los workers.
+        Hace commit.
+        """
+        if tipo not in TAREAS:
+            raise ValueError(f"Tipo de trabajo desconocido: {tipo}")
+        trabajo = Trabajo(
+            tipo=tipo,
+            parametros=parametros or {},
+            prioridad=prioridad,
+            max_intentos=max_intentos,
+        )
+        session.add(trabajo)
+        session.commit()
+        session.refresh(trabajo)
+        metricas.incrementar("trabajos_encolados", tipo=tipo)
+        self._despertar.set()
+        return trabajo
+
+    def iniciar(self) -> None:
+        # El pid se toma al iniciar (después del fork de los workers del servidor)
+        self._identidad = f"{socket.gethostname()}:{os.getpid()}"
+        self._workers = [w for w in self._workers if w.is_alive()]
+        for i in range(len(self._workers), self.hilos):
+            worker = threading.Thread(target=self._bucle, name=f"trabajos-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    # -----------------------------
+    # Trabajo en segundo plano
+    # -----------------------------
+    def _bucle(self) -> None:
+        while True:
+            try:
+                tomado = self.tomar_siguiente()
+            except Exception:
+                tomado = None
+            if tomado is None:
+                self._despertar.wait(timeout=self.intervalo_segundos)
+                self._despertar.clear()
+                continue
+            try:
+                self.ejecutar(*tomado)
+            except Exception as exc:  # el hilo no debe morir por un error puntual
+                # (ej: "database is locked" al cerrar); el arriendo vence y
+                # otro worker lo retoma
+                self.ultimo_error = f"{type(exc).__name__}: {exc}"
+
+    def tomar_siguiente(self) -> Optional[Tuple[int, int]]:
+        """
+        Reclama el siguiente trabajo disponible y devuelve (id, intento),
+        o None si no hay ninguno.
+        """
+        ahora = datetime.now()
+        disponible = or_(
+            (Trabajo.estado == "PENDIENTE") & (Trabajo.disponible_en <= ahora),
+            (Trabajo.estado == "EN_PROCESO") & (Trabajo.bloqueado_hasta < ahora),
+        )
+        with Session(engine) as session:
+            candidatos = session.exec(
+                select(Trabajo.idTrabajo)
+                .where(disponible)
+                .order_by(Trabajo.prioridad.desc(), Trabajo.idTrabajo)
+                .limit(5)
+            ).all()
+
+        for trabajo_id in candidatos:
+            # El UPDATE repite la condición: si otro worker lo tomó primero,
+            # la fila ya no cumple y no devuelve nada
+            with engine.begin() as conn:
+                intento = conn.execute(
+                    update(Trabajo)
+                    .where(Trabajo.idTrabajo == trabajo_id, disponible)
+                    .values(
+                        estado="EN_PROCESO",
+                        intentos=Trabajo.intentos + 1,
+                        bloqueado_hasta=ahora + timedelta(seconds=self.arriendo_segundos),
+                        mensaje=f"Procesando en {self._identidad}",
+                        actualizado=ahora,
+                    )
+                    .returning(Trabajo.intentos)
+                ).scalar()
+            if intento is not None:
+                return trabajo_id, intento
+        return None
+
+    def ejecutar(self, trabajo_id: int, intento: int) -> None:
+        with Session(engine) as session:
+            trabajo = session.get(Trabajo, trabajo_id)
+            if trabajo is None:
+                # Se eliminó entre que se tomó y se leyó: no hay nada que hacer
+                return
+            tipo, parametros = trabajo.tipo, dict(trabajo.parametros or {})
+            intentos, max_intentos = intento, trabajo.max_intentos
+
+        inicio = time.monotonic()
+        try:
+            resultado = TAREAS[tipo](ContextoTrabajo(self, trabajo_id, intento), parametros)
+        except ArriendoPerdido:
+            return
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+            if intentos < max_intentos:
+                espera = self.backoff_base_segundos * 2 ** (intentos - 1)
+                valores = {
+                    "estado": "PENDIENTE",
+                    "disponible_en": datetime.now() + timedelta(seconds=espera),
+                    "mensaje": f"Intento {intentos} falló ({error}); reintento en {espera:.0f} s",
+                }
+            else:
+                valores = {"estado": "FALLIDO", "mensaje": error}
+            if self._cerrar(trabajo_id, intento, valores):
+                if valores["estado"] == "PENDIENTE":
+                    metricas.incrementar("trabajos_reintentos", tipo=tipo)
+                else:
+                    metricas.incrementar("trabajos_terminados", tipo=tipo, estado="FALLIDO")
+            return
+
+        ruta, media_type = resultado if resultado else (None, None)
+        cerrado = self._cerrar(trabajo_id, intento, {
+            "estado": "COMPLETADO",
+            "progreso": 1.0,
+            "mensaje": f"Completado en {time.monotonic() - inicio:.2f} s",
+            "resultado": ruta,
+            "resultado_media_type": media_type,
+        })
+        if cerrado:
+            metricas.incrementar("trabajos_terminados", tipo=tipo, estado="COMPLETADO")
+        elif ruta and os.path.exists(ruta):
+            # Otro worker retomó el trabajo: este resultado no se usa
+            os.remove(ruta)
+
+    @staticmethod
+    def _cerrar(trabajo_id: int, intento: int, valores: Dict[str, Any]) -> bool:
+        """
+        Deja el estado final solo si el trabajo sigue siendo de este intento.
+        """
+        with engine.begin() as conn:
+            return bool(conn.execute(
+                update(Trabajo)
+                .where(Trabajo.idTrabajo == trabajo_id, Trabajo.intentos == intento)
+                .values(bloqueado_hasta=None, actualizado=datetime.now(), **valores)
+            ).rowcount)
+
+    @staticmethod
+    def _contar_pendientes() -> int:
+        try:
+            with Session(engine) as session:
+                return session.exec(
+                    select(func.count()).select_from(Trabajo).where(Trabajo.estado == "PENDIENTE")
+                ).one()
+        except Exception:
+            return 0
+
+
+# -----------------------------
+# Tareas incluidas
+# -----------------------------
+def _exportar_csv(ctx: ContextoTrabajo, consulta, total: int, encabezados, fila) -> Tuple[str, str]:
+    """
+    Escribe el resultado de la consulta a CSV por bloques, reportando avance.
+    """
+    ruta = ctx.ruta_resultado("csv")
+    temporal = ruta + ".tmp"
+    with Session(engine) as session, open(temporal, "w", newline="", encoding="utf-8") as archivo:
+        escritor = csv.writer(archivo)
+        escritor.writerow(encabezados)
+        for i, registro in enumerate(session.exec(consulta.execution_options(yield_per=2000)), 1):
+            escritor.writerow(fila(registro))
+            if i % 2000 == 0:
+                ctx.progreso(i / max(total, 1), f"{i} de {total} filas")
+    # El archivo solo aparece completo: un reintento no deja resultados a medias
+    os.replace(temporal, ruta)
+    return ruta, "text/csv"
+
+
+@tarea("exportar_historial")
+def exportar_historial(ctx: ContextoTrabajo, parametros: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Parámetros opcionales: entidad, accion, fecha_desde, fecha_hasta (ISO).
+    """
+    consulta = select(Historial)
+    if parametros.get("entidad"):
+        consulta = consulta.where(Historial.entidad == parametros["entidad"])
+    if parametros.get("accion"):
+        consulta = consulta.where(Historial.accion == parametros["accion"])
+    if parametros.get("fecha_desde"):
+        consulta = consulta.where(Historial.fecha >= datetime.fromisoformat(parametros["fecha_desde"]))
+    if parametros.get("fecha_hasta"):
+        consulta = consulta.where(Historial.fecha <= datetime.fromisoformat(parametros["fecha_hasta"]))
+
+    with Session(engine) as session:
+        total = session.exec(select(func.count()).select_from(consulta.subquery())).one()
+
+    return _exportar_csv(
+        ctx,
+        consulta.order_by(Historial.idHistorial),
+        total,
+        ["idHistorial", "entidad", "accion", "descripcion", "fecha"],
+        lambda h: [h.idHistorial, h.entidad, h.accion, h.descripcion, h.fecha.isoformat()],
+    )
+
+
+@tarea("exportar_creditos")
+def exportar_creditos(ctx: ContextoTrabajo, parametros: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Parámetros opcionales: usuario_id, tipo.
+    """
+    consulta = select(Credito)
+    if parametros.get("usuario_id") is not None:
+        consulta = consulta.where(Credito.usuario_id == int(parametros["usuario_id"]))
+    if parametros.get("tipo"):
+        consulta = consulta.where(Credito.tipo == parametros["tipo"])
+
+    with Session(engine) as session:
+        total = session.exec(select(func.count()).select_from(consulta.subquery())).one()
+
+    return _exportar_csv(
+        ctx,
+        consulta.order_by(Credito.idCredito),
+        total,
+        ["idCredito", "monto", "plazo", "tipo", "descripcion", "usuario_id"],
+        lambda c: [c.idCredito, c.monto, c.plazo, c.tipo, c.descripcion, c.usuario_id],
+    )
+
+
+# Instancia única del proceso
+gestor_trabajos = GestorTrabajos()
@@ -0,0 +1,247 @@
+# services/versiones.py
+
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+from sqlalchemy import event, func, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import Session, SQLModel, select
+
+from models.cambios_tabla import CambiosTabla
+from models.categoria import Categoria
+from models.credito import Credito
+from models.interes import Interes
+from models.reporte import Reporte
+from models.simulacion import Simulacion
+from models.usuario import Usuario
+from services.serializacion import clave_primaria
+
+# Modelos con columna `version`
+MODELOS_VERSIONADOS: Tuple[Type[SQLModel], ...] = (
+    Usuario,
+    Credito,
+    Interes,
+    Simulacion,
+    Reporte,
+    Categoria,
+)
+
+
+class ConflictoVersion(Exception):
+    """
+    Otra escritura cambió el registro después de validar If-Match. main.py
+    la responde como 412; fuera de una petición es un error más.
+    """
+
+
+# -----------------------------
+# Contador de cambios por tabla
+# -----------------------------
+def _contar_cambios(conexion, tablas) -> None:
+    for tabla in sorted(tablas):
+        sentencia = insert(CambiosTabla).values(tabla=tabla, cambios=1)
+        conexion.execute(
+            sentencia.on_conflict_do_update(
+                index_elements=["tabla"], set_={"cambios": CambiosTabla.cambios + 1}
+            )
+        )
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _contar_cambios_masivos(estado) -> None:
+    # UPDATE / DELETE / INSERT masivos no pasan por el flush
+    if not (estado.is_update or estado.is_delete or estado.is_insert):
+        return
+    mapper = estado.bind_mapper
+    if mapper is not None and mapper.class_ in MODELOS_VERSIONADOS:
+        _contar_cambios(estado.session.connection(), {mapper.class_.__tablename__})
+
+
+# -----------------------------
+# Incremento automático de versión
+# -----------------------------
+@event.listens_for(Session, "before_flush")
+def _incrementar_versiones(session, contexto, instancias) -> None:
+    """
+    Antes de cada flush:
+    - los registros nuevos empiezan en versión 1 (se ignora lo que envíe el cliente);
+    - los modificados suben su versión con `version = version + 1` en SQL,
+      así dos escrituras concurrentes nunca dejan la misma versión;
+    - si el endpoint registró una versión esperada (If-Match), el incremento
+      se hace con UPDATE ... WHERE version = esperada y, si otra escritura
+      ganó, se lanza ConflictoVersion.
+    """
+    esperadas: Dict[Tuple[type, Any], int] = session.info.get("versiones_esperadas", {})
+    tablas = set()
+
+    for obj in session.new:
+        if isinstance(obj, MODELOS_VERSIONADOS):
+            obj.version = 1
+            tablas.add(type(obj).__tablename__)
+
+    for obj in session.deleted:
+        if isinstance(obj, MODELOS_VERSIONADOS):
+            tablas.add(type(obj).__tablename__)
+
+    for obj in session.dirty:
+        if not isinstance(obj, MODELOS_VERSIONADOS):
+            continue
+        if not session.is_modified(obj, include_collections=False):
+            continue
+        modelo = type(obj)
+        tabla = modelo.__table__
+        tablas.add(modelo.__tablename__)
+        registro_id = getattr(obj, clave_primaria(modelo).key)
+        esperada = esperadas.pop((modelo, registro_id), None)
+
+        if esperada is None:
+            obj.version = modelo.version + 1
+            continue
+
+        actualizadas = session.connection().execute(
+            update(tabla)
+            .where(list(tabla.primary_key.columns)[0] == registro_id, tabla.c.version == esperada)
+            .values(version=esperada + 1)
+        ).rowcount
+        if not actualizadas:
+            raise ConflictoVersion("El recurso fue modificado por otra petición (If-Match no coincide)")
+        set_committed_value(obj, "version", esperada + 1)
+
+    if tablas:
+        _contar_cambios(session.connection(), tablas)
+
+
+def incrementar_versiones(session: Session, modelo: Type[SQLModel], ids: List[int]) -> None:
+    """
+    Sube la versión de registros modificados con sentencias masivas
+    (que no pasan por el flush del ORM). No hace commit.
+    """
+    pk = clave_primaria(modelo)
+    for i in range(0, len(ids), 5000):
+        session.execute(
+            update(modelo)
+            .where(pk.in_(ids[i:i + 5000]))
+            .values(version=modelo.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+
+# -----------------------------
+# ETags
+# -----------------------------
+def etag_de(registro: SQLModel) -> str:
+    """
+    ETag fuerte de un registro ya cargado: "<id>-<versión>".
+    """
+    registro_id = getattr(registro, clave_primaria(type(registro)).key)
+    return f'"{registro_id}-{registro.version}"'
+
+
+def _sufijo_representacion(request: Request) -> str:
+    # ?fields= y ?ligero= cambian el cuerpo, así que forman parte del ETag
+    parametros = sorted(
+        (k, v) for k, v in request.query_params.multi_items() if k in ("fields", "ligero")
+    )
+    if not parametros:
+        return ""
+    return "-" + hashlib.sha1(repr(parametros).encode()).hexdigest()[:8]
+
+
+def _etags(encabezado: Optional[str]) -> List[str]:
+    if not encabezado:
+        return []
+    return [e.strip().removeprefix("W/") for e in encabezado.split(",") if e.strip()]
+
+
+def etag_registro(
+    session: Session,
+    request: Request,
+    modelo: Type[SQLModel],
+    registro_id: int,
+    detalle_no_encontrado: str,
+) -> str:
+    """
+    ETag fuerte de un registro: "<id>-<versión>[-<campos>]".
+    Solo consulta la columna version; lanza 404 si el registro no existe.
+    """
+    version = session.exec(
+        select(modelo.version).where(clave_primaria(modelo) == registro_id)
+    ).first()
+    if version is None:
+        raise HTTPException(status_code=404, detail=detalle_no_encontrado)
+    return f'"{registro_id}-{version}{_sufijo_representacion(request)}"'
+
+
+def etag_coleccion(
+    session: Session,
+    request: Request,
+    query: Any,
+    modelo: Type[SQLModel],
+) -> str:
+    """
+    ETag de un listado, calculado con un agregado sobre la misma consulta
+    (filtros y paginación incluidos) sin traer las filas: cantidad, suma de
+    versiones y mayor id, más el contador de cambios de la tabla (cambia
+    con cualquier escritura, aunque se borre una fila y SQLite reutilice su
+    id en la siguiente alta) y los parámetros de la URL.
+    """
+    pk = clave_primaria(modelo)
+    subconsulta = query.with_only_columns(pk, modelo.version).subquery()
+    contador = (
+        select(CambiosTabla.cambios)
+        .where(CambiosTabla.tabla == modelo.__tablename__)
+        .scalar_subquery()
+    )
+    cantidad, suma, maximo, cambios = session.execute(
+        select(
+            func.count(),
+            func.coalesce(func.sum(subconsulta.c.version), 0),
+            func.max(subconsulta.c[pk.key]),
+            contador,
+        )
+    ).one()
+    firma = f"{request.url.query}|{cantidad}|{suma}|{maximo}|{cambios}"
+    return f'"{modelo.__tablename__}-{hashlib.sha1(firma.encode()).hexdigest()[:16]}"'
+
+
+def respuesta_no_modificado(request: Request, etag: str) -> Optional[Response]:
+    """
+    Devuelve un 304 si If-None-Match coincide con `etag`, o None.
+    """
+    candidatos = _etags(request.headers.get("if-none-match"))
+    if "*" in candidatos or etag in candidatos:
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+
+# -----------------------------
+# Concurrencia optimista (If-Match)
+# -----------------------------
+def verificar_if_match(session: Session, request: Request, registro: SQLModel) -> None:
+    """
+    Si la petición trae If-Match, exige que la versión del ETag coincida con
+    la actual del registro (412 si no) y la deja registrada para que el
+    incremento de versión del commit sea atómico.
+    """
+    candidatos = _etags(request.headers.get("if-match"))
+    if not candidatos or "*" in candidatos:
+        return
+
+    modelo = type(registro)
+    registro_id = getattr(registro, clave_primaria(modelo).key)
+    versiones = set()
+    for etag in candidatos:
+        partes = etag.strip('"').split("-")
+        if len(partes) >= 2 and partes[0] == str(registro_id) and partes[1].isdigit():
+            versiones.add(int(partes[1]))
+
+    if registro.version not in versiones:
+        raise HTTPException(
+            status_code=412,
+            detail=f"La versión del recurso cambió (versión actual: {registro.version})",
+            headers={"ETag": etag_de(registro)},
+        )
+    session.info.setdefault("versiones_esperadas", {})[(modelo, registro_id)] = registro.version
@@ -0,0 +1,188 @@
+# servidor.py
+"""
+Arranque de producción con varios workers.
+
+- Con gunicorn instalado: master de gunicorn + workers de uvicorn, con la
+  aplicación precargada en el master antes del fork (los workers comparten
+  en copy-on-write el código y las plantillas ya importados) y reciclado
+  de workers cada N peticiones.
+- Sin gunicorn: `uvicorn.run(..., workers=N)` (cada worker importa la app).
+
+En ambos casos se usan uvloop y httptools si están instalados.
+
+Uso (desde la raíz del proyecto):
+    python servidor.py --port 8000
+    python servidor.py --workers 4 --port 8000
+    BANCO_WORKERS=4 BANCO_MAX_PETICIONES=10000 python servidor.py
+
+Cada opción tiene su variable de entorno (ver --help).
+"""
+
+import argparse
+import importlib.util
+import inspect
+import os
+from typing import Any, Dict
+
+
+def _hay(modulo: str) -> bool:
+    try:
+        return importlib.util.find_spec(modulo) is not None
+    except ValueError:
+        return False
+
+
+def _entero(variable: str, defecto: int) -> int:
+    return int(os.getenv(variable, defecto))
+
+
+def workers_por_defecto() -> int:
+    # Núcleos disponibles para este proceso (respeta taskset / cgroups de CPU)
+    try:
+        return max(len(os.sched_getaffinity(0)), 1)
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _argumentos() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--app", default=os.getenv("BANCO_APP", "main:app"))
+    parser.add_argument("--host", default=os.getenv("BANCO_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=_entero("BANCO_PUERTO", 8000))
+    parser.add_argument(
+        "--workers", type=int, default=_entero("BANCO_WORKERS", workers_por_defecto()),
+        help="Procesos worker (BANCO_WORKERS, por defecto uno por núcleo)",
+    )
+    parser.add_argument(
+        "--keep-alive", type=int, default=_entero("BANCO_KEEP_ALIVE", 5),
+        help="Segundos que se mantiene abierta una conexión inactiva (BANCO_KEEP_ALIVE)",
+    )
+    parser.add_argument(
+        "--backlog", type=int, default=_entero("BANCO_BACKLOG", 2048),
+        help="Conexiones pendientes en el socket de escucha (BANCO_BACKLOG)",
+    )
+    parser.add_argument(
+        "--graceful-timeout", type=int, default=_entero("BANCO_APAGADO_GRACIL", 30),
+        help="Segundos para terminar las peticiones en curso al apagar (BANCO_APAGADO_GRACIL)",
+    )
+    parser.add_argument(
+        "--max-requests", type=int, default=_entero("BANCO_MAX_PETICIONES", 0),
+        help="Reciclar cada worker tras N peticiones, 0 = nunca (BANCO_MAX_PETICIONES)",
+    )
+    parser.add_argument(
+        "--max-requests-jitter", type=int, default=_entero("BANCO_MAX_PETICIONES_JITTER", 0),
+        help="Variación aleatoria de --max-requests para no reciclar todos a la vez "
+        "(BANCO_MAX_PETICIONES_JITTER)",
+    )
+    parser.add_argument(
+        "--timeout", type=int, default=_entero("BANCO_TIMEOUT_WORKER", 60),
+        help="Segundos sin respuesta del worker antes de que el master lo reinicie "
+        "(solo gunicorn, BANCO_TIMEOUT_WORKER)",
+    )
+    parser.add_argument(
+        "--sin-gunicorn", action="store_true",
+        help="Usar el supervisor de uvicorn aunque gunicorn esté instalado",
+    )
+    return parser.parse_args()
+
+
+# -----------------------------
+# gunicorn + workers de uvicorn
+# -----------------------------
+def _clase_worker() -> str:
+    # El paquete uvicorn-worker reemplaza a uvicorn.workers (deprecado)
+    if _hay("uvicorn_worker"):
+        return "uvicorn_worker.UvicornWorker"
+    return "uvicorn.workers.UvicornWorker"
+
+
+def _post_fork(servidor, worker) -> None:
+    # Las conexiones abiertas en el master no deben compartirse con los hijos
+    import database
+
+    database.engine.dispose(close=False)
+
+
+def _ejecutar_gunicorn(args: argparse.Namespace) -> None:
+    from gunicorn.app.base import BaseApplication
+
+    class Aplicacion(BaseApplication):
+        def __init__(self, opciones: Dict[str, Any]) -> None:
+            self.opciones = opciones
+            super().__init__()
+
+        def load_config(self) -> None:
+            for clave, valor in self.opciones.items():
+                self.cfg.set(clave, valor)
+
+        def load(self):
+            # Con preload_app corre una sola vez en el master, antes del fork
+            import database
+            from gunicorn.util import import_app
+
+            aplicacion = import_app(args.app)
+            # Crear / migrar el esquema aquí evita que N workers lo hagan a la vez
+            database.create_db_and_tables()
+            database.engine.dispose()
+            return aplicacion
+
+    Aplicacion(
+        {
+            "bind": f"{args.host}:{args.port}",
+            "workers": args.workers,
+            "worker_class": _clase_worker(),
+            "preload_app": True,
+            "backlog": args.backlog,
+            "keepalive": args.keep_alive,
+            "graceful_timeout": args.graceful_timeout,
+            "timeout": args.timeout,
+            "max_requests": args.max_requests,
+            "max_requests_jitter": args.max_requests_jitter,
+            "post_fork": _post_fork,
+        }
+    ).run()
+
+
+# -----------------------------
+# Supervisor de uvicorn
+# -----------------------------
+def _ejecutar_uvicorn(args: argparse.Namespace) -> None:
+    import uvicorn
+
+    import database
+
+    # Sin preload cada worker importa la app por su cuenta: el esquema se
+    # prepara antes en el proceso padre para que no lo creen varios a la vez
+    database.create_db_and_tables()
+    database.engine.dispose()
+
+    opciones: Dict[str, Any] = {
+        "host": args.host,
+        "port": args.port,
+        "workers": args.workers,
+        "loop": "uvloop" if _hay("uvloop") else "asyncio",
+        "http": "httptools" if _hay("httptools") else "h11",
+        "backlog": args.backlog,
+        "timeout_keep_alive": args.keep_alive,
+        "timeout_graceful_shutdown": args.graceful_timeout,
+        "limit_max_requests": args.max_requests or None,
+        "limit_max_requests_jitter": args.max_requests_jitter,
+        "proxy_headers": True,
+    }
+    # Versiones anteriores de uvicorn no tienen todas las opciones
+    soportadas = inspect.signature(uvicorn.run).parameters
+    uvicorn.run(args.app, **{k: v for k, v in opciones.items() if k in soportadas})
+
+
+def main() -> None:
+    args = _argumentos()
+    if _hay("gunicorn") and not args.sin_gunicorn and os.name == "posix":
+        _ejecutar_gunicorn(args)
+    else:
+        _ejecutar_uvicorn(args)
+
+
+if __name__ == "__main__":
+    main()